@@ -68,6 +68,11 @@ CHECK = [
     "mistune>=3.1.0",
 ]
 
+# to run: pkgmt check-links --engine async
+ASYNC = [
+    "httpx[http2]",
+]
+
 setup(
     name="pkgmt",
     version=VERSION,
@@ -86,9 +91,10 @@ setup(
     keywords=[],
     install_requires=REQUIRES,
     extras_require={
-        "dev": DEV + CHECK,
+        "dev": DEV + CHECK + ASYNC,
         "all": ALL,
         "check": CHECK,
+        "async": ASYNC,
     },
     entry_points={
         "console_scripts": ["pkgmt=pkgmt.cli:cli"],
@@ -1,9 +1,11 @@
 from unittest.mock import ANY
 from pathlib import Path
+import io
 import re
 from enum import IntEnum
 from functools import total_ordering
 from copy import deepcopy
+from datetime import datetime
 import click
 
 
@@ -22,10 +24,18 @@ from pkgmt import config
 from pkgmt.versioner import util
 from pkgmt.versioner.versioner import Versioner
 from pkgmt._format import pretty_iterator
-from pkgmt.exceptions import ProjectValidationError
+from pkgmt.exceptions import ProjectValidationError, InvalidConfiguration
 
 _PREFIXES = {"[API Change]", "[Feature]", "[Fix]", "[Doc]"}
 
+# H2 headings that delimit sections (e.g., "## 0.1dev")
+_SUBHEADING = {
+    "type": "heading",
+    "attrs": {"level": 2},
+    "style": "atx",
+    "children": [{"type": "text", "raw": ANY}],
+}
+
 
 class CustomInlineParser(InlineParser):
     """
@@ -56,33 +66,242 @@ class CustomInlineParser(InlineParser):
             return pos
 
 
-def _replace_issue_number_with_links(url, text):
-    # taken from jupytext/tests/test_changelog.py
-    return re.sub(
-        r"([^\[])#([0-9]+)",
-        r"\1[#\2](" + url + r"\2)",
-        text,
+def _require_mistune():
+    if not mistune:
+        raise ModuleNotFoundError(
+            "Checking CHANGELOG.md requires mistune 3. "
+            "Install it with: pip install 'pkgmt[check]'"
+        )
+
+    if mistune.__version__[0] != "3":
+        raise ModuleNotFoundError(
+            "Checking CHANGELOG.md requires mistune 3. "
+            f"You have {mistune.__version__}. Install it with: "
+            "pip install 'pkgmt[check]'"
+        )
+
+
+def _make_parser():
+    return mistune.Markdown(
+        renderer=None, inline=CustomInlineParser(hard_wrap=False), plugins=None
     )
 
 
-def _replace_handles_with_links(text):
-    pattern = r"(?<!\[)@([\w\-_]+)(?!\]\(https:\/\/github\.com\/\w+\))"
-    repl = r"[\g<0>](https://github.com/\g<1>)"
-    return re.sub(pattern, repl, text)
+# issue numbers (#1) and GitHub handles (@user). Code spans and links are
+# matched first so they're left untouched (which also makes expanding
+# idempotent)
+_GITHUB_REFERENCE = re.compile(
+    r"(?P<code>(?P<ticks>`+).+?(?P=ticks))"
+    r"|(?P<link>!?\[[^\]]*\]\([^)]*\))"
+    r"|(?<!\[)#(?P<issue>[0-9]+)"
+    r"|(?<!\[)@(?P<handle>[\w\-]+)",
+    re.S,
+)
+
+
+def _link_title(text):
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _expand_github_references(text, url, metadata=None):
+    """
+    Replaces issue numbers and handles with links in a single pass. ``metadata``
+    (as returned by ``Enricher.resolve``) adds the URL of pull requests and
+    titles to the links
+    """
+    metadata = metadata or {}
+
+    def replace(match):
+        issue, handle = match.group("issue"), match.group("handle")
+
+        if issue:
+            info = metadata.get(("issue", issue))
+
+            if info is None:
+                return f"[#{issue}]({url}{issue})"
+
+            title = f" {_link_title(info['title'])}" if info.get("title") else ""
+            return f"[#{issue}]({info['url']}{title})"
+        elif handle:
+            info = metadata.get(("user", handle)) or {}
+            title = f" {_link_title(info['name'])}" if info.get("name") else ""
+            return f"[@{handle}](https://github.com/{handle}{title})"
+        else:
+            return match.group(0)
+
+    return _GITHUB_REFERENCE.sub(replace, text)
+
+
+def find_github_references(texts):
+    """
+    Find issue numbers and handles (outside code spans and links)
+
+    Returns
+    -------
+    issues : set
+        Issue numbers (as strings)
+
+    handles : set
+        GitHub handles (without the @)
+    """
+    issues, handles = set(), set()
+
+    for text in texts:
+        for match in _GITHUB_REFERENCE.finditer(text):
+            if match.group("issue"):
+                issues.add(match.group("issue"))
+            elif match.group("handle"):
+                handles.add(match.group("handle"))
+
+    return issues, handles
 
 
-def _expand_github_from_text(text):
-    """Convert strings with the #{number} format into their"""
-    cfg = config.Config.from_file("pyproject.toml")
-    url = f'https://github.com/{cfg["github"]}/issues/'
-    return _replace_handles_with_links(_replace_issue_number_with_links(url, text))
+def _resolve_references(texts, enricher):
+    if enricher is None:
+        return None
 
+    return enricher.resolve(*find_github_references(texts))
 
-def expand_github_from_changelog(path="CHANGELOG.md"):
+
+def _github_issues_url(directory=None):
+    cfg = config.Config.from_file("pyproject.toml", directory=directory)
+
+    if "github" not in cfg:
+        raise InvalidConfiguration(
+            "Missing key : 'github'. Add it to [tool.pkgmt] in pyproject.toml "
+            '(e.g., github = "ploomber/pkgmt") to expand links in the CHANGELOG'
+        )
+
+    return f'https://github.com/{cfg["github"]}/issues/'
+
+
+def _expand_github_from_text(text, all_sections=False, enricher=None):
+    """
+    Convert strings with the #{number} format (and @handles) into links. Unless
+    ``all_sections`` is True, released sections are left untouched
+    """
+    url = _github_issues_url()
+
+    if all_sections:
+        latest, rest = text, ""
+    else:
+        latest, rest = _split_latest_section(text)
+
+    metadata = _resolve_references([latest], enricher)
+    return _expand_github_references(latest, url, metadata) + rest
+
+
+def expand_github_from_changelog(
+    path="CHANGELOG.md", all_sections=False, enricher=None
+):
+    """
+    Expands issue numbers and handles in the latest section of the CHANGELOG
+    (or in every section if ``all_sections`` is True). The file is only written
+    if something changed, returns True if it was
+
+    Parameters
+    ----------
+    enricher : pkgmt.changelog_enrich.Enricher, default=None
+        If passed, it's used to link pull requests to their page and add titles
+        to the links
+    """
     path = Path(path)
     changelog = path.read_text()
-    changelog_ = _expand_github_from_text(changelog)
+    changelog_ = _expand_github_from_text(
+        changelog, all_sections=all_sections, enricher=enricher
+    )
+
+    if changelog_ == changelog:
+        return False
+
     path.write_text(changelog_)
+    return True
+
+
+def _text_tokens(tokens):
+    """Text tokens in a (sub)tree, except the ones in links"""
+    for token in tokens:
+        if token["type"] == "text":
+            yield token
+        elif token["type"] != "link" and "children" in token:
+            yield from _text_tokens(token["children"])
+
+
+def _expand_github_in_tokens(tokens, url, enricher=None):
+    """Expand issue numbers and handles in the text tokens of a (sub)tree. Code
+    spans and existing links are left untouched. Returns True if any token
+    changed
+    """
+    text_tokens = list(_text_tokens(tokens))
+    metadata = _resolve_references([token["raw"] for token in text_tokens], enricher)
+    changed = False
+
+    for token in text_tokens:
+        raw = _expand_github_references(token["raw"], url, metadata)
+        changed = changed or raw != token["raw"]
+        token["raw"] = raw
+
+    return changed
+
+
+# lines that start or end fenced code blocks and ATX H2 headings, used to find
+# the end of the latest section without parsing the whole document
+_FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_H2 = re.compile(r"^ {0,3}##(?:[ \t]|$)")
+
+
+def _read_head(lines):
+    """
+    Consumes lines until the second H2 heading (inclusive), ignoring headings in
+    fenced code blocks
+
+    Returns
+    -------
+    head : str
+        The lines that were read
+
+    truncated : bool
+        True if there's content after the head
+    """
+    head, fence, n_h2 = [], None, 0
+
+    for line in lines:
+        head.append(line)
+        match = _FENCE.match(line)
+
+        if fence is None and match:
+            fence = match.group(1)
+        elif fence is not None:
+            # a fence closes with at least as many characters as it was opened
+            if (
+                match
+                and match.group(1)[0] == fence[0]
+                and len(match.group(1)) >= len(fence)
+                and not line[match.end() :].strip()
+            ):
+                fence = None
+        elif _H2.match(line):
+            n_h2 += 1
+
+            if n_h2 == 2:
+                return "".join(head), True
+
+    return "".join(head), False
+
+
+def _split_latest_section(text):
+    """
+    Splits the text before the second H2 heading: the latest section (and
+    anything above it) and the rest of the document
+    """
+    head, truncated = _read_head(io.StringIO(text))
+
+    if not truncated:
+        return text, ""
+
+    # the last line in the head is the heading
+    split = head.rindex("\n", 0, len(head) - 1) + 1
+    return text[:split], text[split:]
 
 
 # functions for checking CHANGELOG contents
@@ -119,6 +338,51 @@ def _extract_text_from_items(list_):
     return [_extract_text_from_item(item) for item in list_["children"]]
 
 
+# separates lines in the document parsed by extract_text_from_lines
+_LINE_SEPARATOR = "<!-- pkgmt: line -->"
+
+
+def _text_from_first_item(tokens):
+    try:
+        return _extract_text_from_items(tokens[0])[0]
+    except (KeyError, IndexError):
+        # not a list item (e.g., a heading)
+        return None
+
+
+def extract_text_from_lines(lines):
+    """
+    Extract the text of CHANGELOG entries in separate lines (e.g., lines added
+    in a diff). The lines are parsed in a single document
+
+    Returns
+    -------
+    list
+        The text of the entry in each line, None if the line isn't an entry
+    """
+    _require_mistune()
+
+    if not lines:
+        return []
+
+    markdown = _make_parser()
+    tree = markdown(f"\n\n{_LINE_SEPARATOR}\n\n".join(lines))
+    groups = [[]]
+
+    for token in tree:
+        if token["type"] == "block_html" and token["raw"].strip() == _LINE_SEPARATOR:
+            groups.append([])
+        elif token["type"] != "blank_line":
+            groups[-1].append(token)
+
+    if len(groups) != len(lines):
+        # some line changed how the following ones are parsed (e.g., it opens
+        # a code block), parse them one by one
+        groups = [markdown(line) for line in lines]
+
+    return [_text_from_first_item(tokens) for tokens in groups]
+
+
 def _valid_item(item):
     return any(item.startswith(prefix) for prefix in _PREFIXES)
 
@@ -166,85 +430,256 @@ class ListItemType(IntEnum):
 
 
 class CHANGELOG:
-    """Run several checks in the CHANGELOG.md file"""
+    """Run several checks in the CHANGELOG.md file and edit it when releasing
 
-    def __init__(self, text, project_root=".") -> None:
-        if not mistune:
-            raise ModuleNotFoundError(
-                "Checking CHANGELOG.md requires mistune 3. "
-                "Install it with: pip install 'pkgmt[check]'"
-            )
+    The file is parsed once. H2 headings (section boundaries) are indexed on
+    first use and edits (e.g., ``set_release``, ``expand_github``) are applied
+    to the parsed tree, so several edits can be written at once with ``write``
 
-        if mistune.__version__[0] != "3":
-            raise ModuleNotFoundError(
-                "Checking CHANGELOG.md requires mistune 3. "
-                f"You have {mistune.__version__}. Install it with: "
-                "pip install 'pkgmt[check]'"
-            )
+    Parameters
+    ----------
+    text : str or None
+        Contents of the CHANGELOG. If None, they're read from ``path``
 
-        self.text = text
+    project_root : str, default="."
+        Path to the project root, used to find the version file
 
-        markdown = mistune.Markdown(
-            renderer=None, inline=CustomInlineParser(hard_wrap=False), plugins=None
-        )
-        self.tree = markdown(text)
+    path : str or pathlib.Path, default=None
+        Location of the CHANGELOG, ``write`` saves it there by default
+
+    lazy : bool, default=False
+        If True, only the document up to the second H2 heading is parsed (and,
+        if ``text`` is None, read), which is all the checks need. The rest of
+        the document is parsed when an operation needs it (e.g., ``render``),
+        so ``tree`` might only contain the first section
+    """
+
+    def __init__(self, text, project_root=".", path=None, lazy=False) -> None:
+        _require_mistune()
+
+        if text is None and path is None:
+            raise ValueError("Either text or path must be passed")
+
+        self._text = text
+        self.path = path
+        self.project_root = project_root
+
+        self._markdown = _make_parser()
+        self._sections = None
+        self._latest_section = None
+        self._modified = False
+        self._partial = False
+        # edits that render() must take into account to copy the released
+        # sections from the original text
+        self._added = 0
+        self._edited_all = False
+
+        if not lazy:
+            self.tree = self._markdown(self.text)
+        else:
+            if text is None:
+                with open(path) as f:
+                    head, self._partial = _read_head(f)
+            else:
+                head, self._partial = _read_head(io.StringIO(text))
+
+            self.tree = self._markdown(head)
+
+            # the second H2 heading wasn't at the top level (e.g., it's in an
+            # HTML block), so the head might be incomplete
+            if self._partial and len(self._index_sections()) < 2:
+                self._parse_all()
 
         versioner = Versioner.load(project_root=project_root)
         self.version_file = versioner.get_version_file_path()
         self.current = versioner.current_version()
 
     @classmethod
-    def from_path(cls, path, project_root="."):
-        return cls(text=Path(path).read_text(), project_root=project_root)
+    def from_path(cls, path, project_root=".", lazy=False):
+        text = None if lazy else Path(path).read_text()
+        return cls(text=text, project_root=project_root, path=path, lazy=lazy)
+
+    @property
+    def text(self):
+        """The original contents of the CHANGELOG"""
+        if self._text is None:
+            self._text = Path(self.path).read_text()
+
+        return self._text
+
+    def _parse_all(self):
+        """Parses the whole document if only the head was parsed"""
+        if self._partial:
+            self.tree = self._markdown(self.text)
+            self._partial = False
+            self._sections = None
+            self._latest_section = None
 
     def extract_text_from_entry(self):
         """Extract text from a single Changelog entry"""
         return _extract_text_from_items(self.tree[0])
 
     def sort_last_section(self):
-        """Sorts last section depending on the prefix"""
+        """Sorts last section depending on the prefix, returns the updated text"""
+        if self.sort_latest_entries():
+            return self.render()
+        else:
+            # list is empty, nothing to sort
+            return self.text
+
+    def sort_latest_entries(self):
+        """
+        Sorts the entries in the latest section depending on the prefix. Returns
+        False if there are no entries
+        """
+        self._parse_all()
         self.check_latest_changelog_entries()
 
         idx_subheading, _ = self.get_first_subheading()
-        list_, idx = _find_first_list_after(self.tree, idx_subheading)
-        renderer = MarkdownRenderer()
-
-        if list_:
-            li = sorted([ListItem(ch) for ch in list_["children"]])
-            tree = deepcopy(self.tree)
-            tree[idx]["children"] = [item.token for item in li]
-            return renderer(tree, state=BlockState())
+        list_, _ = _find_first_list_after(self.tree, idx_subheading)
+
+        if not list_:
+            return False
+
+        children = [
+            item.token for item in sorted(ListItem(ch) for ch in list_["children"])
+        ]
+
+        if children != list_["children"]:
+            list_["children"] = children
+            self._latest_section = None
+            self._modified = True
+
+        return True
+
+    def set_release(self, version, date=None):
+        """
+        Renames the latest section to ``{version} ({date})``, date defaults to
+        today
+        """
+        self._parse_all()
+        date = date or datetime.now().strftime("%Y-%m-%d")
+        idx, _ = self.get_first_subheading()
+        title = f"{version} ({date})"
+
+        self.tree[idx]["children"][0]["raw"] = title
+        self._sections[0] = (idx, title)
+        self._modified = True
+
+    def add_dev_section(self, version):
+        """Adds an empty section (e.g., ``## 0.2dev``) above the latest one"""
+        self._parse_all()
+        idx, _ = self.get_first_subheading()
+        heading = deepcopy(_SUBHEADING)
+        heading["children"][0]["raw"] = version
+
+        self.tree.insert(idx, heading)
+        self._added += 1
+        self._sections = None
+        self._latest_section = None
+        self._modified = True
+
+    def expand_github(self, url=None, all_sections=False, enricher=None):
+        """
+        Converts issue numbers (#1) and GitHub handles (@user) into links in the
+        latest section (or in all of them if ``all_sections`` is True). ``url``
+        defaults to the issues URL of the repository in pyproject.toml. If
+        passed, ``enricher`` adds the URL of pull requests and titles to the
+        links
+        """
+        self._parse_all()
+        sections = self._index_sections()
+
+        if all_sections or len(sections) < 2:
+            tokens = self.tree
         else:
-            # list is empty, nothing to sort
+            tokens = self.tree[: sections[1][0]]
+
+        if _expand_github_in_tokens(
+            tokens, url or _github_issues_url(self.project_root), enricher
+        ):
+            self._latest_section = None
+            self._modified = True
+            self._edited_all = self._edited_all or tokens is self.tree
+
+    def render(self):
+        """Returns the Markdown for the (possibly edited) document"""
+        if not self._modified:
             return self.text
 
+        tokens, rest = self.tree, ""
+
+        # only the latest section is edited (unless expanding links in all of
+        # them), the rest is copied as it is since rendering changes its
+        # formatting (e.g., __bold__ becomes **bold**)
+        if not self._edited_all:
+            latest, rest_ = _split_latest_section(self.text)
+            sections = self._index_sections()
+            # sections added above the latest one
+            idx = 1 + self._added
+
+            # the split must agree with the tree (e.g., it doesn't if the
+            # second H2 is in an HTML block). Edits to the latest section don't
+            # change how many tokens it has
+            if (
+                rest_
+                and len(sections) > idx
+                and len(self._markdown(latest)) + self._added == sections[idx][0]
+            ):
+                # the renderer drops the blank line before the heading
+                tokens, rest = self.tree[: sections[idx][0]], "\n" + rest_
+
+        # the renderer modifies the tokens it renders
+        return MarkdownRenderer()(deepcopy(tokens), state=BlockState()) + rest
+
+    def write(self, path=None):
+        """Writes the document to ``path`` (defaults to the file it was loaded
+        from) and returns the text
+        """
+        path = path or self.path
+
+        if path is None:
+            raise ValueError(
+                "path is required if the CHANGELOG was not loaded from a file"
+            )
+
+        text = self.render()
+
+        # nothing to write if there weren't edits
+        if self._modified or self.path is None or Path(path) != Path(self.path):
+            Path(path).write_text(text)
+
+        return text
+
+    def _index_sections(self):
+        if self._sections is None:
+            self._sections = [
+                (idx, element["children"][0]["raw"])
+                for idx, element in enumerate(self.tree)
+                if element == _SUBHEADING
+            ]
+
+        return self._sections
+
     def get_first_subheading(self):
         """Find the first H2 heading. Returns index (in the tree) and text"""
-        subheading = {
-            "type": "heading",
-            "attrs": {"level": 2},
-            "style": "atx",
-            "children": [{"type": "text", "raw": ANY}],
-        }
+        sections = self._index_sections()
 
-        for idx, element in enumerate(self.tree):
-            if element == subheading:
-                return idx, element["children"][0]["raw"]
+        if not sections:
+            raise ProjectValidationError(
+                "Error parsing CHANGELOG: Could not find an H2 heading"
+            )
 
-        raise ProjectValidationError(
-            "Error parsing CHANGELOG: Could not find an H2 heading"
-        )
+        return sections[0]
 
     def get_latest_changelog_section(self):
         """Gets the elements in the first section (below the first H2 heading)"""
-        idx_subheading, _ = self.get_first_subheading()
-        changes, _ = _find_first_list_after(self.tree, idx_subheading)
+        if self._latest_section is None:
+            idx_subheading, _ = self.get_first_subheading()
+            changes, _ = _find_first_list_after(self.tree, idx_subheading)
+            self._latest_section = _extract_text_from_items(changes) if changes else []
 
-        if changes:
-            items_text = _extract_text_from_items(changes)
-            return items_text
-        else:
-            return []
+        return self._latest_section
 
     def check_consistent_dev_version(self):
         """
@@ -0,0 +1,322 @@
+"""
+Optional enrichment of GitHub references (e.g., #123 and @handle) in the
+CHANGELOG: resolves whether a number is an issue or a pull request, its title
+and the name of users, so expanded links point to the right page and have a
+title
+"""
+
+import json
+import sqlite3
+import concurrent.futures
+from pathlib import Path
+
+import click
+import requests
+
+from pkgmt import github
+from pkgmt.links_cache import ignore_from_git
+
+DEFAULT_PATH = Path(".pkgmt", "cache", "github.db")
+
+BACKENDS = ("github", "fixture")
+
+# bump when changing the schema, the database is re-created if it doesn't match
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class GitHubBackend:
+    """Resolves references with the GitHub REST API. Set the GITHUB_TOKEN
+    environment variable to get a higher rate limit
+
+    Parameters
+    ----------
+    repository : str
+        Repository where issue numbers are looked up (e.g., "ploomber/pkgmt")
+
+    timeout : float, default=10
+        Seconds to wait for each request
+    """
+
+    def __init__(self, repository, timeout=10) -> None:
+        self.repository = repository
+        self.owner, self.repo = repository.split("/")
+        self.timeout = timeout
+
+    def issue(self, number):
+        data = github.get_issue(self.owner, self.repo, number, timeout=self.timeout)
+
+        if data is None:
+            return None
+
+        return {
+            "kind": "pull" if "pull_request" in data else "issue",
+            "title": data["title"],
+            "url": data["html_url"],
+        }
+
+    def user(self, handle):
+        data = github.get_user(handle, timeout=self.timeout)
+
+        if data is None:
+            return None
+
+        return {"name": data.get("name"), "url": data["html_url"]}
+
+
+class FixtureBackend:
+    """Resolves references from a JSON file, for offline use or as a stand-in
+    for the API in tests. Example:
+
+    {
+        "issues": {"123": {"kind": "pull", "title": "Adds feature"}},
+        "users": {"edublancas": {"name": "Eduardo"}}
+    }
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Location of the JSON file
+
+    repository : str
+        Repository used to build URLs that aren't in the file (e.g.,
+        "ploomber/pkgmt")
+    """
+
+    def __init__(self, path, repository) -> None:
+        self.repository = repository
+        data = json.loads(Path(path).read_text())
+        self._issues = data.get("issues", {})
+        self._users = data.get("users", {})
+
+    def issue(self, number):
+        data = self._issues.get(str(number))
+
+        if data is None:
+            return None
+
+        kind = data.get("kind", "issue")
+        path = "pull" if kind == "pull" else "issues"
+        url = f"https://github.com/{self.repository}/{path}/{number}"
+        return {"kind": kind, "title": data.get("title"), "url": data.get("url", url)}
+
+    def user(self, handle):
+        data = self._users.get(handle)
+
+        if data is None:
+            return None
+
+        return {
+            "name": data.get("name"),
+            "url": data.get("url", f"https://github.com/{handle}"),
+        }
+
+
+class MetadataCache:
+    """SQLite-backed cache of resolved references. Entries don't expire, so
+    re-running a release never fetches references it already resolved
+
+    Parameters
+    ----------
+    path : str or pathlib.Path, default=".pkgmt/cache/github.db"
+        Location of the database, parent directories are created if needed
+    """
+
+    def __init__(self, path=DEFAULT_PATH) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        ignore_from_git(self.path.parent)
+
+        self._conn = sqlite3.connect(str(self.path))
+
+        (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+
+        if version != _SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS metadata")
+            self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def get(self, key):
+        row = self._conn.execute(
+            "SELECT value FROM metadata WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key, value):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+            (key, json.dumps(value)),
+        )
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Enricher:
+    """Resolves references through a backend, with bounded concurrency and
+    (optionally) a persistent cache
+
+    Parameters
+    ----------
+    backend : GitHubBackend or FixtureBackend
+        Any object with ``issue(number)`` and ``user(handle)`` methods that
+        return a dict (or None if the reference doesn't exist) and a
+        ``repository`` attribute
+
+    cache : MetadataCache, default=None
+        If passed, resolved references are stored and reused. ``close()``
+        closes it
+
+    max_workers : int, default=8
+        Maximum number of references resolved at the same time
+    """
+
+    def __init__(self, backend, cache=None, max_workers=8) -> None:
+        self.backend = backend
+        self.cache = cache
+        self.max_workers = max_workers
+
+    @classmethod
+    def from_config(cls, cfg, project_root="."):
+        """
+        Create an enricher from the [tool.pkgmt.changelog] section, returns
+        None if enrichment is disabled (the default). ``cache_path`` and
+        ``fixture`` are relative to ``project_root``. Example:
+
+        [tool.pkgmt.changelog]
+        enrich = "github"
+        max_workers = 8
+        """
+        section = cfg.get("changelog", {})
+        kind = section.get("enrich")
+
+        if kind is None:
+            return None
+
+        if kind not in BACKENDS:
+            raise click.ClickException(
+                f"Invalid value for changelog.enrich: {kind!r}. "
+                f"Valid values are: {', '.join(BACKENDS)}"
+            )
+
+        if "github" not in cfg:
+            raise click.ClickException(
+                "changelog.enrich requires the repository (e.g., "
+                'github = "ploomber/pkgmt") in [tool.pkgmt]'
+            )
+
+        if kind == "github":
+            backend = GitHubBackend(cfg["github"])
+            cache = (
+                MetadataCache(
+                    Path(project_root, section.get("cache_path", DEFAULT_PATH))
+                )
+                if section.get("cache", True)
+                else None
+            )
+        else:
+            if "fixture" not in section:
+                raise click.ClickException(
+                    'changelog.enrich = "fixture" requires a changelog.fixture '
+                    "with the path to a JSON file"
+                )
+
+            backend = FixtureBackend(
+                Path(project_root, section["fixture"]), repository=cfg["github"]
+            )
+            # reading the file is as fast as the cache
+            cache = None
+
+        return cls(backend, cache=cache, max_workers=section.get("max_workers", 8))
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _cache_key(self, key):
+        kind, value = key
+        return f"{self.backend.repository}#{value}" if kind == "issue" else f"@{value}"
+
+    def _fetch(self, key):
+        kind, value = key
+        return (
+            self.backend.issue(value) if kind == "issue" else self.backend.user(value)
+        )
+
+    def resolve(self, issues, handles):
+        """
+        Resolve issue numbers and handles
+
+        Returns
+        -------
+        dict
+            Maps ``("issue", number)`` and ``("user", handle)`` to their
+            metadata. References that don't exist or couldn't be fetched (e.g.,
+            the API rate limit was hit) are missing
+        """
+        keys = [("issue", str(number)) for number in sorted(set(issues))] + [
+            ("user", handle) for handle in sorted(set(handles))
+        ]
+        result, missing = {}, []
+
+        for key in keys:
+            value = None if self.cache is None else self.cache.get(self._cache_key(key))
+
+            if value is None:
+                missing.append(key)
+            else:
+                result[key] = value
+
+        if not missing:
+            return result
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers
+        ) as executor:
+            future_to_key = {executor.submit(self._fetch, key): key for key in missing}
+
+            for future in concurrent.futures.as_completed(future_to_key):
+                key = future_to_key[future]
+
+                try:
+                    value = future.result()
+                except requests.exceptions.RequestException as e:
+                    click.secho(
+                        f"Could not resolve {self._cache_key(key)}: {e}", fg="yellow"
+                    )
+                    continue
+
+                if value is not None:
+                    result[key] = value
+
+                    if self.cache is not None:
+                        self.cache.set(self._cache_key(key), value)
+
+        if self.cache is not None:
+            self.cache.commit()
+
+        return result
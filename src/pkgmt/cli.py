@@ -1,20 +1,30 @@
 import sys
-from pathlib import Path
 
 import click
 from invoke import Context, UnexpectedExit
 
 
-from pkgmt import links, config, test, changelog, hook as hook_, versioneer
+from pkgmt import (
+    links,
+    links_cache,
+    links_ratelimit,
+    links_report,
+    config,
+    test,
+    changelog,
+)
+from pkgmt import hook as hook_, versioneer
 from pkgmt import new as new_
 from pkgmt import dev
 from pkgmt import formatting
 from pkgmt import utm as utm_
+from pkgmt import project
 
 
 @click.group()
 def cli():
-    pass
+    # files read by several commands are cached during a single invocation
+    project.reset()
 
 
 @cli.command()
@@ -24,18 +34,165 @@ def cli():
     default=False,
     help="Only consider 404 code as broken",
 )
-def check_links(only_404):
+@click.option(
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Ignore cached results and check every link again",
+)
+@click.option(
+    "--max-age",
+    type=int,
+    default=None,
+    help="Re-check links whose cached result is older than this (in seconds)",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(links.ENGINES),
+    default="thread",
+    show_default=True,
+    help="Check links with a thread pool or with asyncio (requires httpx)",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=20,
+    show_default=True,
+    help="Maximum number of links checked at the same time",
+)
+@click.option(
+    "--since",
+    default=None,
+    help="Only check links added in files modified since this git ref (e.g., main)",
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of processes used to find links in files",
+)
+@click.option(
+    "--index",
+    is_flag=True,
+    default=False,
+    help="Also check files staged in git (by default, only committed files)",
+)
+@click.option(
+    "--connect-timeout",
+    type=float,
+    default=None,
+    help="Seconds to wait for a connection (default: 10)",
+)
+@click.option(
+    "--read-timeout",
+    type=float,
+    default=None,
+    help="Seconds to wait for a response (default: 30)",
+)
+@click.option(
+    "--retries",
+    type=int,
+    default=None,
+    help="Times to retry links that time out or return 429, 502, 503 or 504 "
+    "(default: 2)",
+)
+@click.option(
+    "--format",
+    "format_",
+    type=click.Choice(list(links_report.FORMATS)),
+    default="text",
+    show_default=True,
+    help="Output format, jsonl, sarif and junit are streamed as links are checked",
+)
+@click.option(
+    "--anchors",
+    is_flag=True,
+    default=False,
+    help="Also check relative links and #anchors in Markdown, reStructuredText "
+    "and notebooks",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    default=False,
+    help="Only check relative links and #anchors (no network requests)",
+)
+@click.option(
+    "--external-anchors",
+    is_flag=True,
+    default=False,
+    help="Download pages linked with a #fragment to check the anchor exists",
+)
+@click.option(
+    "--fail-fast",
+    is_flag=True,
+    default=False,
+    help="Stop after finding the first broken link",
+)
+@click.option(
+    "--deadline",
+    type=float,
+    default=None,
+    help="Stop checking links after this many seconds, links that weren't "
+    "checked are reported as unknown",
+)
+def check_links(
+    only_404,
+    refresh,
+    max_age,
+    engine,
+    workers,
+    since,
+    jobs,
+    index,
+    connect_timeout,
+    read_timeout,
+    retries,
+    format_,
+    anchors,
+    offline,
+    external_anchors,
+    fail_fast,
+    deadline,
+):
     """Check for broken links"""
     broken_http_codes = None if not only_404 else [404]
 
     cfg = config.Config.from_file("pyproject.toml")["check_links"]
-    out = links.find_broken_in_files(
-        cfg["extensions"],
-        cfg.get("ignore_substrings"),
-        verbose=True,
-        broken_http_codes=broken_http_codes,
+    cache = links_cache.LinkCache.from_config(cfg, max_age=max_age, refresh=refresh)
+    default_connect, default_read = links.DEFAULT_TIMEOUT
+    timeout = (
+        connect_timeout or cfg.get("connect_timeout", default_connect),
+        read_timeout or cfg.get("read_timeout", default_read),
     )
 
+    try:
+        out = links.find_broken_in_files(
+            cfg["extensions"],
+            cfg.get("ignore_substrings"),
+            broken_http_codes=broken_http_codes,
+            cache=cache,
+            engine=engine,
+            max_workers=workers,
+            rate_limiter=links_ratelimit.HostRateLimiter.from_config(cfg),
+            since=since,
+            jobs=jobs,
+            index=index,
+            timeout=timeout,
+            retry_policy=links_ratelimit.RetryPolicy.from_config(cfg, retries=retries),
+            reporter=links_report.FORMATS[format_](),
+            tracking_params=cfg.get("tracking_params"),
+            anchors=anchors,
+            offline=offline,
+            external_anchors=external_anchors,
+            fail_fast=fail_fast,
+            deadline=deadline,
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+
     if out:
         sys.exit(1)
 
@@ -66,8 +223,8 @@ def test_md(file, inplace):
 @cli.command()
 def check():
     """Run general checks in the project"""
-    text = Path("CHANGELOG.md").read_text()
-    changelog.CHANGELOG(text).check(verbose=True)
+    # checks only need the latest section
+    changelog.CHANGELOG.from_path("CHANGELOG.md", lazy=True).check(verbose=True)
 
 
 @cli.command()
@@ -105,18 +262,54 @@ def hook(uninstall, run):
 @click.option("--push/--no-push", default=None)
 @click.option("--tag/--no-tag", default=None)
 @click.option("--target", default=None)
-def version(yes, push, tag, target):
+@click.option(
+    "--plan",
+    is_flag=True,
+    default=False,
+    help="Print the edits and commits without applying them",
+)
+@click.option(
+    "--all",
+    "all_",
+    is_flag=True,
+    default=False,
+    help="Release every package in the workspace (monorepo)",
+)
+@click.option(
+    "--changed",
+    is_flag=True,
+    default=False,
+    help="Release the packages in the workspace that changed since their "
+    "last release (monorepo)",
+)
+def version(yes, push, tag, target, plan, all_, changed):
     """Create a new package version"""
 
     cfg = config.Config.from_file("pyproject.toml", cli_args=dict(push=push, tag=tag))
 
-    versioneer.version(
-        project_root=".",
-        tag=cfg["version"]["tag"],
-        yes=yes,
-        push=cfg["version"]["push"],
-        target=target,
-    )
+    if all_ and changed:
+        raise click.ClickException("--all and --changed are mutually exclusive")
+
+    if all_ or changed:
+        versioneer.version_all(
+            project_root=".",
+            changed=changed,
+            tag=cfg["version"]["tag"],
+            yes=yes,
+            push=cfg["version"]["push"],
+            target=target,
+            plan=plan,
+            max_workers=cfg.get("workspace", {}).get("max_workers"),
+        )
+    else:
+        versioneer.version(
+            project_root=".",
+            tag=cfg["version"]["tag"],
+            yes=yes,
+            push=cfg["version"]["push"],
+            target=target,
+            plan=plan,
+        )
 
 
 @cli.command()
@@ -1,13 +1,31 @@
+from pathlib import Path
 from collections.abc import Mapping
+from copy import deepcopy
 
 import toml
 import click
-from pathlib import Path
+from pkgmt import project
 from pkgmt.exceptions import InvalidConfiguration
 
-VALID_KEYS = ["github", "version", "package_name", "check_links", "env_name", "utm"]
+VALID_KEYS = [
+    "github",
+    "version",
+    "package_name",
+    "check_links",
+    "env_name",
+    "utm",
+    "changelog",
+    "workspace",
+]
 VALID_VERSION_KEYS = ["version_file", "tag", "push"]
 
+# keys that packages in a workspace take from the root pyproject.toml if they
+# don't have them
+INHERITED_KEYS = ["github", "changelog"]
+
+# paths in the changelog section, relative to the file that has them
+_CHANGELOG_PATHS = ["fixture", "cache_path"]
+
 
 class Config(Mapping):
     def __init__(self, data, name) -> None:
@@ -151,49 +169,87 @@ class Config(Mapping):
         data.setdefault("version", {}).update(version)
         return data
 
+    @staticmethod
+    def find_file(filename, directory=None):
+        """
+        Looks for the config file in the directory (defaults to the current one)
+        and its parents
+        """
+        return project.context().find_file(filename, directory=directory)
+
     @classmethod
     def from_file(cls, filename, directory=None, **kwargs):
         """
         Function to generate Config object from config file.
         Config file should contain key tool.pkgmt
         """
-        directory = directory or Path.cwd()
-
-        config_file_path = None
-
-        for _ in range(10):  # Limit the search to 10 levels up
-            directory = Path(directory)
-            potential_file_path = directory / filename
-            if potential_file_path.exists():
-                config_file_path = potential_file_path
-                break
-            else:
-                directory = directory.parent  # Go one level up
-
-        if not config_file_path or not config_file_path.exists():
-            raise FileNotFoundError(
-                f"Could not find configuration file: expected a {filename} file"
-            )
+        config_file_path = cls.find_file(filename, directory=directory)
 
-        with open(config_file_path) as f:
-            try:
-                data = toml.load(f)
-            except toml.decoder.TomlDecodeError as e:
-                raise InvalidConfiguration(
-                    f"Invalid {filename} file: {str(e)}."
-                    "If using a boolean "
-                    "value ensure it's in lowercase, e.g., key = true"
-                ) from e
-            try:
-                data = data["tool"]["pkgmt"]
-            except KeyError as e:
-                raise InvalidConfiguration(
-                    f"Missing key : {str(e)}.\n{filename} "
-                    f"should contain 'tool.pkgmt' key."
-                ) from e
-
-            Config._validate_config(data, filename)
-            data = Config._resolve_version_configuration(
-                data, kwargs.get("cli_args"), filename
+        try:
+            # parsed once per invocation (unless the file changes)
+            data = project.context().load(config_file_path, _load_toml)
+        except toml.decoder.TomlDecodeError as e:
+            raise InvalidConfiguration(
+                f"Invalid {filename} file: {str(e)}."
+                "If using a boolean "
+                "value ensure it's in lowercase, e.g., key = true"
+            ) from e
+        pkgmt = data.get("tool", {}).get("pkgmt")
+        workspace = None
+
+        # packages in a monorepo use the workspace's values for the keys they
+        # don't set (they might not even have a [tool.pkgmt] section)
+        if pkgmt is None or any(key not in pkgmt for key in INHERITED_KEYS):
+            workspace = _find_workspace(config_file_path, filename)
+
+        if pkgmt is None and workspace is None:
+            missing = "pkgmt" if "tool" in data else "tool"
+            raise InvalidConfiguration(
+                f"Missing key : {missing!r}.\n{filename} "
+                f"should contain 'tool.pkgmt' key."
             )
-            return cls(data, filename)
+
+        # copy since resolving the configuration modifies it
+        data = deepcopy(pkgmt or {})
+        Config._validate_config(data, filename)
+
+        if workspace is not None:
+            for key in INHERITED_KEYS:
+                if key not in data and key in workspace:
+                    data[key] = workspace[key]
+        data = Config._resolve_version_configuration(
+            data, kwargs.get("cli_args"), filename
+        )
+        return cls(data, filename)
+
+
+def _load_toml(path):
+    with open(path) as f:
+        return toml.load(f)
+
+
+def _find_workspace(path, filename):
+    """
+    Returns the [tool.pkgmt] section of the workspace (a configuration file with
+    [tool.pkgmt.workspace] in a parent directory of ``path``), None if there
+    isn't one. Paths in its changelog section are made absolute
+    """
+    try:
+        root = project.context().find_file(filename, directory=path.parent.parent)
+        data = project.context().load(root, _load_toml)
+    except (FileNotFoundError, toml.decoder.TomlDecodeError):
+        return None
+
+    pkgmt = data.get("tool", {}).get("pkgmt", {})
+
+    if "workspace" not in pkgmt:
+        return None
+
+    pkgmt = deepcopy(pkgmt)
+    changelog = pkgmt.get("changelog", {})
+
+    for key in _CHANGELOG_PATHS:
+        if key in changelog:
+            changelog[key] = str(Path(root.parent, changelog[key]))
+
+    return pkgmt
@@ -5,7 +5,7 @@ from collections import defaultdict
 
 import click
 
-from pkgmt.versioner.util import complete_version_string
+from pkgmt.versioner.util import Version
 from pkgmt.exceptions import ProjectValidationError
 from pkgmt.versioner.versioner import Versioner
 
@@ -15,9 +15,7 @@ class Deprecations:
         self.root_dir = root_dir
 
         versioner = Versioner.load(project_root=root_dir)
-        self.current = complete_version_string(
-            versioner.current_version().replace("dev", "")
-        )
+        self.current = Version.parse(versioner.current_version()).without_dev()
 
     def check(self):
         """Check if there are pending deprecations"""
@@ -26,7 +24,18 @@ class Deprecations:
         mapping = defaultdict(lambda: [])
 
         for dep in deprecations:
-            mapping[complete_version_string(dep.version)].append(dep)
+            # the version might be followed by a period (e.g., "in 0.4.")
+            try:
+                version = Version.parse(dep.version.rstrip("."))
+            except ValueError:
+                # the body has no version we can recognize (e.g., "foo...")
+                click.secho(
+                    f"Skipping deprecation with an unknown version: {dep}",
+                    fg="yellow",
+                )
+                continue
+
+            mapping[version].append(dep)
 
         if self.current in mapping:
             matches_out = "\n".join(f"- {item}" for item in mapping[self.current])
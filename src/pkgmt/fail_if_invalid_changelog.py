@@ -1,7 +1,6 @@
 import subprocess
 import argparse
 import sys
-from pathlib import Path
 
 from pkgmt import changelog
 
@@ -19,8 +18,7 @@ def latest_changelog_header(base_branch):
 
 def check_modified(base_branch, debug=False):
     latest_section_main = latest_changelog_header(base_branch)
-    text = Path("CHANGELOG.md").read_text()
-    changelog_parser = changelog.CHANGELOG(text)
+    changelog_parser = changelog.CHANGELOG.from_path("CHANGELOG.md", lazy=True)
     latest_section_current = changelog_parser.get_first_subheading()[1].strip()
     if latest_section_main != latest_section_current:
         print(
@@ -61,25 +59,27 @@ def check_modified(base_branch, debug=False):
             return 1
 
         if git_additions:
-            latest_entries = changelog_parser.get_latest_changelog_section()
+            latest_entries = set(changelog_parser.get_latest_changelog_section())
+            # parse each distinct line once
+            unique = list(dict.fromkeys(git_additions))
+            entries = dict(zip(unique, changelog.extract_text_from_lines(unique)))
+
             for line in git_additions:
-                if line:
-                    try:
-                        extracted_text = changelog.CHANGELOG(
-                            line
-                        ).extract_text_from_entry()
-                    except KeyError:
-                        continue
-                    if extracted_text[0] not in latest_entries:
-                        print(
-                            f"Entry '{line}' should be added "
-                            f"to section {latest_section_main}"
-                        )
-                        return 1
-
-                    elif extracted_text[0].strip() == "":
-                        print(f"You have added an empty entry: {line}")
-                        return 1
+                extracted_text = entries[line]
+
+                if extracted_text is None:
+                    continue
+
+                if extracted_text not in latest_entries:
+                    print(
+                        f"Entry '{line}' should be added "
+                        f"to section {latest_section_main}"
+                    )
+                    return 1
+
+                elif extracted_text.strip() == "":
+                    print(f"You have added an empty entry: {line}")
+                    return 1
 
     except subprocess.CalledProcessError:
         pass
@@ -2,17 +2,53 @@ import os
 import requests
 
 
+def _headers():
+    headers = {
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+    token = os.environ.get("GITHUB_TOKEN")
+
+    # authenticated requests have a much higher rate limit
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+
+    return headers
+
+
+def _get_or_none(url, timeout):
+    response = requests.get(url, headers=_headers(), timeout=timeout)
+
+    if response.status_code == 404:
+        return None
+
+    response.raise_for_status()
+    return response.json()
+
+
 def get_pr(owner, repo, number):
     """Get pull request information"""
     return requests.get(
         f"https://api.github.com/repos/{owner}/{repo}/pulls/{number}",
-        headers={
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": "2022-11-28",
-        },
+        headers=_headers(),
     ).json()
 
 
+def get_issue(owner, repo, number, timeout=10):
+    """
+    Get issue or pull request information (pull requests have a "pull_request"
+    key), returns None if it doesn't exist
+    """
+    return _get_or_none(
+        f"https://api.github.com/repos/{owner}/{repo}/issues/{number}", timeout
+    )
+
+
+def get_user(username, timeout=10):
+    """Get user information, returns None if the user doesn't exist"""
+    return _get_or_none(f"https://api.github.com/users/{username}", timeout)
+
+
 def get_repo_and_branch_for_pr(owner, repo, number):
     """Return the fork repo and branch branch for a given pull request number"""
     response = get_pr(owner, repo, number)
@@ -1,23 +1,123 @@
+import sys
 import time
-from datetime import datetime
+import asyncio
 import json
 import subprocess
 import concurrent.futures
 from pathlib import Path
 from glob import iglob
 import re
-from itertools import chain
-from collections import defaultdict
-from urllib.parse import urlparse
-
+import math
+import copy
+from array import array
+from collections import namedtuple
+from fnmatch import fnmatchcase
+from itertools import chain, repeat
+from functools import lru_cache
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import click
 import requests
 
+from pkgmt.links_ratelimit import (
+    HostRateLimiter,
+    HostQueue,
+    RetryPolicy,
+    Stopper,
+    RETRY_CODES,
+    run_in_threads,
+)
+from pkgmt.links_report import TextReporter, UNKNOWN
+from pkgmt import links_anchors
+
+try:
+    import httpx
+except ModuleNotFoundError:
+    httpx = None
+
+try:
+    import h2
+except ModuleNotFoundError:
+    h2 = None
+
+ENGINES = ("thread", "async")
+
+# connect and read timeouts (in seconds)
+DEFAULT_TIMEOUT = (10, 30)
+
+# query parameters that don't change the resource, removed before checking a
+# link (e.g., the ones added by pkgmt utm). Supports wildcards
+TRACKING_PARAMS = ("utm_*",)
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
 
 class Response:
-    def __init__(self, url, code, broken) -> None:
+    """Result of checking a link
+
+    Attributes
+    ----------
+    final_url : str
+        URL after following redirects
+
+    redirects : list
+        URLs that redirected, in order (empty if there were no redirects)
+
+    not_modified : bool
+        True if the server replied to a conditional request with 304, in which
+        case ``code`` is the one from the previous run
+
+    timed_out : bool
+        True if the request timed out (``code`` is None)
+
+    retry_after : float
+        Seconds the server asked to wait (via the Retry-After header)
+
+    latency : float
+        Seconds it took to check the link (None if it comes from the cache)
+
+    reason : str
+        Why the link is broken if the status code doesn't say it (e.g., "missing
+        anchor")
+
+    local : bool
+        True if the link points to a file in the repository, in which case
+        ``final_url`` is the path it resolves to
+    """
+
+    def __init__(
+        self,
+        url,
+        code,
+        broken,
+        cached=False,
+        final_url=None,
+        redirects=None,
+        etag=None,
+        last_modified=None,
+        not_modified=False,
+        timed_out=False,
+        retry_after=None,
+        latency=None,
+        reason=None,
+        local=False,
+    ) -> None:
         self.url = url
         self.code = code
         self.broken = broken
+        self.cached = cached
+        self.final_url = final_url or url
+        self.redirects = redirects or []
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+        self.timed_out = timed_out
+        self.retry_after = retry_after
+        self.latency = latency
+        self.reason = reason
+        self.local = local
 
     def __hash__(self) -> int:
         return hash(self.url)
@@ -26,13 +126,55 @@ class Response:
         return self.url == another
 
     def __repr__(self) -> str:
-        return f"({self.code}) {self.url}"
+        return f"({self.reason or self.code}) {self.url}"
+
+
+# where a link appears: 1-based line and column (None if unknown) and, for
+# notebooks, the index of the cell (lines are relative to the cell)
+Location = namedtuple("Location", ["file", "line", "column", "cell"])
 
 
 class LinksInFile:
-    def __init__(self, *, valid, invalid) -> None:
+    """Links found in a file. The position of each valid link is stored in
+    arrays parallel to ``valid``: ``lines`` and ``columns`` (1-based, 0 if
+    unknown) and ``cells`` (index of the notebook cell, -1 if not a notebook)
+    """
+
+    def __init__(self, *, valid, invalid, lines=None, columns=None, cells=None) -> None:
         self.valid = valid
         self.invalid = invalid
+        self.lines = _positions(lines, len(valid), default=0)
+        self.columns = _positions(columns, len(valid), default=0)
+        self.cells = _positions(cells, len(valid), default=-1)
+
+    def extend(self, other, cell=-1):
+        """Add the links in ``other`` (e.g., found in a notebook cell)"""
+        self.valid.extend(other.valid)
+        self.invalid.extend(other.invalid)
+        self.lines.extend(other.lines)
+        self.columns.extend(other.columns)
+        self.cells.extend(_positions(None, len(other.valid), default=cell))
+
+    def without(self, links):
+        """Returns a copy without the given links"""
+        keep = [idx for idx, link in enumerate(self.valid) if link not in links]
+
+        return LinksInFile(
+            valid=[self.valid[idx] for idx in keep],
+            invalid=[link for link in self.invalid if link not in links],
+            lines=[self.lines[idx] for idx in keep],
+            columns=[self.columns[idx] for idx in keep],
+            cells=[self.cells[idx] for idx in keep],
+        )
+
+    def locations(self, file):
+        """Yield ``(link, Location)`` tuples"""
+        for link, line, column, cell in zip(
+            self.valid, self.lines, self.columns, self.cells
+        ):
+            yield link, Location(
+                file, line or None, column or None, cell if cell >= 0 else None
+            )
 
     def __iter__(self):
         for link in self.valid:
@@ -49,31 +191,77 @@ def _make_glob_exp(extension):
     return f"**/*.{extension}"
 
 
-def _find_match(links, broken):
-    result = []
+def _positions(values, size, default):
+    # C ints (32-bit on the platforms we support), a fraction of the memory of
+    # a list of ints
+    if values is None:
+        return array("i", [default]) * size
 
-    for link in links:
-        if link in broken:
-            result.append(broken[link])
+    return array("i", values)
 
-    return result
 
+def _index_locations(mapping):
+    """Map each URL to the ``Location`` objects where it appears"""
+    locations = {}
 
-def _read_file(file):
-    file = Path(file)
+    for file, links in mapping.items():
+        for link, location in links.locations(file):
+            locations.setdefault(link, []).append(location)
 
-    if file.suffix == ".ipynb":
+    return locations
+
+
+def _parse_content(content, suffix):
+    if suffix == ".ipynb":
         # we need to load the notebook's content; otherwise special characters
         # are not resolved correctly since they're double escaped in the
-        # JSON file. Also, notebooks are always encoded as UTF-8
-        nb = json.loads(file.read_text(encoding="utf-8"))
+        # JSON file
+        nb = json.loads(content)
         return "\n".join(["\n".join(cell["source"]) for cell in nb["cells"]])
     else:
-        return file.read_text()
+        return content
+
+
+def _find_in_file(file, ignore_substrings=None):
+    """Find links in a file, notebooks are scanned cell by cell so locations
+    are relative to the cell
+    """
+    file = Path(file)
+
+    if file.suffix != ".ipynb":
+        return _find(file.read_text(), ignore_substrings=ignore_substrings)
+
+    found = LinksInFile(valid=[], invalid=[])
+    # notebooks are always encoded as UTF-8
+    cells = links_anchors.notebook_cells(file.read_text(encoding="utf-8"))
+
+    for idx, (_, text) in enumerate(cells):
+        found.extend(_find(text, ignore_substrings=ignore_substrings), cell=idx)
+
+    return found
 
 
 def find_broken_in_files(
-    extensions, ignore_substrings=None, verbose=False, broken_http_codes=None
+    extensions,
+    ignore_substrings=None,
+    verbose=False,
+    broken_http_codes=None,
+    cache=None,
+    engine="thread",
+    max_workers=20,
+    rate_limiter=None,
+    since=None,
+    jobs=1,
+    index=False,
+    timeout=DEFAULT_TIMEOUT,
+    retry_policy=None,
+    reporter=None,
+    tracking_params=None,
+    anchors=False,
+    offline=False,
+    external_anchors=False,
+    fail_fast=False,
+    deadline=None,
 ):
     """
     Parameters
@@ -87,122 +275,604 @@ def find_broken_in_files(
         `["md", "rst"]`
 
     verbose : bool, deefault=False
-        Prints broken links
+        Prints broken links (ignored if passing ``reporter``)
 
     broken_http_codes : list, default=None
         Only consider these HTTP codes as broken links, example: `[404]`.
         By default, it considers all non-200 HTTP codes as broken.
+
+    cache : pkgmt.links_cache.LinkCache, default=None
+        If passed, URLs with a fresh cached result are not requested again, and
+        new results are stored in the cache
+
+    engine : {"thread", "async"}, default="thread"
+        How to check links. "thread" uses a thread pool, "async" uses asyncio
+        and keeps pooled keep-alive connections per host (requires httpx)
+
+    max_workers : int, default=20
+        Maximum number of links checked at the same time
+
+    rate_limiter : pkgmt.links_ratelimit.HostRateLimiter, default=None
+        Limits the number of requests per second to each host. If None, it
+        makes at most one request per second to each host
+
+    since : str, default=None
+        A git ref (e.g., "main"). If passed, it only checks links added in files
+        modified since the point where the current branch diverged from it
+
+    jobs : int, default=1
+        Number of processes used to read files and extract links from them
+
+    index : bool, default=False
+        In a git repository, only committed files are considered. If True, files
+        in the git index are considered as well (e.g., files that are staged but
+        not committed yet)
+
+    reporter : pkgmt.links_report.Reporter, default=None
+        Receives every result as soon as it's available (e.g., to write JSON
+        Lines), see ``pkgmt.links_report.FORMATS``
+
+    tracking_params : list, default=None
+        Query parameters to ignore when comparing links (besides the ones in
+        ``TRACKING_PARAMS``), e.g., ``["ref", "fbclid"]``. Links that only
+        differ in those, letter case in the scheme or host, the fragment, or a
+        trailing slash, are checked once
+
+    anchors : bool, default=False
+        If True, it also checks relative links (e.g., "../doc/x.md#install")
+        and #fragments in Markdown, reStructuredText and notebook files, without
+        network requests
+
+    offline : bool, default=False
+        If True, it only checks relative links and #fragments (implies
+        ``anchors=True``)
+
+    external_anchors : bool, default=False
+        If True, it downloads pages with links to a #fragment (once per page,
+        anchors are stored in ``cache``) and checks that the fragment exists
+
+    fail_fast : bool, default=False
+        If True, it stops after finding the first broken link
+
+    deadline : float, default=None
+        Maximum number of seconds to spend checking links. Links that weren't
+        checked in time are reported with reason "unknown" (they aren't
+        considered broken)
     """
     if isinstance(extensions, str):
         extensions = [extensions]
 
-    mapping = _find_links_in_files(extensions, ignore_substrings=ignore_substrings)
+    if since:
+        mapping = _find_links_added_since(
+            since, extensions, ignore_substrings=ignore_substrings
+        )
+    else:
+        mapping = _find_links_in_files(
+            extensions, ignore_substrings=ignore_substrings, jobs=jobs, index=index
+        )
+
+    if reporter is None and verbose:
+        reporter = TextReporter()
+
+    locations = _index_locations(mapping)
 
-    broken = {
-        response.url: response
-        for response in _find_broken_links(mapping, broken_http_codes=broken_http_codes)
-    }
+    if reporter is not None:
+        reporter.start(mapping)
 
-    if verbose:
-        for file, links in mapping.items():
-            if links.invalid:
-                print(f"*** Found invalid links in {file} ***")
-                print("\n".join(links.invalid))
+        def on_result(response):
+            reporter.report(response, locations.get(response.url, []))
 
-        print("=" * 80)
+    else:
+        on_result = None
 
-        for file, links in mapping.items():
-            match = _find_match(links, broken)
+    if offline:
+        broken = {}
+    else:
+        broken = {
+            response.url: response
+            for response in _find_broken_links(
+                mapping,
+                broken_http_codes=broken_http_codes,
+                cache=cache,
+                engine=engine,
+                max_workers=max_workers,
+                rate_limiter=rate_limiter,
+                timeout=timeout,
+                retry_policy=retry_policy,
+                on_result=on_result,
+                tracking_params=TRACKING_PARAMS + tuple(tracking_params or ()),
+                external_anchors=external_anchors,
+                fail_fast=fail_fast,
+                deadline=deadline,
+            )
+        }
 
-            if match:
-                print(f"*** {file} ***")
-                print("\n".join([repr(m) for m in match]))
+    if anchors or offline:
+        # with since, only validate files that changed
+        local = _find_broken_local_links(
+            extensions,
+            ignore_substrings=ignore_substrings,
+            files=list(mapping) if since else None,
+            index=index,
+        )
 
-        print("=" * 80)
+        for location, response in local:
+            if reporter is not None:
+                reporter.report(response, [location])
+
+            broken[response.final_url] = response
+
+    if reporter is not None:
+        reporter.finish()
 
     return broken
 
 
-def _find_links_in_files(extensions, ignore_substrings=None):
-    globs = (iglob(_make_glob_exp(ext), recursive=True) for ext in extensions)
+def _find_links_in_files(extensions, ignore_substrings=None, jobs=1, index=False):
+    files = _list_files(extensions, index=index)
+
+    if jobs > 1 and len(files) > 1:
+        # small batches amortize the inter-process overhead while keeping the
+        # workers balanced when file sizes vary
+        size = max(1, math.ceil(len(files) / (jobs * 4)))
+        batches = [files[i : i + size] for i in range(0, len(files), size)]
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            # map returns results in submission order, so the mapping has the
+            # same order as when scanning sequentially
+            results = executor.map(
+                _scan_files, batches, repeat(ignore_substrings, len(batches))
+            )
+            return dict(chain.from_iterable(results))
+    else:
+        return dict(_scan_files(files, ignore_substrings))
+
+
+def _scan_files(files, ignore_substrings):
+    return [
+        (file, _find_in_file(file, ignore_substrings=ignore_substrings))
+        for file in files
+    ]
+
+
+def _find_links_added_since(ref, extensions, ignore_substrings=None):
+    """
+    Find links in files modified since the merge base of ``ref`` and HEAD
+    (including uncommitted changes), ignoring links that the file already had
+    """
+    base = _git(["merge-base", ref, "HEAD"], ref=ref).strip()
+    pathspecs = [f"*.{ext}" for ext in extensions]
+    # --relative so paths (and pathspecs) are relative to the current directory,
+    # like the ones we get when globbing
+    changed = _git(
+        ["diff", "--relative", "--name-only", "-z", "--diff-filter=d", base, "--"]
+        + pathspecs,
+        ref=ref,
+    )
+
     content = dict()
 
-    tracked_by_git, error = _git_tracked_files()
+    for file in filter(None, changed.split("\0")):
+        if not Path(file).is_file():
+            continue
 
-    for file in chain(*globs):
-        if error or file in tracked_by_git:
-            text = _read_file(file)
-            content[file] = _find(text, ignore_substrings=ignore_substrings)
+        links = _find_in_file(file, ignore_substrings=ignore_substrings)
+
+        res = subprocess.run(
+            ["git", "show", f"{base}:./{file}"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+        # the file didn't exist in the base ref
+        if res.returncode:
+            previous = set()
+        else:
+            text = _parse_content(res.stdout.decode(), Path(file).suffix)
+            previous = _find(text, ignore_substrings=ignore_substrings)
+            previous = set(previous.valid) | set(previous.invalid)
+
+        content[file] = links.without(previous)
 
     return content
 
 
-def _find_broken_links(mapping, broken_http_codes):
-    urls = {item for sublist in mapping.values() for item in sublist}
+def _git(args, ref):
+    res = subprocess.run(
+        ["git", *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    if res.returncode:
+        raise click.ClickException(
+            f"Could not find changes since {ref!r}: {res.stderr.decode().strip()}"
+        )
+
+    return res.stdout.decode()
+
+
+def _find_broken_links(
+    mapping,
+    broken_http_codes,
+    cache=None,
+    engine="thread",
+    max_workers=20,
+    rate_limiter=None,
+    timeout=DEFAULT_TIMEOUT,
+    retry_policy=None,
+    on_result=None,
+    tracking_params=TRACKING_PARAMS,
+    external_anchors=False,
+    fail_fast=False,
+    deadline=None,
+):
+    """Check the links in ``mapping`` and return the broken ones, ``on_result``
+    is called with every result (including cached ones) as soon as it's ready.
+    Each canonical URL is checked once, its result is reported for every
+    spelling found in the files. If ``external_anchors`` is True, spellings
+    with a #fragment are reported once the anchors in the page are known. If
+    it stops early (``fail_fast`` or ``deadline``), links that weren't checked
+    are reported with reason "unknown"
+    """
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Invalid engine: {engine!r}. Valid values are: {', '.join(ENGINES)}"
+        )
+
+    spellings = {}
+
+    for url in {item for sublist in mapping.values() for item in sublist}:
+        canonical = canonicalize_url(url, tracking_params=tracking_params)
+        spellings.setdefault(canonical, []).append(url)
+
+    # the canonical URL is only used to group spellings and as the cache key,
+    # requests go to a URL as written in the files (e.g., servers might treat
+    # /docs and /docs/ differently)
+    requested = {canonical: sorted(urls)[0] for canonical, urls in spellings.items()}
+    canonical_of = {url: canonical for canonical, url in requested.items()}
+
+    urls = set(spellings)
+    rate_limiter = rate_limiter or HostRateLimiter()
+    retry_policy = retry_policy or RetryPolicy()
+    stopper = Stopper(fail_fast=fail_fast, deadline=deadline)
 
     broken = []
 
-    checker = LinkChecker()
+    stale = {}
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-        future_to_url = {
-            executor.submit(
-                checker.check_if_broken, url, broken_http_codes=broken_http_codes
-            ): url
-            for url in urls
-        }
+    # responses waiting for the anchors in their page, by page
+    pending_anchors = {}
+
+    def emit(response):
+        if on_result is not None:
+            on_result(response)
 
-        for future in concurrent.futures.as_completed(future_to_url):
-            url = future_to_url[future]
-            try:
-                response = future.result()
-            except Exception as exc:
-                print("%r generated an exception: %s" % (url, exc))
+        if response.broken:
+            broken.append(response)
+            stopper.found_broken = True
+
+    def report(response):
+        for url in sorted(spellings[canonical_of[response.url]]):
+            if url != response.url:
+                response = copy.copy(response)
+                response.url = url
+
+            if external_anchors and not response.broken and urlsplit(url).fragment:
+                pending_anchors.setdefault(response.final_url, []).append(response)
             else:
-                if response.broken:
-                    broken.append(response)
+                emit(response)
+
+    if cache is not None:
+        cached, stale = cache.lookup(urls)
+        urls = set(stale)
+
+        for canonical, entry in cached.items():
+            response = Response(
+                requested[canonical],
+                entry.code,
+                is_broken(entry.url, entry.code, broken_http_codes),
+                cached=True,
+                final_url=entry.final_url,
+            )
+            report(response)
+
+    def on_response(response):
+        if cache is not None:
+            cache.set(
+                canonical_of[response.url],
+                response.code,
+                is_broken(response.url, response.code),
+                etag=response.etag,
+                last_modified=response.last_modified,
+                final_url=response.final_url,
+            )
+
+        report(response)
+
+    stale = {requested[canonical]: entry for canonical, entry in stale.items()}
+    urls = {requested[canonical] for canonical in urls}
+
+    if stopper.should_stop():
+        # e.g., a cached result is broken and we're failing fast
+        unchecked = urls
+    elif engine == "async":
+        unchecked = AsyncLinkChecker(
+            max_connections=max_workers, timeout=timeout
+        ).check_many(
+            urls,
+            on_response,
+            broken_http_codes=broken_http_codes,
+            rate_limiter=rate_limiter,
+            previous=stale,
+            retry_policy=retry_policy,
+            stopper=stopper,
+        )
+    else:
+        unchecked = _check_with_threads(
+            urls,
+            on_response,
+            broken_http_codes=broken_http_codes,
+            max_workers=max_workers,
+            rate_limiter=rate_limiter,
+            previous=stale,
+            timeout=timeout,
+            retry_policy=retry_policy,
+            stopper=stopper,
+        )
+
+    for url in sorted(unchecked):
+        report(Response(url, None, False, reason=UNKNOWN))
+
+    if pending_anchors and not stopper.should_stop():
+        page_anchors = links_anchors.fetch_many(
+            pending_anchors,
+            cache=cache,
+            max_workers=max_workers,
+            timeout=timeout,
+            rate_limiter=rate_limiter,
+            stopper=stopper,
+        )
+    else:
+        page_anchors = {}
+
+    for page, responses in pending_anchors.items():
+        for response in responses:
+            fragment = urlsplit(response.url).fragment
+            response = copy.copy(response)
+
+            if page not in page_anchors:
+                # no time left to download the page
+                response.reason = UNKNOWN
+            # pages that we couldn't download get the benefit of the doubt
+            elif page_anchors[page] is not None and not links_anchors.has_anchor(
+                page_anchors[page], fragment
+            ):
+                response.broken = True
+                response.reason = "missing anchor"
+
+            emit(response)
+
+    if cache is not None:
+        cache.commit()
 
     return broken
 
 
+def _find_broken_local_links(
+    extensions, ignore_substrings=None, files=None, index=False
+):
+    """
+    Validate relative links and #fragments against an index of the anchors in
+    every Markdown, reStructuredText and notebook file. Yields
+    ``(Location, response)`` tuples with the broken ones
+
+    Parameters
+    ----------
+    files : list, default=None
+        Files to validate, defaults to all files with the given extensions
+    """
+    suffixes = tuple(f".{ext}" for ext in extensions)
+    indexed = _list_files(
+        [suffix.lstrip(".") for suffix in links_anchors.SUFFIXES], index=index
+    )
+    anchor_index, links_by_file = links_anchors.AnchorIndex.from_files(indexed)
+
+    if files is None:
+        files = [file for file in indexed if file.endswith(suffixes)]
+
+    ignore = _compile_ignore(tuple(ignore_substrings or ()))
+
+    for file in files:
+        if not file.endswith(links_anchors.SUFFIXES):
+            continue
+
+        if file in links_by_file:
+            targets = links_by_file[file]
+        else:
+            _, targets = links_anchors.parse_file(file)
+
+        for target, line, column, cell in targets:
+            if not links_anchors.is_local(target):
+                continue
+
+            if ignore is not None and ignore.search(target):
+                continue
+
+            resolved, reason = links_anchors.validate_local(file, target, anchor_index)
+
+            if reason is not None:
+                yield Location(file, line, column, cell), Response(
+                    target,
+                    None,
+                    True,
+                    final_url=resolved,
+                    reason=reason,
+                    local=True,
+                )
+
+
+def _check_with_threads(
+    urls,
+    on_response,
+    broken_http_codes,
+    max_workers,
+    rate_limiter,
+    previous=None,
+    timeout=DEFAULT_TIMEOUT,
+    retry_policy=None,
+    stopper=None,
+):
+    """Check URLs with a thread pool, returns the ones that weren't checked
+    because ``stopper`` stopped the run early
+    """
+    stopper = stopper or Stopper()
+    checker = LinkChecker(timeout=timeout, deadline=stopper.deadline)
+    retry_policy = retry_policy or RetryPolicy()
+    queue = HostQueue(urls, rate_limiter)
+    previous = previous or {}
+
+    def check(url):
+        return checker.check_if_broken(
+            url, broken_http_codes=broken_http_codes, previous=previous.get(url)
+        )
+
+    def on_done(url, future):
+        try:
+            response = future.result()
+        except Exception as exc:
+            print("%r generated an exception: %s" % (url, exc), file=sys.stderr)
+        else:
+            _retry_or_report(response, queue, retry_policy, on_response)
+
+    return run_in_threads(queue, check, on_done, max_workers, stopper=stopper)
+
+
+def _retry_or_report(response, queue, retry_policy, on_response):
+    """Put the URL back in the queue if it's worth retrying, otherwise report it.
+    Retries go through the queue so workers never sleep while waiting
+    """
+    attempt = queue.attempts(response.url)
+
+    if retry_policy.should_retry(response, attempt):
+        queue.retry(response.url, retry_policy.delay(response, attempt))
+    else:
+        on_response(response)
+
+
+# Only matches http(s) links. Every repetition consumes either a single character
+# or a balanced (possibly nested once) parenthesized group, and parentheses are
+# excluded from the single character class, so there is exactly one way to match
+# a given prefix: no catastrophic backtracking, matching is linear in the text
+# length. Adapted from: https://www.geeksforgeeks.org/python-check-url-string/
+_URL = re.compile(r"\bhttps?://(?:[^\s()<>]|\((?:[^\s()<>]|\([^\s()<>]*\))*\))+")
+
+# links cannot end with these characters (they're most likely punctuation). A
+# closing parenthesis is allowed since it always closes a group in the link
+_TRAILING = "`!([]{};:'\".,<>?«»“”‘’"
+
+
+@lru_cache(maxsize=None)
+def _compile_ignore(ignore_substrings):
+    """Combine substrings into a single regex, so we scan each link once"""
+    if not ignore_substrings:
+        return None
+
+    return re.compile("|".join(re.escape(substr) for substr in ignore_substrings))
+
+
+def _iter_links(text, ignore_substrings=None):
+    """Yield ``(link, line, column)`` tuples lazily"""
+    ignore = _compile_ignore(tuple(ignore_substrings or ()))
+    line, position, line_start = 1, 0, 0
+
+    for match in _URL.finditer(text):
+        start = match.start()
+        # count newlines incrementally (using the span of the match) so the
+        # whole pass stays linear
+        newlines = text.count("\n", position, start)
+
+        if newlines:
+            line += newlines
+            line_start = text.rindex("\n", position, start) + 1
+
+        position = start
+        link = match.group().rstrip(_TRAILING)
+
+        # we need at least two characters after the scheme
+        if len(link) - link.index("://") - len("://") < 2:
+            continue
+
+        if ignore is not None and ignore.search(link):
+            continue
+
+        yield link, line, start - line_start + 1
+
+
 def _find(text, ignore_substrings=None):
     """Find links in text"""
-    ignore_substrings = ignore_substrings or []
-    # source: https://www.geeksforgeeks.org/python-check-url-string/
-    regex = r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))"  # noqa
-    url = re.findall(regex, text)
-
-    candidates = [
-        x[0]
-        for x in url
-        if not any(substr in x[0] for substr in ignore_substrings)
-        # TODO: we should add this to the regex, and remove it from here
-        and x[0].startswith("http")
-    ]
+    valid, invalid, lines, columns = _split_valid_invalid(
+        _iter_links(text, ignore_substrings=ignore_substrings)
+    )
 
-    valid, invalid = _split_valid_invalid(candidates)
+    return LinksInFile(valid=valid, invalid=invalid, lines=lines, columns=columns)
 
-    return LinksInFile(valid=valid, invalid=invalid)
+
+def canonicalize_url(url, tracking_params=TRACKING_PARAMS):
+    """
+    Normalize a URL so different spellings of the same resource are equal:
+    lowercase scheme and host, no default port, no fragment, no tracking query
+    parameters and no trailing slash
+    """
+    parts = urlsplit(url)
+
+    try:
+        port = parts.port
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = parts.hostname or ""
+
+    if ":" in host:
+        host = f"[{host}]"
+
+    if port is not None and _DEFAULT_PORTS.get(scheme) != port:
+        host = f"{host}:{port}"
+
+    userinfo, at, _ = parts.netloc.rpartition("@")
+    query = "&".join(
+        param
+        for param in parts.query.split("&")
+        if param and not _is_tracking(param.split("=")[0], tracking_params)
+    )
+
+    return urlunsplit(
+        (scheme, f"{userinfo}{at}{host}", parts.path.rstrip("/"), query, "")
+    )
+
+
+def _is_tracking(name, tracking_params):
+    return any(fnmatchcase(name, pattern) for pattern in tracking_params)
 
 
 def _is_invalid(link):
     # these are most likely templates or examples
-    if any(char in link for char in {"{", "}", "{{", "}}"}):
-        return True
-
-    return False
+    return "{" in link or "}" in link
 
 
 def _split_valid_invalid(candidates):
-    valid, invalid = [], []
+    valid, invalid, lines, columns = [], [], [], []
 
-    for candidate in candidates:
+    for candidate, line, column in candidates:
         if _is_invalid(candidate):
             invalid.append(candidate)
         else:
             valid.append(candidate)
+            lines.append(line)
+            columns.append(column)
 
-    return valid, invalid
+    return valid, invalid, lines, columns
 
 
 # domains that we know return 403 (forbidden) if they're accessed from requests
@@ -218,63 +888,473 @@ def known_403(url):
     return False
 
 
-class LinkChecker:
-    def __init__(self) -> None:
-        self.last_timestamp = defaultdict(lambda: datetime.min)
+def is_broken(url, code, broken_http_codes=None):
+    """Determine if a link is broken given the HTTP code it returned (None if
+    the request failed)
+    """
+    if broken_http_codes:
+        return code in broken_http_codes
 
-    def check_if_broken(self, url, broken_http_codes=None):
-        """Check if a link is broken"""
-        netloc = urlparse(url).netloc
-        then = self.last_timestamp[netloc]
-        now = datetime.now()
-        seconds = (now - then).seconds
-        self.last_timestamp[netloc] = now
+    # https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/405
+    if code == 405:
+        return False
+    elif code == 403 and known_403(url):
+        return False
+
+    return code is None or code >= 400
+
+
+MAX_REDIRECTS = 10
+
+# codes returned by servers that don't support (or mishandle) HEAD requests
+_FALLBACK_TO_GET = {403, 405, 501}
+
+_REDIRECT_CODES = {301, 302, 303, 307, 308}
+
+
+def _probe(url, previous=None, max_redirects=MAX_REDIRECTS, resolved=None):
+    """
+    Decides which requests to make to check a link, independently of the HTTP
+    client. It yields ``(method, url, headers)`` tuples and expects to be sent
+    back ``(status_code, headers)``; it returns a ``Response`` (without the
+    ``broken`` flag).
+
+    It sends a HEAD request, falling back to a GET request for the first byte if
+    the server rejects HEAD. If ``previous`` (a ``CacheEntry``) has validators,
+    it sends a conditional request so unchanged resources return a cheap 304.
+    Redirects are followed (up to ``max_redirects``) and recorded. If a redirect
+    leads to a URL in ``resolved`` (see ``_remember``), its result is reused
+    """
+    redirects = []
+    current = url
+
+    while True:
+        # only after a redirect: a URL that was explicitly requested is checked
+        if redirects and resolved is not None and current in resolved:
+            known = resolved[current]
+            return Response(
+                url,
+                known.code,
+                None,
+                final_url=known.final_url,
+                redirects=redirects + known.redirects,
+                etag=known.etag,
+                last_modified=known.last_modified,
+            )
+
+        headers = {}
+
+        # validators belong to the URL we ended up in the previous run
+        if previous is not None and current == (previous.final_url or url):
+            if previous.etag:
+                headers["If-None-Match"] = previous.etag
+
+            if previous.last_modified:
+                headers["If-Modified-Since"] = previous.last_modified
+
+        code, res_headers = yield "HEAD", current, headers
+
+        if code in _FALLBACK_TO_GET:
+            code, res_headers = yield "GET", current, {**headers, "Range": "bytes=0-0"}
+
+            # some servers reject ranges for empty resources
+            if code == 416:
+                code, res_headers = yield "GET", current, headers
+
+        location = res_headers.get("location")
+
+        if code in _REDIRECT_CODES and location:
+            redirects.append(current)
+            current = urljoin(current, location)
+
+            if len(redirects) > max_redirects:
+                return Response(url, None, None, final_url=current, redirects=redirects)
+
+            continue
+
+        not_modified = code == 304 and previous is not None
+        retry_after = _parse_retry_after(res_headers.get("retry-after"))
+
+        if not_modified:
+            code = previous.code
+
+        return Response(
+            url,
+            code,
+            None,
+            final_url=current,
+            redirects=redirects,
+            etag=res_headers.get("etag") or (previous.etag if not_modified else None),
+            last_modified=res_headers.get("last-modified")
+            or (previous.last_modified if not_modified else None),
+            not_modified=not_modified,
+            retry_after=retry_after,
+        )
+
+
+def _remember(resolved, response):
+    """
+    Store the result of each URL in the redirect chain of ``response``, so
+    other links that redirect to any of them aren't requested again. Transient
+    failures aren't stored
+    """
+    if response.code is None or response.code in RETRY_CODES:
+        return
+
+    chain = response.redirects + [response.final_url]
+
+    for idx, url in enumerate(chain):
+        resolved.setdefault(
+            url,
+            Response(
+                url,
+                response.code,
+                None,
+                final_url=response.final_url,
+                redirects=chain[idx:-1],
+                etag=response.etag,
+                last_modified=response.last_modified,
+            ),
+        )
+
+
+def _parse_retry_after(value):
+    """Parse the Retry-After header (seconds or HTTP date), returns seconds"""
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
 
-        if seconds < 1:
-            time.sleep(1 - seconds)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class LinkChecker:
+    """
+    Parameters
+    ----------
+    deadline : float, default=None
+        Value of ``time.monotonic()`` after which requests must not continue,
+        request timeouts are shortened to end by then
+    """
+
+    def __init__(
+        self, max_redirects=MAX_REDIRECTS, timeout=DEFAULT_TIMEOUT, deadline=None
+    ) -> None:
+        self.max_redirects = max_redirects
+        self.timeout = timeout
+        self.deadline = deadline
+        # results by URL (including redirect hops), shared by all threads
+        self._resolved = {}
+
+    def check_if_broken(self, url, broken_http_codes=None, previous=None):
+        """Check if a link is broken
+
+        Parameters
+        ----------
+        previous : pkgmt.links_cache.CacheEntry, default=None
+            Result from a previous run, used to send a conditional request
+        """
+        probe = _probe(
+            url,
+            previous=previous,
+            max_redirects=self.max_redirects,
+            resolved=self._resolved,
+        )
+        start = time.perf_counter()
 
         try:
-            res = requests.head(url)
-            code = res.status_code
-            broken = not res.ok
-        except requests.exceptions.ConnectionError:
-            code = None
-            broken = True
-        except requests.exceptions.MissingSchema:
-            code = None
-            broken = True
-
-        if broken_http_codes:
-            broken = code in broken_http_codes
+            request = next(probe)
+
+            while True:
+                request = probe.send(self._send(*request))
+        except StopIteration as e:
+            response = e.value
+        # must go first since ConnectTimeout is also a ConnectionError
+        except requests.exceptions.Timeout:
+            response = Response(url, None, None, timed_out=True)
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.MissingSchema,
+            requests.exceptions.InvalidSchema,
+            requests.exceptions.InvalidURL,
+        ):
+            response = Response(url, None, None)
+
+        response.broken = is_broken(url, response.code, broken_http_codes)
+        response.latency = time.perf_counter() - start
+        _remember(self._resolved, response)
+
+        return response
+
+    def _timeout(self):
+        if self.deadline is None:
+            return self.timeout
+
+        remaining = max(1e-3, self.deadline - time.monotonic())
+        connect, read = _split_timeout(self.timeout)
+        return min(connect, remaining), min(read, remaining)
+
+    def _send(self, method, url, headers):
+        if method == "HEAD":
+            res = requests.head(
+                url, headers=headers, allow_redirects=False, timeout=self._timeout()
+            )
         else:
-            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/405
-            if code == 405:
-                broken = False
-            elif code == 403 and known_403(url):
-                broken = False
+            # stream so we don't download the body
+            with requests.get(
+                url,
+                headers=headers,
+                allow_redirects=False,
+                stream=True,
+                timeout=self._timeout(),
+            ) as res:
+                pass
+
+        return res.status_code, res.headers
+
+
+class AsyncLinkChecker:
+    """Check links with asyncio, reusing keep-alive connections (HTTP/2 if the
+    h2 package is installed)
+
+    Parameters
+    ----------
+    max_connections : int, default=20
+        Maximum number of requests in flight
 
-        response = Response(url, code, broken)
+    max_connections_per_host : int, default=4
+        Maximum number of requests in flight to the same host
+
+    max_redirects : int, default=10
+        Maximum number of redirects to follow
+
+    timeout : tuple, default=(10, 30)
+        Connect and read timeouts (in seconds)
+    """
+
+    def __init__(
+        self,
+        max_connections=20,
+        max_connections_per_host=4,
+        max_redirects=MAX_REDIRECTS,
+        timeout=DEFAULT_TIMEOUT,
+    ) -> None:
+        if httpx is None:
+            raise ModuleNotFoundError(
+                "The async engine requires httpx. "
+                "Install it with: pip install 'pkgmt[async]'"
+            )
+
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.max_redirects = max_redirects
+        self.timeout = timeout
+        self._resolved = {}
+
+    def check_many(
+        self,
+        urls,
+        on_response,
+        broken_http_codes=None,
+        rate_limiter=None,
+        previous=None,
+        retry_policy=None,
+        stopper=None,
+    ):
+        """Check all urls, calling ``on_response`` with each ``Response`` as soon
+        as it's ready. Returns the URLs that weren't checked because
+        ``stopper`` stopped the run early
+        """
+        return asyncio.run(
+            self._check_many(
+                urls,
+                on_response,
+                broken_http_codes,
+                rate_limiter or HostRateLimiter(),
+                previous or {},
+                retry_policy or RetryPolicy(),
+                stopper or Stopper(),
+            )
+        )
+
+    async def _check_many(
+        self,
+        urls,
+        on_response,
+        broken_http_codes,
+        rate_limiter,
+        previous,
+        retry_policy,
+        stopper,
+    ):
+        queue = HostQueue(
+            urls, rate_limiter, max_per_host=self.max_connections_per_host
+        )
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+        )
+        task_to_url = {}
+
+        connect, read = _split_timeout(self.timeout)
+        timeout = httpx.Timeout(connect=connect, read=read, write=read, pool=None)
+
+        async with httpx.AsyncClient(
+            http2=h2 is not None, limits=limits, timeout=timeout
+        ) as client:
+            while (queue or task_to_url) and not stopper.should_stop():
+                while len(task_to_url) < self.max_connections:
+                    url, wait = queue.pop_ready()
+
+                    if url is None:
+                        break
+
+                    task = asyncio.ensure_future(
+                        self.check_if_broken(
+                            client,
+                            url,
+                            broken_http_codes=broken_http_codes,
+                            previous=previous.get(url),
+                        )
+                    )
+                    task_to_url[task] = url
+                else:
+                    wait = None
+
+                if not task_to_url:
+                    await asyncio.sleep(stopper.timeout(wait))
+                    continue
+
+                done, _ = await asyncio.wait(
+                    task_to_url,
+                    timeout=stopper.timeout(wait),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                for task in done:
+                    if stopper.expired():
+                        break
+
+                    url = task_to_url.pop(task)
+                    queue.done(url)
+
+                    try:
+                        response = task.result()
+                    except Exception as exc:
+                        print(
+                            "%r generated an exception: %s" % (url, exc),
+                            file=sys.stderr,
+                        )
+                    else:
+                        _retry_or_report(response, queue, retry_policy, on_response)
+
+            for task in task_to_url:
+                task.cancel()
+
+            await asyncio.gather(*task_to_url, return_exceptions=True)
+
+        return queue.drain() + list(task_to_url.values())
+
+    async def check_if_broken(self, client, url, broken_http_codes=None, previous=None):
+        """Check if a link is broken"""
+        probe = _probe(
+            url,
+            previous=previous,
+            max_redirects=self.max_redirects,
+            resolved=self._resolved,
+        )
+        start = time.perf_counter()
+
+        try:
+            request = next(probe)
+
+            while True:
+                request = probe.send(await self._send(client, *request))
+        except StopIteration as e:
+            response = e.value
+        except httpx.TimeoutException:
+            response = Response(url, None, None, timed_out=True)
+        except (httpx.TransportError, httpx.InvalidURL):
+            response = Response(url, None, None)
+
+        response.broken = is_broken(url, response.code, broken_http_codes)
+        response.latency = time.perf_counter() - start
+        _remember(self._resolved, response)
 
         return response
 
+    async def _send(self, client, method, url, headers):
+        if method == "HEAD":
+            res = await client.head(url, headers=headers)
+        else:
+            # stream so we don't download the body
+            async with client.stream("GET", url, headers=headers) as res:
+                pass
+
+        return res.status_code, res.headers
+
+
+def _split_timeout(timeout):
+    """Returns (connect, read) timeouts from a number or a tuple"""
+    if isinstance(timeout, (tuple, list)):
+        return tuple(timeout)
+
+    return timeout, timeout
+
+
+def _list_files(extensions, index=False):
+    """
+    List files with the given extensions in the current directory (and
+    subdirectories). In a git repository, it only lists committed files (or
+    files in the index if ``index=True``, which includes staged files) without
+    walking the working tree. Otherwise, it falls back to globbing
+
+    Returns
+    -------
+    list
+        Paths relative to the current directory
+    """
+    if index:
+        pathspecs = [f"*.{ext}" for ext in extensions]
+        files, error = _git_ls(["ls-files", "-z", "--", *pathspecs])
+    else:
+        # ls-tree doesn't support wildcards, so we filter by extension below
+        files, error = _git_ls(["ls-tree", "-r", "-z", "--name-only", "HEAD"])
+
+    if error:
+        globs = (iglob(_make_glob_exp(ext), recursive=True) for ext in extensions)
+        return list(chain(*globs))
+
+    suffixes = tuple(f".{ext}" for ext in extensions)
+
+    # files deleted from the working tree are still listed by git
+    return [file for file in files if file.endswith(suffixes) and Path(file).is_file()]
+
 
-# copied from soopervisor
-def _git_tracked_files():
+def _git_ls(args):
     """
     Returns
     -------
     list or None
-        List of tracked files or None if an error happened
+        List of files or None if an error happened
     None of str
-        None if successfully retrieved tracked files, str if an error happened
+        None if successfully retrieved the files, str if an error happened
     """
     res = subprocess.run(
-        ["git", "ls-tree", "-r", "HEAD", "--name-only"],
+        ["git", *args],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
 
     if not res.returncode:
-        return set(res.stdout.decode().splitlines()), None
+        return [file for file in res.stdout.decode().split("\0") if file], None
     else:
         return None, res.stderr.decode().strip()
@@ -0,0 +1,370 @@
+"""
+Anchors (e.g., headings) and relative links in Markdown, reStructuredText and
+notebooks, used by pkgmt check-links to validate links to files in the
+repository and #fragments without network requests
+"""
+
+import os
+import re
+import json
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+import requests
+
+from pkgmt.links_ratelimit import HostRateLimiter, HostQueue, Stopper, run_in_threads
+
+# files whose anchors we know how to find
+SUFFIXES = (".md", ".rst", ".ipynb")
+
+# fragments that are valid in every HTML page
+_ALWAYS_VALID = {"", "top"}
+
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_ATX = re.compile(r"^ {0,3}#{1,6}\s+(.*?)(?:\s+#+)?\s*$")
+_SETEXT = re.compile(r"^ {0,3}(=+|-+)\s*$")
+_CUSTOM_ID = re.compile(r"\s*\{#([^}\s]+)\}\s*$")
+_HTML_ID = re.compile(r"""\b(?:id|name)\s*=\s*["']([^"']+)["']""")
+_MYST_TARGET = re.compile(r"^\(([^)\s]+)\)=\s*$")
+_MD_LINK_TEXT = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+
+# [text](target), ![alt](target) and [text](<target with spaces>)
+_MD_LINK = re.compile(r"\]\(\s*(?:<([^>]*)>|([^)\s]+))")
+# [label]: target (but not footnotes, e.g., [^1]: text)
+_MD_REFERENCE = re.compile(r"^ {0,3}\[(?!\^)[^\]]+\]:\s*<?([^\s>]+)>?")
+# `code` and ``code with ` backticks``
+_CODE_SPAN = re.compile(r"(`+)(?!`).*?(?<!`)\1(?!`)")
+_HTML_HREF = re.compile(r"""\bhref\s*=\s*["']([^"']+)["']""")
+
+_RST_UNDERLINE = re.compile(r"^([=\-`:'\"~^_*+#<>.])\1+\s*$")
+_RST_TARGET = re.compile(r"^\.\. _([^:]+):")
+# `text <target>`_
+_RST_LINK = re.compile(r"`[^`<]*<([^`>]+)>`__?")
+
+_SCHEME = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*:")
+
+
+def slugify_markdown(text):
+    """Anchor for a Markdown heading (same rules as GitHub)"""
+    text = _MD_LINK_TEXT.sub(r"\1", text)
+    text = re.sub(r"[^\w\- ]", "", text.strip().lower())
+    return text.replace(" ", "-")
+
+
+def slugify_rst(text):
+    """Anchor for a reStructuredText section or target (same rules as docutils)"""
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def _unique(slug, seen):
+    """GitHub appends -1, -2, ... to repeated headings"""
+    count = seen.get(slug, 0)
+    seen[slug] = count + 1
+    return slug if not count else f"{slug}-{count}"
+
+
+def _parse_markdown(text, anchors, links, cell=None, seen=None):
+    seen = {} if seen is None else seen
+    in_fence = False
+    previous = ""
+
+    for number, line in enumerate(text.splitlines(), start=1):
+        if _FENCE.match(line):
+            in_fence = not in_fence
+            previous = ""
+            continue
+
+        if in_fence:
+            continue
+
+        heading = None
+        atx = _ATX.match(line)
+
+        if atx:
+            heading = atx.group(1)
+        elif previous.strip() and _SETEXT.match(line):
+            heading = previous.strip()
+
+        if heading is not None:
+            custom = _CUSTOM_ID.search(heading)
+
+            if custom:
+                anchors.add(custom.group(1))
+                heading = heading[: custom.start()]
+
+            anchors.add(_unique(slugify_markdown(heading), seen))
+
+            if cell is not None:
+                # Jupyter keeps the case and punctuation
+                anchors.add(_MD_LINK_TEXT.sub(r"\1", heading).strip().replace(" ", "-"))
+
+        anchors.update(_HTML_ID.findall(line))
+        target = _MYST_TARGET.match(line)
+
+        if target:
+            anchors.add(target.group(1))
+
+        # links in code spans are examples, blank them (keeping the columns)
+        text = _CODE_SPAN.sub(lambda match: " " * len(match.group()), line)
+
+        for match in _MD_LINK.finditer(text):
+            group = 1 if match.group(1) is not None else 2
+            links.append((match.group(group), number, match.start(group) + 1, cell))
+
+        reference = _MD_REFERENCE.match(text)
+
+        if reference:
+            links.append((reference.group(1), number, reference.start(1) + 1, cell))
+
+        for match in _HTML_HREF.finditer(text):
+            links.append((match.group(1), number, match.start(1) + 1, cell))
+
+        previous = line
+
+
+def _parse_rst(text, anchors, links):
+    lines = text.splitlines()
+
+    for idx, line in enumerate(lines):
+        number = idx + 1
+        target = _RST_TARGET.match(line)
+
+        if target:
+            anchors.add(slugify_rst(target.group(1)))
+
+        title = line.strip()
+
+        if (
+            title
+            and not line[0].isspace()
+            and not _RST_UNDERLINE.match(line)
+            and idx + 1 < len(lines)
+            and _RST_UNDERLINE.match(lines[idx + 1])
+            and len(lines[idx + 1].rstrip()) >= len(title)
+        ):
+            anchors.add(slugify_rst(title))
+
+        for match in _RST_LINK.finditer(line):
+            links.append((match.group(1), number, match.start(1) + 1, None))
+
+
+def parse_file(path):
+    """
+    Find anchors and links in a file
+
+    Returns
+    -------
+    anchors : set
+        Anchors (headings, targets and HTML ids) defined in the file
+
+    links : list
+        ``(target, line, column, cell)`` tuples with every link in the file
+        (including absolute URLs). ``cell`` is the index of the notebook cell
+        (None if not a notebook)
+    """
+    path = Path(path)
+    anchors, links = set(), []
+
+    if path.suffix == ".ipynb":
+        # headings are numbered across cells
+        seen = {}
+        cells = notebook_cells(path.read_text(encoding="utf-8"))
+
+        for idx, (cell_type, text) in enumerate(cells):
+            if cell_type == "markdown":
+                _parse_markdown(text, anchors, links, cell=idx, seen=seen)
+    elif path.suffix == ".rst":
+        _parse_rst(path.read_text(), anchors, links)
+    else:
+        _parse_markdown(path.read_text(), anchors, links)
+
+    return anchors, links
+
+
+def notebook_cells(content):
+    """Returns ``(cell_type, text)`` tuples from a notebook's JSON content"""
+    cells = []
+
+    for cell in json.loads(content)["cells"]:
+        source = cell["source"]
+        # lines already end with a line break
+        cells.append(
+            (cell["cell_type"], source if isinstance(source, str) else "".join(source))
+        )
+
+    return cells
+
+
+class AnchorIndex:
+    """Anchors defined in each file, parsed once and looked up by path
+
+    Parameters
+    ----------
+    anchors : dict
+        Maps normalized paths (relative to the current directory) to the set of
+        anchors defined in them
+    """
+
+    def __init__(self, anchors=None) -> None:
+        self._anchors = anchors or {}
+
+    @classmethod
+    def from_files(cls, files):
+        """Build the index and return it along with the links in each file"""
+        anchors, links = {}, {}
+
+        for file in files:
+            key = _normalize(file)
+            anchors[key], links[key] = parse_file(file)
+
+        return cls(anchors), links
+
+    def anchors_for(self, path):
+        """Anchors defined in ``path``, parsing the file if it's not indexed"""
+        key = _normalize(path)
+
+        if key not in self._anchors:
+            self._anchors[key], _ = parse_file(key)
+
+        return self._anchors[key]
+
+    def __contains__(self, path):
+        return _normalize(path) in self._anchors
+
+    def __len__(self):
+        return len(self._anchors)
+
+
+def is_local(target):
+    """True if a link points to a file in the repository (not a URL, an absolute
+    path or a template)
+    """
+    return not (
+        _SCHEME.match(target)
+        or target.startswith(("//", "/"))
+        or "{" in target
+        or "}" in target
+    )
+
+
+def validate_local(file, target, index):
+    """
+    Validate a relative link (e.g., "../doc/x.md#install") found in ``file``
+
+    Returns
+    -------
+    resolved : str
+        The path the link points to (relative to the current directory),
+        followed by the fragment if there's one
+
+    reason : str or None
+        None if the link is valid, otherwise why it's broken
+    """
+    parts = urlsplit(target)
+    fragment = unquote(parts.fragment)
+    path = unquote(parts.path)
+
+    resolved = _normalize(
+        file if not path else os.path.join(os.path.dirname(file), path)
+    )
+    resolved_str = f"{resolved}#{fragment}" if parts.fragment else resolved
+
+    if not Path(resolved).exists():
+        return resolved_str, "missing file"
+
+    if (
+        fragment not in _ALWAYS_VALID
+        and Path(resolved).suffix in SUFFIXES
+        and Path(resolved).is_file()
+        and fragment not in index.anchors_for(resolved)
+    ):
+        return resolved_str, "missing anchor"
+
+    return resolved_str, None
+
+
+def anchors_in_html(html):
+    """Anchors (id and name attributes) in an HTML page"""
+    return set(_HTML_ID.findall(html))
+
+
+def has_anchor(anchors, fragment):
+    """Check if a fragment exists in the anchors of an HTML page"""
+    fragment = unquote(fragment)
+
+    return (
+        fragment in _ALWAYS_VALID
+        or fragment in anchors
+        # GitHub prefixes ids in rendered Markdown
+        or f"user-content-{fragment}" in anchors
+        # GitHub line anchors are handled with JavaScript
+        or re.fullmatch(r"L\d+(-L\d+)?", fragment) is not None
+    )
+
+
+# don't download huge pages to look for anchors
+MAX_PAGE_SIZE = 5 * 1024 * 1024
+
+
+def fetch_anchors(url, timeout):
+    """Download a page and return its anchors, None if it couldn't be fetched"""
+    try:
+        with requests.get(url, timeout=timeout, stream=True) as res:
+            if res.status_code >= 400:
+                return None
+
+            content = res.raw.read(MAX_PAGE_SIZE, decode_content=True)
+            encoding = res.encoding or "utf-8"
+    except requests.exceptions.RequestException:
+        return None
+
+    return anchors_in_html(content.decode(encoding, errors="replace"))
+
+
+def fetch_many(
+    urls, cache=None, max_workers=20, timeout=None, rate_limiter=None, stopper=None
+):
+    """
+    Fetch the anchors of each page once, using cached anchor sets when they're
+    fresh. Returns a dict mapping URLs to anchors (None if the page couldn't be
+    fetched). Pages that weren't fetched because ``stopper`` stopped the run
+    early (e.g., at the deadline) are missing
+    """
+    stopper = stopper or Stopper()
+    result, missing = {}, []
+
+    for url in urls:
+        anchors = None if cache is None else cache.get_anchors(url)
+
+        if anchors is None:
+            missing.append(url)
+        else:
+            result[url] = anchors
+
+    if not missing:
+        return result
+
+    queue = HostQueue(missing, rate_limiter or HostRateLimiter())
+
+    def fetch(url):
+        return fetch_anchors(url, stopper.cap_timeout(timeout))
+
+    def on_done(url, future):
+        anchors = future.result()
+
+        # the request was cut short by the deadline
+        if anchors is None and stopper.expired():
+            return
+
+        result[url] = anchors
+
+        if cache is not None and anchors is not None:
+            cache.set_anchors(url, anchors)
+
+    run_in_threads(queue, fetch, on_done, max_workers, stopper=stopper)
+
+    return result
+
+
+def _normalize(path):
+    return Path(os.path.normpath(path)).as_posix()
@@ -0,0 +1,223 @@
+"""
+Persistent cache for the results of pkgmt check-links
+"""
+
+import time
+import json
+import sqlite3
+from pathlib import Path
+from collections import namedtuple
+
+DEFAULT_PATH = Path(".pkgmt", "cache", "links.db")
+
+# number of seconds a cached result is considered fresh. Keys can be an HTTP
+# status code (e.g., "404"), "ok", "broken" or "default"; the most specific one
+# wins. Broken links are re-checked on every run so fixes show up immediately
+DEFAULT_TTL = {
+    "ok": 7 * 24 * 60 * 60,
+    "broken": 0,
+    "default": 24 * 60 * 60,
+}
+
+# bump when changing the schema, the database is re-created if it doesn't match
+_SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    url TEXT PRIMARY KEY,
+    code INTEGER,
+    broken INTEGER NOT NULL,
+    checked_at REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    final_url TEXT
+);
+
+CREATE TABLE IF NOT EXISTS anchors (
+    url TEXT PRIMARY KEY,
+    anchors TEXT NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+_COLUMNS = "url, code, broken, checked_at, etag, last_modified, final_url"
+
+
+CacheEntry = namedtuple(
+    "CacheEntry",
+    ["url", "code", "broken", "checked_at", "etag", "last_modified", "final_url"],
+)
+
+
+class LinkCache:
+    """SQLite-backed cache of link checks, keyed by URL
+
+    Parameters
+    ----------
+    path : str or pathlib.Path, default=".pkgmt/cache/links.db"
+        Location of the database, parent directories are created if needed
+
+    ttl : dict, default=None
+        Overrides for ``DEFAULT_TTL``, e.g., ``{"ok": 3600, "429": 0}``
+
+    max_age : int, default=None
+        If passed, entries older than this many seconds are stale regardless of
+        their TTL
+
+    refresh : bool, default=False
+        If True, every entry is considered stale (results are still stored)
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=None, max_age=None, refresh=False):
+        self.path = Path(path)
+        self.ttl = {**DEFAULT_TTL, **{str(k): v for k, v in (ttl or {}).items()}}
+        self.max_age = max_age
+        self.refresh = refresh
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        ignore_from_git(self.path.parent)
+
+        self._conn = sqlite3.connect(str(self.path))
+
+        (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+
+        if version != _SCHEMA_VERSION:
+            # it's a cache, so it's safe to discard results from older versions
+            self._conn.execute("DROP TABLE IF EXISTS links")
+            self._conn.execute("DROP TABLE IF EXISTS anchors")
+            self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, cfg, max_age=None, refresh=False):
+        """Create a cache from the [tool.pkgmt.check_links] section, returns None
+        if caching is disabled (``cache = false``)
+        """
+        if not cfg.get("cache", True):
+            return None
+
+        return cls(
+            path=cfg.get("cache_path", DEFAULT_PATH),
+            ttl=cfg.get("cache_ttl"),
+            max_age=max_age,
+            refresh=refresh,
+        )
+
+    def ttl_for(self, code, broken):
+        """Returns the TTL (in seconds) for a result with the given code"""
+        for key in (str(code), "broken" if broken else "ok", "default"):
+            if key in self.ttl:
+                return self.ttl[key]
+
+    def is_fresh(self, entry, now=None):
+        if self.refresh:
+            return False
+
+        now = time.time() if now is None else now
+        ttl = self.ttl_for(entry.code, entry.broken)
+
+        if self.max_age is not None:
+            ttl = min(ttl, self.max_age)
+
+        return now - entry.checked_at < ttl
+
+    def get(self, url):
+        row = self._conn.execute(
+            f"SELECT {_COLUMNS} FROM links WHERE url = ?", (url,)
+        ).fetchone()
+        return None if row is None else _to_entry(row)
+
+    def lookup(self, urls):
+        """Split URLs into fresh cached entries and URLs that must be checked
+
+        Returns
+        -------
+        fresh : dict
+            Maps URL to its ``CacheEntry``
+
+        stale : dict
+            Maps URLs that must be checked to their expired ``CacheEntry`` (which
+            may have validators for a conditional request), or to None if
+            they're not in the cache
+        """
+        now = time.time()
+        fresh, stale = {}, {}
+
+        for url in urls:
+            entry = self.get(url)
+
+            if entry is not None and self.is_fresh(entry, now=now):
+                fresh[url] = entry
+            else:
+                stale[url] = entry
+
+        return fresh, stale
+
+    def set(
+        self,
+        url,
+        code,
+        broken,
+        checked_at=None,
+        etag=None,
+        last_modified=None,
+        final_url=None,
+    ):
+        checked_at = time.time() if checked_at is None else checked_at
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO links ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, code, int(broken), checked_at, etag, last_modified, final_url),
+        )
+
+    def get_anchors(self, url):
+        """Returns the anchors of a page (a set) if they're fresh (they have the
+        same TTL as links that are ok), otherwise None
+        """
+        row = self._conn.execute(
+            "SELECT anchors, checked_at FROM anchors WHERE url = ?", (url,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        anchors, checked_at = row
+        entry = CacheEntry(url, 200, False, checked_at, None, None, None)
+        return set(json.loads(anchors)) if self.is_fresh(entry) else None
+
+    def set_anchors(self, url, anchors, checked_at=None):
+        checked_at = time.time() if checked_at is None else checked_at
+        self._conn.execute(
+            "INSERT OR REPLACE INTO anchors (url, anchors, checked_at) "
+            "VALUES (?, ?, ?)",
+            (url, json.dumps(sorted(anchors)), checked_at),
+        )
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def ignore_from_git(directory):
+    """Keeps a cache directory out of ``git status``"""
+    # same trick pytest uses in .pytest_cache: keep the cache out of
+    # `git status` without requiring users to edit their .gitignore
+    gitignore = Path(directory, ".gitignore")
+
+    if not gitignore.exists():
+        gitignore.write_text("# created by pkgmt automatically\n*\n")
+
+
+def _to_entry(row):
+    url, code, broken, *rest = row
+    return CacheEntry(url, code, bool(broken), *rest)
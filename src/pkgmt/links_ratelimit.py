@@ -0,0 +1,421 @@
+"""
+Per-host rate limiting and retries for pkgmt check-links
+"""
+
+import time
+import heapq
+import concurrent.futures
+import random
+import threading
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+# one request per second per host, same politeness we had before introducing
+# token buckets
+DEFAULT_RATE = 1
+DEFAULT_BURST = 1
+
+# responses that are likely transient (besides timeouts)
+RETRY_CODES = {429, 502, 503, 504}
+
+
+class TokenBucket:
+    """Classic token bucket: holds up to ``burst`` tokens and refills ``rate``
+    tokens per second. Not thread-safe, ``HostRateLimiter`` takes care of that
+    """
+
+    def __init__(self, rate, burst, now) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError(
+                f"Invalid rate limit (rate={rate}, burst={burst}): rate must be "
+                "positive and burst must be at least 1"
+            )
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def try_acquire(self, now):
+        """Takes a token if available. Returns 0 if it succeeded, otherwise the
+        number of seconds until a token is available
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(rate={self.rate}, burst={self.burst})"
+
+
+class HostRateLimiter:
+    """Thread-safe collection of token buckets, one per host
+
+    Parameters
+    ----------
+    rate : float, default=1
+        Default number of requests per second to the same host
+
+    burst : int, default=1
+        Default number of requests that can be made at once to the same host
+
+    domains : dict, default=None
+        Overrides per domain, e.g., ``{"github.com": {"rate": 5, "burst": 10}}``.
+        They also apply to subdomains (e.g., "docs.github.com")
+
+    clock : callable, default=time.monotonic
+        Returns the current time in seconds
+    """
+
+    def __init__(
+        self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, domains=None, clock=None
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.domains = domains or {}
+        self.clock = clock or time.monotonic
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Create a limiter from the [tool.pkgmt.check_links] section. Example:
+
+        [tool.pkgmt.check_links.rate_limits]
+        default = { rate = 1, burst = 1 }
+        "github.com" = { rate = 5, burst = 10 }
+        """
+        domains = dict(cfg.get("rate_limits", {}))
+        default = domains.pop("default", {})
+        return cls(
+            rate=default.get("rate", DEFAULT_RATE),
+            burst=default.get("burst", DEFAULT_BURST),
+            domains=domains,
+        )
+
+    def limits_for(self, host):
+        """Returns the (rate, burst) that applies to a host"""
+        host = host.split(":")[0].lower()
+        parts = host.split(".")
+
+        for idx in range(len(parts)):
+            domain = ".".join(parts[idx:])
+
+            if domain in self.domains:
+                limits = self.domains[domain]
+                return limits.get("rate", self.rate), limits.get("burst", self.burst)
+
+        return self.rate, self.burst
+
+    def try_acquire(self, host):
+        """Takes a token for ``host`` without blocking. Returns 0 if it succeeded,
+        otherwise the number of seconds until a token is available
+        """
+        with self._lock:
+            now = self.clock()
+
+            if host not in self._buckets:
+                rate, burst = self.limits_for(host)
+                self._buckets[host] = TokenBucket(rate, burst, now=now)
+
+            return self._buckets[host].try_acquire(now)
+
+
+class HostQueue:
+    """Hands out URLs in an order that respects per-host rate limits: a URL is
+    only returned if its host has a token available, so workers never sit idle
+    waiting for a busy host while other hosts have budget
+
+    Parameters
+    ----------
+    urls : iterable
+        URLs to schedule
+
+    limiter : HostRateLimiter
+
+    max_per_host : int, default=None
+        Maximum number of URLs to the same host that can be in flight (i.e.,
+        returned by ``pop_ready`` but not yet passed to ``done``)
+    """
+
+    def __init__(self, urls, limiter, max_per_host=None) -> None:
+        self.limiter = limiter
+        self.max_per_host = max_per_host
+        self._queues = defaultdict(deque)
+        self._in_flight = defaultdict(int)
+        self._attempts = defaultdict(int)
+        # hosts that asked us to back off (e.g., with Retry-After)
+        self._not_before = {}
+        # heap of (time at which the host may have a token, insertion order, host),
+        # each host appears at most once
+        self._heap = []
+        self._in_heap = set()
+        self._counter = 0
+        self._size = 0
+
+        for url in sorted(urls):
+            self._queues[_host(url)].append(url)
+            self._size += 1
+
+        now = limiter.clock()
+
+        for host in self._queues:
+            self._push(now, host)
+
+    def _push(self, ready_at, host):
+        if host in self._in_heap:
+            return
+
+        heapq.heappush(self._heap, (ready_at, self._counter, host))
+        self._in_heap.add(host)
+        self._counter += 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def pop_ready(self):
+        """Returns a tuple ``(url, wait)``. If some host has budget, ``url`` is a
+        URL to check and ``wait`` is 0. Otherwise, ``url`` is None and ``wait`` is
+        the number of seconds until a host may have budget (None if all hosts with
+        pending URLs reached ``max_per_host``)
+        """
+        now = self.limiter.clock()
+
+        while self._heap and self._heap[0][0] <= now:
+            _, _, host = heapq.heappop(self._heap)
+            self._in_heap.discard(host)
+
+            not_before = self._not_before.get(host, now)
+
+            if not_before > now:
+                self._push(not_before, host)
+                continue
+
+            wait = self.limiter.try_acquire(host)
+
+            if wait:
+                # lower bound so tiny waits can't get lost to float rounding
+                self._push(now + max(wait, 1e-3), host)
+                continue
+
+            url = self._queues[host].popleft()
+            self._size -= 1
+            self._in_flight[host] += 1
+
+            if self._queues[host] and not self._host_is_full(host):
+                self._push(now, host)
+
+            return url, 0
+
+        if self._heap:
+            return None, self._heap[0][0] - now
+        else:
+            return None, None
+
+    def done(self, url):
+        """Must be called when a URL returned by ``pop_ready`` has been checked"""
+        host = _host(url)
+        self._in_flight[host] -= 1
+
+        # the host was taken out of the heap when it reached max_per_host
+        if self._queues[host] and not self._host_is_full(host):
+            self._push(self.limiter.clock(), host)
+
+    def attempts(self, url):
+        """Number of times ``url`` has been retried"""
+        return self._attempts[url]
+
+    def retry(self, url, delay):
+        """Schedule a URL (already passed to ``done``) again. No URL from the same
+        host is returned in the next ``delay`` seconds
+        """
+        host = _host(url)
+        now = self.limiter.clock()
+
+        self._attempts[url] += 1
+        self._queues[host].appendleft(url)
+        self._size += 1
+        self._not_before[host] = max(self._not_before.get(host, now), now + delay)
+
+        if not self._host_is_full(host):
+            self._push(self._not_before[host], host)
+
+    def drain(self):
+        """Remove and return every pending URL (e.g., to report them as
+        unchecked when stopping early)
+        """
+        pending = [url for queue in self._queues.values() for url in queue]
+        self._queues.clear()
+        self._heap.clear()
+        self._in_heap.clear()
+        self._size = 0
+        return pending
+
+    def _host_is_full(self, host):
+        return (
+            self.max_per_host is not None and self._in_flight[host] >= self.max_per_host
+        )
+
+
+class RetryPolicy:
+    """Decides whether to retry a link and how long to wait
+
+    Parameters
+    ----------
+    retries : int, default=2
+        Maximum number of retries per link
+
+    backoff : float, default=1
+        Seconds to wait before the first retry, it doubles on every retry (with
+        random jitter so retries to the same host are spread out)
+
+    max_delay : float, default=60
+        Maximum number of seconds to wait. If a server asks (via Retry-After) to
+        wait longer, the link is not retried
+    """
+
+    def __init__(self, retries=2, backoff=1, max_delay=60, random_state=None) -> None:
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self._random = random_state or random.Random()
+
+    @classmethod
+    def from_config(cls, cfg, retries=None):
+        """Create a policy from the [tool.pkgmt.check_links] section, ``retries``
+        overrides the value in the configuration
+        """
+        return cls(
+            retries=retries if retries is not None else cfg.get("retries", 2),
+            backoff=cfg.get("backoff", 1),
+            max_delay=cfg.get("max_retry_delay", 60),
+        )
+
+    def should_retry(self, response, attempt):
+        if attempt >= self.retries:
+            return False
+
+        if not (response.timed_out or response.code in RETRY_CODES):
+            return False
+
+        return response.retry_after is None or response.retry_after <= self.max_delay
+
+    def delay(self, response, attempt):
+        if response.retry_after is not None:
+            return response.retry_after
+
+        jitter = self._random.uniform(0.5, 1.5)
+        return min(self.max_delay, self.backoff * 2**attempt * jitter)
+
+
+def _host(url):
+    return urlparse(url).netloc
+
+
+class Stopper:
+    """Decides when to stop checking links: after the first broken link (if
+    ``fail_fast``) or when ``deadline`` seconds have passed
+    """
+
+    def __init__(self, fail_fast=False, deadline=None) -> None:
+        self.fail_fast = fail_fast
+        self.deadline = None if deadline is None else time.monotonic() + deadline
+        self.found_broken = False
+
+    def remaining(self):
+        """Seconds until the deadline (None if there isn't one)"""
+        if self.deadline is None:
+            return None
+
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.remaining() == 0
+
+    def should_stop(self):
+        return (self.fail_fast and self.found_broken) or self.expired()
+
+    def timeout(self, wait):
+        """Cap a wait (None means forever) so we wake up at the deadline"""
+        remaining = self.remaining()
+
+        if remaining is None:
+            return wait
+
+        return remaining if wait is None else min(wait, remaining)
+
+    def cap_timeout(self, timeout):
+        """
+        Cap a request timeout (a number, a (connect, read) tuple or None) so
+        the request ends by the deadline
+        """
+        remaining = self.remaining()
+
+        if remaining is None:
+            return timeout
+
+        remaining = max(1e-3, remaining)
+
+        if timeout is None:
+            return remaining
+
+        if isinstance(timeout, (tuple, list)):
+            return tuple(min(part, remaining) for part in timeout)
+
+        return min(timeout, remaining)
+
+
+def run_in_threads(queue, fn, on_done, max_workers, stopper=None):
+    """
+    Run ``fn(url)`` in a thread pool for the URLs in a ``HostQueue``. Only URLs
+    whose host has budget are submitted, so no worker is blocked waiting on a
+    busy host. ``on_done(url, future)`` is called (in the calling thread) as
+    each one finishes, it might put the URL back in the queue (e.g., to retry
+    it). Returns the URLs that weren't processed because ``stopper`` stopped the
+    run early
+    """
+    stopper = stopper or Stopper()
+    future_to_url = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    try:
+        while (queue or future_to_url) and not stopper.should_stop():
+            while len(future_to_url) < max_workers:
+                url, wait = queue.pop_ready()
+
+                if url is None:
+                    break
+
+                future_to_url[executor.submit(fn, url)] = url
+            else:
+                # all workers are busy, wait for one of them to finish
+                wait = None
+
+            if not future_to_url:
+                time.sleep(stopper.timeout(wait))
+                continue
+
+            done, _ = concurrent.futures.wait(
+                future_to_url,
+                timeout=stopper.timeout(wait),
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+
+            for future in done:
+                # work cut short by the deadline is unprocessed, not failed
+                if stopper.expired():
+                    break
+
+                url = future_to_url.pop(future)
+                queue.done(url)
+                on_done(url, future)
+    finally:
+        # work in progress can't be interrupted, but we don't wait for it
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return queue.drain() + list(future_to_url.values())
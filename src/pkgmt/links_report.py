@@ -0,0 +1,275 @@
+"""
+Output formats for pkgmt check-links. Reporters receive results as soon as
+they're available, so machine-readable formats are streamed instead of being
+written once every link has been checked
+"""
+
+import sys
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+import pkgmt
+
+_SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+
+_RULE_ID = "broken-link"
+
+# reason of links that weren't checked (e.g., the deadline passed)
+UNKNOWN = "unknown"
+
+
+class Reporter:
+    """Base class for reporters
+
+    Parameters
+    ----------
+    stream : file-like object, default=None
+        Where to write the report, defaults to ``sys.stdout``
+    """
+
+    def __init__(self, stream=None) -> None:
+        self.stream = stream or sys.stdout
+
+    def start(self, mapping):
+        """Called once before checking links, ``mapping`` maps files to their
+        ``LinksInFile``
+        """
+
+    def report(self, response, locations):
+        """Called with every ``Response`` and the ``pkgmt.links.Location``
+        objects where its URL appears
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """Called once after all links have been checked"""
+
+    def _write(self, text):
+        self.stream.write(text)
+        # flush so consumers can read results while we're still checking
+        self.stream.flush()
+
+
+class TextReporter(Reporter):
+    """Human-readable report of invalid links and every occurrence of a broken
+    link (e.g., ``doc.md:3:10 (404) https://...``), grouped by file
+    """
+
+    def start(self, mapping):
+        self._mapping = mapping
+        # (location, response) tuples, by file
+        self._broken = {}
+
+    def report(self, response, locations):
+        if not (response.broken or response.reason == UNKNOWN):
+            return
+
+        for location in locations:
+            self._broken.setdefault(location.file, []).append((location, response))
+
+    def finish(self):
+        for file, links in self._mapping.items():
+            if links.invalid:
+                print(f"*** Found invalid links in {file} ***", file=self.stream)
+                print("\n".join(links.invalid), file=self.stream)
+
+        print("=" * 80, file=self.stream)
+
+        files = list(self._mapping) + [
+            file for file in self._broken if file not in self._mapping
+        ]
+
+        for file in files:
+            match = sorted(self._broken.get(file, []), key=lambda m: _sort_key(m[0]))
+
+            if match:
+                print(f"*** {file} ***", file=self.stream)
+                print(
+                    "\n".join(
+                        f"{format_location(location)} {response!r}"
+                        for location, response in match
+                    ),
+                    file=self.stream,
+                )
+
+        print("=" * 80, file=self.stream)
+
+
+class JSONLinesReporter(Reporter):
+    """One JSON object per line for every location of every checked link"""
+
+    def report(self, response, locations):
+        for location in locations or [None]:
+            record = {
+                "file": location and location.file,
+                "line": location and location.line,
+                "column": location and location.column,
+                "cell": location and location.cell,
+                "url": response.url,
+                "final_url": response.final_url,
+                "code": response.code,
+                "broken": response.broken,
+                "cached": response.cached,
+                "timed_out": response.timed_out,
+                "latency": response.latency,
+                "reason": response.reason,
+            }
+            self._write(json.dumps(record) + "\n")
+
+
+class SARIFReporter(Reporter):
+    """SARIF 2.1.0 log with one result per location of a broken link. The
+    document is written incrementally: header, results, footer
+    """
+
+    def start(self, mapping):
+        header = {
+            "version": "2.1.0",
+            "$schema": _SARIF_SCHEMA,
+        }
+        tool = {
+            "driver": {
+                "name": "pkgmt check-links",
+                "version": pkgmt.__version__,
+                "informationUri": "https://github.com/ploomber/pkgmt",
+                "rules": [
+                    {
+                        "id": _RULE_ID,
+                        "shortDescription": {"text": "Broken link"},
+                    }
+                ],
+            }
+        }
+        # leave the results array open so we can append to it
+        self._write(
+            json.dumps(header)[:-1]
+            + ', "runs": [{"tool": '
+            + json.dumps(tool)
+            + ', "results": [\n'
+        )
+        self._first = True
+
+    def report(self, response, locations):
+        if not response.broken:
+            return
+
+        for location in locations:
+            physical = {"artifactLocation": {"uri": location.file}}
+
+            if location.line is not None:
+                physical["region"] = {"startLine": location.line}
+
+                if location.column is not None:
+                    physical["region"]["startColumn"] = location.column
+
+            result = {
+                "ruleId": _RULE_ID,
+                "level": "error",
+                "message": {"text": _describe(response)},
+                "locations": [{"physicalLocation": physical}],
+            }
+
+            # SARIF has no notion of notebook cells, lines are relative to it
+            if location.cell is not None:
+                result["properties"] = {"cell": location.cell}
+
+            separator = "" if self._first else ",\n"
+            self._first = False
+            self._write(separator + json.dumps(result))
+
+    def finish(self):
+        self._write("\n]}]}\n")
+
+
+class JUnitReporter(Reporter):
+    """JUnit XML with one test case per location of every checked link (broken
+    links are failures). The document is written incrementally, so the test
+    suite doesn't have the (optional) counts attributes
+    """
+
+    def start(self, mapping):
+        self._write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            "<testsuites>\n"
+            '<testsuite name="pkgmt check-links">\n'
+        )
+
+    def report(self, response, locations):
+        for location in locations:
+            attrs = {
+                "classname": location.file,
+                "name": response.url,
+                "file": location.file,
+            }
+
+            if location.line is not None:
+                attrs["line"] = str(location.line)
+
+            if response.latency is not None:
+                attrs["time"] = f"{response.latency:.3f}"
+
+            attrs = " ".join(
+                f"{key}={quoteattr(value)}" for key, value in attrs.items()
+            )
+
+            if response.broken:
+                message = _describe(response)
+                self._write(
+                    f"<testcase {attrs}><failure message={quoteattr(message)}>"
+                    f"{escape(message)}</failure></testcase>\n"
+                )
+            elif response.reason == UNKNOWN:
+                self._write(
+                    f"<testcase {attrs}><skipped message="
+                    f"{quoteattr('Link was not checked')}/></testcase>\n"
+                )
+            else:
+                self._write(f"<testcase {attrs}/>\n")
+
+    def finish(self):
+        self._write("</testsuite>\n</testsuites>\n")
+
+
+FORMATS = {
+    "text": TextReporter,
+    "jsonl": JSONLinesReporter,
+    "sarif": SARIFReporter,
+    "junit": JUnitReporter,
+}
+
+
+def format_location(location):
+    """Format a location the way editors and terminals recognize it, e.g.,
+    ``doc.md:3:10`` or ``notebook.ipynb[cell 2]:1:5``
+    """
+    text = location.file
+
+    if location.cell is not None:
+        text += f"[cell {location.cell}]"
+
+    for value in (location.line, location.column):
+        if value is None:
+            break
+
+        text += f":{value}"
+
+    return text
+
+
+def _sort_key(location):
+    return (
+        -1 if location.cell is None else location.cell,
+        location.line or 0,
+        location.column or 0,
+    )
+
+
+def _describe(response):
+    if response.reason:
+        return f"Broken link ({response.reason}): {response.url}"
+    elif response.timed_out:
+        return f"Link timed out: {response.url}"
+    elif response.code is None:
+        return f"Link could not be reached: {response.url}"
+    else:
+        return f"Broken link (HTTP {response.code}): {response.url}"
@@ -0,0 +1,95 @@
+"""
+Per-invocation cache of project files (e.g., pyproject.toml and the version
+file), shared by the CLI, the versioner and the CHANGELOG tools so they don't
+look for, read and parse the same files several times. Entries are keyed by
+the file's modification time and size, so edits invalidate them
+"""
+
+from pathlib import Path
+
+# how many directories to go up when looking for a configuration file
+MAX_LEVELS = 10
+
+
+class ProjectContext:
+    """Caches where configuration files are and the values loaded from files"""
+
+    def __init__(self) -> None:
+        # (directory, filename) -> path
+        self._found = {}
+        # (path, loader) -> (signature, value)
+        self._loaded = {}
+
+    def find_file(self, filename, directory=None):
+        """
+        Looks for ``filename`` in ``directory`` (defaults to the current one) and
+        its parents, returns its absolute path. Raises FileNotFoundError if it
+        doesn't exist
+        """
+        # resolve it so a relative path (e.g., ".") can be searched upwards and
+        # cached entries stay valid if the current directory changes
+        directory = Path(directory or Path.cwd()).resolve()
+        key = (str(directory), filename)
+        path = self._found.get(key)
+
+        if path is None or not path.exists():
+            path = self._found[key] = _search(filename, directory)
+
+        return path
+
+    def load(self, path, loader):
+        """
+        Returns ``loader(path)``. The result is reused until the file changes,
+        so ``loader`` must not return objects that callers modify
+        """
+        path = Path(path).resolve()
+        signature = _signature(path)
+        key = (str(path), loader)
+        cached = self._loaded.get(key)
+
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        value = loader(path)
+        self._loaded[key] = (signature, value)
+        return value
+
+    def invalidate(self, path):
+        """Discards values loaded from ``path`` (e.g., after editing it)"""
+        path = str(Path(path).resolve())
+
+        for key in [key for key in self._loaded if key[0] == path]:
+            del self._loaded[key]
+
+
+_context = ProjectContext()
+
+
+def context():
+    """Returns the context of the current invocation"""
+    return _context
+
+
+def reset():
+    """Starts a new context (the CLI calls it on every invocation)"""
+    global _context
+    _context = ProjectContext()
+
+
+def _signature(path):
+    stat = path.stat()
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _search(filename, directory):
+    for _ in range(MAX_LEVELS):
+        potential_file_path = directory / filename
+
+        if potential_file_path.exists():
+            return potential_file_path
+
+        directory = directory.parent  # Go one level up
+
+    raise FileNotFoundError(
+        f"Could not find configuration file: expected a {filename} file"
+    )
@@ -3,25 +3,20 @@ Managing project versions
 """
 
 import sys
+import json
 import shutil
 import subprocess
 from pathlib import Path
 import click
 
-from pkgmt.changelog import expand_github_from_changelog, CHANGELOG
-from pkgmt.versioner.versioner import Versioner
-from pkgmt.versioner.util import complete_version_string, is_pre_release
+from pkgmt.changelog import CHANGELOG
+from pkgmt.changelog_enrich import Enricher
+from pkgmt.config import Config
+from pkgmt.versioner.versioner import Versioner, push_refs
+from pkgmt.versioner.patch import PatchSet
+from pkgmt.versioner.util import Version
 from pkgmt.deprecation import Deprecations
-
-
-def replace_in_file(path_to_file, original, replacement):
-    """Replace string in file"""
-    with open(path_to_file, "r+") as f:
-        content = f.read()
-        updated = content.replace(original, replacement)
-        f.seek(0)
-        f.write(updated)
-        f.truncate()
+from pkgmt import workspace
 
 
 def call(*args, **kwargs):
@@ -70,7 +65,15 @@ def validate_version_string(version):
             "(first character must be numeric)"
         )
 
-    return complete_version_string(version)
+    return str(Version.parse(version).complete())
+
+
+_RELEASE_MSG = "{package_name} release {new_version}"
+
+_DEV_MSG = "Bumps up {package_name} to version {new_version}"
+
+# packages in a monorepo might release the same version
+_WORKSPACE_TAG = "{package_name}-{new_version}"
 
 
 def version(
@@ -79,6 +82,7 @@ def version(
     yes=False,
     push=True,
     target=None,
+    plan=False,
 ):
     """
 
@@ -101,8 +105,93 @@ def version(
         stable version and a new dev version. If stable, it assumes the repo is in a
         dev version and creates a stable version (skipping bumping to a new dev
         version)
+
+    plan : bool, default=False
+        Prints the edits (as a unified diff) and the commits (as JSON) that
+        would be made, without asking for confirmation or touching files or
+        the git repository. Progress messages go to stderr and CHANGELOG
+        references are not enriched (it requires network calls), so the
+        diff might not show titles or pull request links
+    """
+
+    if not plan:
+        _prepare_repository()
+
+    tags = _release_package(project_root, tag=tag, yes=yes, target=target, plan=plan)
+
+    if push and not plan:
+        push_refs(tags=tags)
+
+
+def version_all(
+    project_root=".",
+    changed=False,
+    tag=True,
+    yes=False,
+    push=True,
+    target=None,
+    plan=False,
+    max_workers=None,
+):
     """
+    Releases the packages in a monorepo (see ``pkgmt.workspace``). Checks run
+    for all of them before any release, then packages are released in
+    dependency order (each one gets its release and dev commits) and
+    everything is pushed at once
 
+    Parameters
+    ----------
+    changed : bool, default=False
+        If True, only packages with commits since their last release are
+        released
+
+    max_workers : int, default=None
+        Number of packages checked at the same time
+
+    tag, yes, push, target, plan
+        Same as in ``version``. Tags are prefixed with the package name (e.g.,
+        ``package_name-0.1.0``) so they don't clash
+    """
+    if not plan:
+        _prepare_repository()
+
+    packages = workspace.discover(project_root)
+
+    if changed:
+        packages = workspace.changed(packages, root=project_root)
+
+    if not packages:
+        click.echo("No packages to release.", err=plan)
+        return
+
+    packages = workspace.release_order(packages)
+    click.echo(
+        "Releasing: {}".format(", ".join(str(p.path) for p in packages)), err=plan
+    )
+
+    workspace.check(packages, max_workers=max_workers)
+
+    tags = []
+
+    for package in packages:
+        click.echo(f"Releasing {package.path}...", err=plan)
+        tags.extend(
+            _release_package(
+                package.path,
+                tag=tag,
+                yes=yes,
+                target=target,
+                plan=plan,
+                check=False,
+                tag_template=_WORKSPACE_TAG,
+            )
+        )
+
+    if push and not plan:
+        push_refs(tags=tags)
+
+
+def _prepare_repository():
     _git_checkout_main_branch(pull=True)
 
     pending = subprocess.check_output(["git", "status", "--short"])
@@ -114,6 +203,20 @@ def version(
             f"\n{pending.decode()}"
         )
 
+
+def _release_package(
+    project_root,
+    tag,
+    yes,
+    target,
+    plan=False,
+    check=True,
+    tag_template="{new_version}",
+):
+    """
+    Creates the release (and dev) commits of the package in ``project_root``,
+    returns the tags it created. Pushing is up to the caller
+    """
     versioner = Versioner.load(project_root)
 
     changelog_md_exists = (
@@ -121,20 +224,27 @@ def version(
     )
 
     if changelog_md_exists:
-        # check changelog
-        CHANGELOG.from_path(
+        # parse the changelog once, the release edits are applied to this
+        # document
+        changelog = CHANGELOG.from_path(
             path=versioner.path_to_changelog,
             project_root=project_root,
-        ).check()
+        )
 
-        # look for deprecations
-        Deprecations(root_dir=project_root).check()
+        if check:
+            changelog.check()
+
+            # look for deprecations
+            Deprecations(root_dir=project_root).check()
+    else:
+        changelog = None
 
     current = versioner.current_version()
     release = versioner.release_version()
 
-    if yes:
-        print(f"Releasing version: {release}")
+    if yes or plan:
+        # with --plan, stdout only has the diff and the JSON summary
+        click.echo(f"Releasing version: {release}", err=plan)
     else:
         release = input_str(
             "Current version in setup.py is {current}. Enter"
@@ -143,61 +253,160 @@ def version(
         )
 
     release = validate_version_string(release)
+    pre_release = Version.parse(release).is_prerelease
 
-    if versioner.path_to_changelog and not is_pre_release(release):
-        versioner.update_changelog_release(release)
-
-        changelog = versioner.path_to_changelog.read_text()
-
-        if not yes:
-            input_confirm(
-                f"\n{versioner.path_to_changelog} content:" f"\n\n{changelog}\n",
-                abort=True,
-            )
-
-    # Expand github links and sort secions
-    if changelog_md_exists:
-        expand_github_from_changelog(path=versioner.path_to_changelog)
-
-        # sort changelog entries
-        changelog_sorted = CHANGELOG.from_path(
-            path=versioner.path_to_changelog,
-            project_root=project_root,
-        ).sort_last_section()
-        Path(versioner.path_to_changelog).write_text(changelog_sorted)
+    # compute every edit before writing anything, so aborting (or a failure)
+    # never leaves half-edited files
+    commits = _plan_release(
+        versioner,
+        changelog,
+        release,
+        target=target,
+        project_root=project_root,
+        plan=plan,
+    )
+    release_patches = commits[0]["patches"]
+
+    if plan:
+        _print_plan(
+            versioner,
+            current,
+            release,
+            commits,
+            tag=tag_template if tag else None,
+        )
+        return []
 
-    else:
-        print("Skipping CHANGELOG processing (only supported in .md files)")
+    if versioner.path_to_changelog and not pre_release and not yes:
+        content = release_patches.read(versioner.path_to_changelog)
+        input_confirm(
+            f"\n{versioner.path_to_changelog} content:" f"\n\n{content}\n",
+            abort=True,
+        )
 
-    # Replace version number and create tag
+    # Replace version number and create tag. Commits are pushed at the end with
+    # a single atomic push, so the remote never gets half a release
     print("Commiting release version: {}".format(release))
-    versioner.commit_version(
+    created = versioner.commit_version(
         release,
-        msg_template="{package_name} release {new_version}",
+        msg_template=_RELEASE_MSG,
         tag=tag,
-        push=push,
+        push=False,
+        patches=release_patches,
+        tag_template=tag_template,
     )
+    tags = [created] if created else []
 
     if target == "stable":
         print(f"Version {release} was created.")
-        return
-
-    # Create a new dev version and save it
-    bumped_version = versioner.bump_up_version()
+        return tags
 
-    if not is_pre_release(release):
-        print("Creating new section in CHANGELOG...")
-        versioner.add_changelog_new_dev_section(bumped_version)
+    bumped_version = commits[1]["version"]
 
     print("Commiting dev version: {}".format(bumped_version))
     versioner.commit_version(
         bumped_version,
-        msg_template="Bumps up {package_name} to version {new_version}",
+        msg_template=_DEV_MSG,
         tag=False,
-        push=push,
+        push=False,
+        patches=commits[1]["patches"],
     )
 
     print("Version {} was created, you are now in {}".format(release, bumped_version))
+    return tags
+
+
+def _plan_release(
+    versioner, changelog, release, target=None, project_root=".", plan=False
+):
+    """
+    Computes the edits of the release commit and the dev commit (unless
+    ``target="stable"``). Returns a list of dictionaries with the version of
+    each commit and a PatchSet with its edits. If ``plan`` is True, messages
+    go to stderr and CHANGELOG references are not enriched
+    """
+    patches = PatchSet()
+    pre_release = Version.parse(release).is_prerelease
+
+    # Expand github links and sort secions
+    if changelog is not None:
+        if not pre_release:
+            changelog.set_release(release)
+
+        if plan:
+            enricher = None
+        else:
+            cfg = Config.from_file("pyproject.toml", directory=project_root)
+            enricher = Enricher.from_config(cfg, project_root=project_root)
+
+        try:
+            changelog.expand_github(enricher=enricher)
+        finally:
+            if enricher is not None:
+                enricher.close()
+        changelog.sort_latest_entries()
+        patches.write(versioner.path_to_changelog, changelog.render())
+    else:
+        click.echo(
+            "Skipping CHANGELOG processing (only supported in .md files)", err=plan
+        )
+
+        if versioner.path_to_changelog and not pre_release:
+            versioner.update_changelog_release(release, patches=patches)
+
+    versioner.set_version(release, patches)
+    commits = [{"version": release, "patches": patches}]
+
+    if target == "stable":
+        return commits
+
+    # Create a new dev version, starting from the release edits
+    bumped_version = versioner.bump_up_version(current=release)
+    patches = patches.then()
+
+    if not pre_release:
+        click.echo("Creating new section in CHANGELOG...", err=plan)
+
+        if changelog is not None:
+            changelog.add_dev_section(bumped_version)
+            patches.write(versioner.path_to_changelog, changelog.render())
+        else:
+            versioner.add_changelog_new_dev_section(bumped_version, patches=patches)
+
+    versioner.set_version(bumped_version, patches)
+    commits.append({"version": bumped_version, "patches": patches})
+    return commits
+
+
+def _print_plan(versioner, current, release, commits, tag):
+    for commit in commits:
+        print(commit["patches"].diff(), end="")
+
+    templates = [_RELEASE_MSG, _DEV_MSG]
+    summary = {
+        "current": current,
+        "release": release,
+        "dev": commits[1]["version"] if len(commits) > 1 else None,
+        "commits": [
+            {
+                "message": template.format(
+                    package_name=versioner.package_name,
+                    new_version=commit["version"],
+                ),
+                "tag": (
+                    tag.format(
+                        package_name=versioner.package_name,
+                        new_version=commit["version"],
+                    )
+                    if tag and idx == 0
+                    else None
+                ),
+                "files": commit["patches"].files,
+            }
+            for idx, (template, commit) in enumerate(zip(templates, commits))
+        ],
+    }
+    print(json.dumps(summary, indent=4))
 
 
 def _git_checkout_main_branch(pull=False):
@@ -0,0 +1,113 @@
+"""
+In-memory edits to project files. pkgmt version computes every edit of a
+release before touching the disk, so it can show them (``--plan``) and an
+aborted release never leaves half-edited files behind
+"""
+
+import os
+import shutil
+import difflib
+import tempfile
+from pathlib import Path
+
+from pkgmt import project
+
+
+class PatchSet:
+    """Edits to text files, kept in memory until ``apply`` writes them
+
+    Parameters
+    ----------
+    base : PatchSet, default=None
+        If passed, files are read from its (edited) contents instead of the
+        disk, e.g., to compute the edits of a commit that follows another one
+    """
+
+    def __init__(self, base=None) -> None:
+        self._base = base
+        self._original = {}
+        self._updated = {}
+
+    def read(self, path):
+        """Returns the current content of ``path``, including edits"""
+        path = Path(path)
+
+        if path in self._updated:
+            return self._updated[path]
+
+        if path not in self._original:
+            self._original[path] = (
+                self._base.read(path) if self._base else path.read_text()
+            )
+
+        return self._original[path]
+
+    def write(self, path, content):
+        """Replaces the content of ``path`` (only in memory)"""
+        path = Path(path)
+        # keep the original so we can diff it
+        self.read(path)
+        self._updated[path] = content
+
+    def then(self):
+        """Returns an empty patch set that starts from this one's contents"""
+        return type(self)(base=self)
+
+    def _changed(self):
+        return [
+            (path, self._original[path], content)
+            for path, content in self._updated.items()
+            if content != self._original[path]
+        ]
+
+    @property
+    def files(self):
+        """Files whose content changed"""
+        return [str(path) for path, _, _ in self._changed()]
+
+    def diff(self):
+        """Returns a unified diff with the edits"""
+        return "".join(
+            "".join(
+                difflib.unified_diff(
+                    original.splitlines(keepends=True),
+                    updated.splitlines(keepends=True),
+                    fromfile=f"a/{path.as_posix()}",
+                    tofile=f"b/{path.as_posix()}",
+                )
+            )
+            for path, original, updated in self._changed()
+        )
+
+    def apply(self):
+        """
+        Writes the edited files. Every file is written to a temporary file
+        next to it first and then renamed, so a failure while writing leaves
+        all files untouched
+        """
+        changed = self._changed()
+        temporary = []
+
+        try:
+            for path, _, content in changed:
+                fd, tmp = tempfile.mkstemp(
+                    dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+                )
+                temporary.append(tmp)
+
+                with os.fdopen(fd, "w") as f:
+                    f.write(content)
+
+                shutil.copymode(path, tmp)
+        except BaseException:
+            for tmp in temporary:
+                os.remove(tmp)
+
+            raise
+
+        for (path, _, _), tmp in zip(changed, temporary):
+            os.replace(tmp, path)
+            # the modification time might not change if it's edited quickly
+            project.context().invalidate(path)
+
+        return [str(path) for path, _, _ in changed]
@@ -2,40 +2,279 @@ import re
 import os
 import click
 import warnings
+import functools
 from pathlib import Path
 
+# PEP 440 versions, see: https://peps.python.org/pep-0440/#appendix-b
+_VERSION_PATTERN = re.compile(
+    r"""
+    ^\s*v?
+    (?:(?P<epoch>[0-9]+)!)?
+    (?P<release>[0-9]+(?:\.[0-9]+)*)
+    (?:
+        [-_.]?(?P<pre_l>alpha|a|beta|b|preview|pre|c|rc)[-_.]?(?P<pre_n>[0-9]+)?
+    )?
+    (?:
+        -(?P<post_n1>[0-9]+)
+        |[-_.]?(?P<post_l>post|rev|r)[-_.]?(?P<post_n2>[0-9]+)?
+    )?
+    (?:[-_.]?(?P<dev_l>dev)[-_.]?(?P<dev_n>[0-9]+)?)?
+    (?:\+(?P<local>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?
+    \s*$
+    """,
+    re.VERBOSE | re.IGNORECASE,
+)
+
+_PRE_LABELS = {
+    "alpha": "a",
+    "a": "a",
+    "beta": "b",
+    "b": "b",
+    "preview": "rc",
+    "pre": "rc",
+    "c": "rc",
+    "rc": "rc",
+}
+
+_PRE_ORDER = {"a": 0, "b": 1, "rc": 2}
+
+_RELEASE_PARTS = {"major": 0, "minor": 1, "patch": 2}
+
+
+@functools.total_ordering
+class Version:
+    """A PEP 440 version. Use ``Version.parse`` to create one from a string
+
+    Versions keep the string they were parsed from (e.g., "0.1dev"), new
+    versions (e.g., from ``bump``) follow the format we use in version files:
+    no separator before pre-release and dev segments and no number in the dev
+    segment if it's zero (e.g., "0.1.1dev", "1.0b1", "1.0.post1")
 
-def is_pre_release(version):
-    return "a" in version or "b" in version or "rc" in version
+    Parameters
+    ----------
+    release : tuple
+        Release segment (e.g., ``(1, 2, 0)``)
 
+    pre : tuple, default=None
+        Pre-release segment (e.g., ``("b", 1)``)
 
-def is_major_version(version):
-    _, major, minor = complete_version_string(version.replace("dev", "")).split(".")
-    return (minor == "0") or (major == "0" and minor == "0")
+    post : int, default=None
+        Post-release number
 
+    dev : int, default=None
+        Development release number
+    """
 
-def _split_prerelease_part(version):
-    if is_pre_release(version):
-        prerelease_part = re.search(r"(a|b|rc)\d+", version).group(0)
+    __slots__ = ("epoch", "release", "pre", "post", "dev", "local", "_text", "_key")
+
+    def __init__(
+        self, release, pre=None, post=None, dev=None, epoch=0, local=None, _text=None
+    ) -> None:
+        self.epoch = epoch
+        self.release = tuple(release)
+        self.pre = pre
+        self.post = post
+        self.dev = dev
+        self.local = local
+        self._text = _text
+        self._key = _sort_key(self)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def parse(text):
+        """
+        Parses a version string. Versions are immutable, so the same object is
+        returned for the same string
+        """
+        match = _VERSION_PATTERN.match(text)
+
+        if match is None:
+            raise ValueError(f"Invalid version: {text!r}")
+
+        pre = post = None
+
+        if match["pre_l"]:
+            pre = (_PRE_LABELS[match["pre_l"].lower()], int(match["pre_n"] or 0))
+
+        if match["post_n1"] or match["post_l"]:
+            post = int(match["post_n1"] or match["post_n2"] or 0)
+
+        return Version(
+            release=(int(part) for part in match["release"].split(".")),
+            pre=pre,
+            post=post,
+            dev=int(match["dev_n"] or 0) if match["dev_l"] else None,
+            epoch=int(match["epoch"] or 0),
+            local=match["local"],
+            _text=text.strip(),
+        )
+
+    @property
+    def major(self):
+        return self.release[0]
+
+    @property
+    def minor(self):
+        return self.release[1] if len(self.release) > 1 else 0
+
+    @property
+    def micro(self):
+        return self.release[2] if len(self.release) > 2 else 0
+
+    @property
+    def is_prerelease(self):
+        """True for alpha, beta and release candidates (e.g., "1.0b1")"""
+        return self.pre is not None
+
+    @property
+    def is_devrelease(self):
+        return self.dev is not None
+
+    def replace(self, **kwargs):
+        """Returns a copy with some segments replaced"""
+        values = {
+            "release": self.release,
+            "pre": self.pre,
+            "post": self.post,
+            "dev": self.dev,
+            "epoch": self.epoch,
+            "local": self.local,
+        }
+        values.update(kwargs)
+        return Version(**values)
+
+    def complete(self):
+        """Returns the version with (at least) three release numbers, e.g.,
+        1.2 -> 1.2.0
+        """
+        if len(self.release) >= 3:
+            return self
+
+        return self.replace(release=self.release + (0,) * (3 - len(self.release)))
+
+    def without_dev(self):
+        """Returns the version without the dev segment, e.g., 1.2dev -> 1.2"""
+        return self if self.dev is None else self.replace(dev=None)
+
+    def bump(self, part):
+        """
+        Returns the next version. ``part`` is one of "major", "minor" and
+        "patch" (e.g., 1.2.3 -> 1.3.0 with "minor", dropping pre, post and dev
+        segments), or "pre", "post" and "dev" (e.g., 1.0b1 -> 1.0b2 with "pre").
+        Release numbers after the bumped one are reset, not dropped (e.g.,
+        1.2.3.4 -> 1.2.4.0 with "patch")
+        """
+        if part in _RELEASE_PARTS:
+            idx = _RELEASE_PARTS[part]
+            release = list(self.complete().release)
+            release[idx] += 1
+            release[idx + 1 :] = [0] * (len(release) - idx - 1)
+            return Version(release, epoch=self.epoch)
+        elif part == "pre":
+            if self.pre is None:
+                raise ValueError(f"{self} is not a pre-release")
+
+            return self.replace(pre=(self.pre[0], self.pre[1] + 1), post=None, dev=None)
+        elif part == "post":
+            return self.replace(post=(self.post or 0) + 1, dev=None)
+        elif part == "dev":
+            return self.replace(dev=0 if self.dev is None else self.dev + 1)
+        else:
+            raise ValueError(
+                f"Invalid part: {part!r}. Valid values are: "
+                "major, minor, patch, pre, post, dev"
+            )
+
+    def __str__(self) -> str:
+        if self._text is not None:
+            return self._text
+
+        text = f"{self.epoch}!" if self.epoch else ""
+        text += ".".join(str(part) for part in self.release)
+
+        if self.pre is not None:
+            text += f"{self.pre[0]}{self.pre[1]}"
+
+        if self.post is not None:
+            text += f".post{self.post}"
+
+        if self.dev is not None:
+            text += "dev" if self.dev == 0 else f"dev{self.dev}"
+
+        if self.local is not None:
+            text += f"+{self.local}"
+
+        return text
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({str(self)!r})"
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    # strings aren't parsed when comparing: equal objects must have the same
+    # hash, and "1.0" and "1.0.0" can't have the same hash as 1.0
+
+    def __eq__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+
+        return self._key == other._key
+
+    def __lt__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+
+        return self._key < other._key
+
+
+def _sort_key(version):
+    # trailing zeros don't matter: 1.0 == 1.0.0
+    release = list(version.release)
+
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+
+    # dev releases sort before pre-releases (1.0dev < 1.0a1), final releases
+    # sort after pre-releases (1.0rc1 < 1.0)
+    if version.pre is None and version.post is None and version.dev is not None:
+        pre = (-1,)
+    elif version.pre is None:
+        pre = (1,)
     else:
-        prerelease_part = ""
+        pre = (0, _PRE_ORDER[version.pre[0]], version.pre[1])
+
+    post = (-1,) if version.post is None else (0, version.post)
+    dev = (1,) if version.dev is None else (0, version.dev)
+    local = (
+        ()
+        if version.local is None
+        else tuple(
+            (1, int(part), "") if part.isdigit() else (0, 0, part.lower())
+            for part in re.split(r"[-_.]", version.local)
+        )
+    )
 
-    return version.replace(prerelease_part, ""), prerelease_part
+    return version.epoch, tuple(release), pre, post, dev, local
 
 
-def complete_version_string(version):
-    part_version, part_prerelease = _split_prerelease_part(version)
-    elements = len(part_version.split("."))
+def is_pre_release(version):
+    return Version.parse(str(version)).is_prerelease
 
-    if elements < 3:
-        missing = 3 - elements
-        suffix = ".".join(["0"] * missing)
-        version = f"{part_version}.{suffix}"
 
-    if not version.endswith(part_prerelease):
-        version = version + part_prerelease
+def is_major_version(version):
+    return Version.parse(str(version)).micro == 0
+
 
-    return version
+def _split_prerelease_part(version):
+    parsed = Version.parse(version)
+    part_version = ".".join(str(part) for part in parsed.release)
+    part_prerelease = "" if parsed.pre is None else f"{parsed.pre[0]}{parsed.pre[1]}"
+    return part_version, part_prerelease
+
+
+def complete_version_string(version):
+    return str(Version.parse(str(version)).complete())
 
 
 def find_package_in_src(project_root="."):
@@ -68,7 +307,7 @@ def find_package_in_src(project_root="."):
         [
             f
             for f in os.listdir(path_to_src)
-            if Path("src", f).is_dir()
+            if Path(path_to_src, f).is_dir()
             and not f.endswith(".egg-info")
             and Path(f).name != "__pycache__"
         ]
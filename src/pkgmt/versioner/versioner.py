@@ -8,28 +8,85 @@ from pathlib import Path
 import click
 
 from pkgmt.versioner.util import (
-    complete_version_string,
+    Version,
     find_package_and_version_file,
     find_package_of_version_file,
     validate_version_file,
 )
+from pkgmt.versioner.patch import PatchSet
+from pkgmt import project
 from pkgmt.config import Config
 
 
-def replace_in_file(path_to_file, original, replacement):
-    """Replace string in file"""
-    with open(path_to_file, "r+") as f:
-        content = f.read()
-        updated = content.replace(original, replacement)
-        f.seek(0)
-        f.write(updated)
-        f.truncate()
-
-
 def call(*args, **kwargs):
     return subprocess.run(*args, **kwargs, check=True)
 
 
+_VERSION_RE = re.compile(r"__version__\s+=\s+(.*)")
+
+_VERSION_ASSIGNMENT_RE = re.compile(
+    r"^(?P<prefix>__version__\s*=\s*)(?P<quote>[\"'])(?P<value>.*?)(?P=quote)",
+    re.MULTILINE,
+)
+
+
+def _read_version(path):
+    with open(path, "rb") as f:
+        return str(
+            ast.literal_eval(_VERSION_RE.search(f.read().decode("utf-8")).group(1))
+        )
+
+
+def replace_version(content, new_version):
+    """
+    Replaces the value in the ``__version__`` assignment (other occurrences
+    of the version string are kept)
+    """
+    content, count = _VERSION_ASSIGNMENT_RE.subn(
+        lambda m: f"{m['prefix']}{m['quote']}{new_version}{m['quote']}",
+        content,
+        count=1,
+    )
+
+    if not count:
+        raise click.ClickException(
+            "Could not find the __version__ value. Please add it in the format"
+            " __version__ = '0.1dev'"
+        )
+
+    return content
+
+
+def _edit(path, edit, patches=None):
+    """
+    Calls ``edit`` with the content of ``path`` and stores the value it
+    returns in ``patches``. If ``patches`` is None, it writes the file
+    """
+    target = PatchSet() if patches is None else patches
+    target.write(path, edit(target.read(path)))
+
+    if patches is None:
+        target.apply()
+
+
+def push_refs(tags=None):
+    """
+    Pushes the current branch (and ``tags``) with a single atomic push: either
+    every ref is updated in the remote or none is
+    """
+    refs = ["HEAD"] + [f"refs/tags/{tag}" for tag in tags or []]
+    print("Pushing {}...".format(", ".join(tags or ["commits"])))
+    call(["git", "push", "--atomic", "--no-verify", "origin", *refs])
+
+
+def _find_changelog(project_root):
+    for name in ("CHANGELOG.rst", "CHANGELOG.md"):
+        if Path(project_root, name).exists():
+            return Path(project_root, name)
+
+    return None
+
+
 def make_header(content, path, add_date=False):
     if add_date:
         today = datetime.datetime.now().strftime("%Y-%m-%d")
@@ -80,48 +137,50 @@ class Versioner:
             version_file_name,
         ) = find_package_and_version_file(project_root)
 
-        if Path(project_root, "CHANGELOG.rst").exists():
-            path_to_changelog = Path(project_root, "CHANGELOG.rst")
-        elif Path(project_root, "CHANGELOG.md").exists():
-            path_to_changelog = Path(project_root, "CHANGELOG.md")
-        else:
-            path_to_changelog = None
-
-        return cls(package_name, path_to_package, version_file_name, path_to_changelog)
+        return cls(
+            package_name,
+            path_to_package,
+            version_file_name,
+            _find_changelog(project_root),
+        )
 
     @classmethod
-    def from_pyproject_toml(cls):
-        cfg = Config.from_file("pyproject.toml")
+    def from_pyproject_toml(cls, project_root=None):
+        """
+        Parameters
+        ----------
+        project_root : str, default="."
+            Path to project root (where pyproject.toml is), the version file
+            path in pyproject.toml is relative to it
+        """
+        project_root = project_root or "."
+
+        cfg = Config.from_file("pyproject.toml", directory=project_root)
         version_file = cfg.get("version", {}).get("version_file", None)
         validate_version_file(version_file)
 
         package_name, path_to_package, version_file_name = find_package_of_version_file(
-            version_file
+            Path(project_root, version_file)
         )
 
-        project_root = Path()
-
-        # consolidate since this is duplicated
-        if Path(project_root, "CHANGELOG.rst").exists():
-            path_to_changelog = Path(project_root, "CHANGELOG.rst")
-        elif Path(project_root, "CHANGELOG.md").exists():
-            path_to_changelog = Path(project_root, "CHANGELOG.md")
-        else:
-            path_to_changelog = None
-
-        return cls(package_name, path_to_package, version_file_name, path_to_changelog)
+        return cls(
+            package_name,
+            path_to_package,
+            version_file_name,
+            _find_changelog(project_root),
+        )
 
     @classmethod
     def load(cls, project_root=None):
         use_pyproject = False
 
-        if Path("pyproject.toml").exists():
-            cfg = Config.from_file("pyproject.toml")
+        if Path(project_root or ".", "pyproject.toml").exists():
+            cfg = Config.from_file("pyproject.toml", directory=project_root)
             version_file = cfg.get("version", {}).get("version_file", None)
             use_pyproject = version_file is not None
 
         if use_pyproject:
-            return cls.from_pyproject_toml()
+            return cls.from_pyproject_toml(project_root=project_root)
         else:
             return cls.from_project_root(project_root=project_root)
 
@@ -131,85 +190,99 @@ class Versioner:
 
     def current_version(self):
         """Returns the current version in version file"""
-        _version_re = re.compile(r"__version__\s+=\s+(.*)")
-
-        with open(self.path_to_package / self.version_file, "rb") as f:
-            try:
-                VERSION = str(
-                    ast.literal_eval(
-                        _version_re.search(f.read().decode("utf-8")).group(1)
-                    )
-                )
-            except AttributeError:
-                raise click.ClickException(
-                    f"Please add version string in "
-                    f"{self.get_version_file_path()}, e.g., __version__ = '0.1dev'"
-                )
-            except SyntaxError:
-                raise click.ClickException(
-                    f"Could not find __version__ value in "
-                    f"{self.get_version_file_path()}. Please add in the format"
-                    f" __version__ = '0.1dev'"
-                )
-
-        return VERSION
+        try:
+            # the file is read once per invocation (unless it changes)
+            return project.context().load(
+                self.path_to_package / self.version_file, _read_version
+            )
+        except AttributeError:
+            raise click.ClickException(
+                f"Please add version string in "
+                f"{self.get_version_file_path()}, e.g., __version__ = '0.1dev'"
+            )
+        except SyntaxError:
+            raise click.ClickException(
+                f"Could not find __version__ value in "
+                f"{self.get_version_file_path()}. Please add in the format"
+                f" __version__ = '0.1dev'"
+            )
 
     def release_version(self):
         """
         Returns a release version number
         e.g. 2.4.4dev -> v.2.2.4
         """
-        current = self.current_version()
+        current = Version.parse(self.current_version())
 
-        if "dev" not in current:
+        if not current.is_devrelease:
             raise ValueError("Current version is not a dev version")
 
-        new = current.replace("dev", "")
-
-        return complete_version_string(new)
+        return str(current.without_dev().complete())
 
-    def bump_up_version(self):
+    def bump_up_version(self, current=None):
         """
         Gets a the current released version and returns the next value.
         e.g. 1.2.5 -> 1.2.6dev
 
+        Parameters
+        ----------
+        current : str, default=None
+            Version to bump up, defaults to the one in the version file
+
         Notes
         -----
         If a doing a pre-release (e.g., 1.0b1), the new version returns to dev
         (e.g., 1.0b1 -> 1.0dev)
         """
         # Get current version
-        current = self.current_version()
+        current = Version.parse(current or self.current_version())
 
         # pre-releases
-        for pre in ["a", "b", "rc"]:
-            if pre in current:
-                prefix = current.split(pre)[0]
-                return f"{prefix}dev"
+        if current.is_prerelease:
+            return str(current.replace(pre=None, post=None, dev=0))
 
-        if "dev" in current:
+        if current.is_devrelease:
             raise ValueError(
                 "Current version is dev version, new dev "
                 "versions can only be made from release versions"
             )
 
-        # Get Z from X.Y.Z and sum 1
-        tokens = current.split(".")
+        # bump up the last release number, e.g. from 0.8 -> 0.8.1dev and
+        # from 1.2.3.4 -> 1.2.3.5dev
+        release = current.complete().release
+        return str(
+            Version(release[:-1] + (release[-1] + 1,), epoch=current.epoch, dev=0)
+        )
 
-        # if just released a major version, add a 0 so we bump up a subversion
-        # e.g. from 0.8 -> 0.8.0, then new dev version becomes 0.8.1dev
-        if len(tokens) == 2:
-            tokens.append("0")
+    def files_to_commit(self):
+        """Files edited when releasing: the version file and the CHANGELOG"""
+        files = [str(self.path_to_package / self.version_file)]
 
-        new_subversion = int(tokens[-1]) + 1
+        if self.path_to_changelog:
+            files.append(str(self.path_to_changelog))
 
-        # Replace new_subversion in current version
-        tokens[-1] = str(new_subversion)
-        new_version = ".".join(tokens) + "dev"
+        return files
 
-        return new_version
+    def set_version(self, new_version, patches=None):
+        """
+        Replaces the version in the version file. If ``patches`` is passed, the
+        edit is added to it instead of writing the file
+        """
+        _edit(
+            self.path_to_package / self.version_file,
+            lambda content: replace_version(content, new_version),
+            patches,
+        )
 
-    def commit_version(self, new_version, msg_template, tag=False, push=True):
+    def commit_version(
+        self,
+        new_version,
+        msg_template,
+        tag=False,
+        push=True,
+        patches=None,
+        tag_template="{new_version}",
+    ):
         """
         Replaces version in  __init__ and optionally creates a tag in the git
         repository (also saves a commit)
@@ -220,43 +293,58 @@ class Versioner:
             If True, it adds ``new_version`` as tag.
 
         push : bool, default=True
-            If True, it pushes the commit with ``new_version`` and the tag
-        """
-        current = self.current_version()
+            If True, it pushes the commit with ``new_version`` and the tag. Pass
+            False to create several commits and push them at once with
+            ``push_refs``
 
-        # replace new version in version file
-        replace_in_file(self.path_to_package / self.version_file, current, new_version)
+        patches : PatchSet, default=None
+            Other edits to include in the commit (e.g., to the CHANGELOG), they
+            are written together with the version file
 
-        # Run git add and git status
-        print("Adding new changes to the repository...")
-        call(["git", "add", "--all"])
-        call(["git", "status"])
+        tag_template : str, default="{new_version}"
+            Name of the tag, formatted with ``package_name`` and ``new_version``
 
-        # Commit repo with updated dev version
+        Returns
+        -------
+        str or None
+            The name of the tag, if one was created
+        """
+        patches = PatchSet() if patches is None else patches
+        self.set_version(new_version, patches)
+        patches.apply()
+
+        # Commit repo with updated dev version. Passing the files commits only
+        # them, so git doesn't have to scan the whole working tree to stage
+        # changes
         print("Creating new commit release version...")
         msg = msg_template.format(
             package_name=self.package_name, new_version=new_version
         )
-        call(["git", "commit", "-m", msg])
+        call(["git", "commit", "-m", msg, "--", *self.files_to_commit()])
 
         # Create tag
         if tag:
-            print("Creating tag {}...".format(new_version))
+            name = tag_template.format(
+                package_name=self.package_name, new_version=new_version
+            )
+            print("Creating tag {}...".format(name))
             message = msg_template.format(
                 package_name=self.package_name, new_version=new_version
             )
-            call(["git", "tag", "-a", new_version, "-m", message])
-
-            if push:
-                print("Pushing tags...")
-                call(["git", "push", "origin", new_version, "--no-verify"])
-        elif push:
-            # no tag but push
-            print("Pushing...")
-            call(["git", "push", "--no-verify"])
-
-    def update_changelog_release(self, new_version):
-        """Updates changelog file, adding a new section"""
+            call(["git", "tag", "-a", name, "-m", message])
+        else:
+            name = None
+
+        if push:
+            push_refs(tags=[name] if name else None)
+
+        return name
+
+    def update_changelog_release(self, new_version, patches=None):
+        """
+        Updates changelog file, adding a new section. If ``patches`` is passed,
+        the edit is added to it instead of writing the file
+        """
         current_version = self.current_version()
 
         # update CHANGELOG header
@@ -266,9 +354,18 @@ class Versioner:
 
         header_new = make_header(new_version, self.path_to_changelog, add_date=True)
 
-        replace_in_file(self.path_to_changelog, header_current, header_new)
+        # only the header, the version might appear in older sections
+        _edit(
+            self.path_to_changelog,
+            lambda content: content.replace(header_current, header_new, 1),
+            patches,
+        )
 
-    def add_changelog_new_dev_section(self, dev_version):
+    def add_changelog_new_dev_section(self, dev_version, patches=None):
+        """
+        Adds a section for ``dev_version``. If ``patches`` is passed, the edit
+        is added to it instead of writing the file
+        """
         if self.path_to_changelog:
             if self.path_to_changelog.suffix == ".rst":
                 start_current = "CHANGELOG\n========="
@@ -277,6 +374,10 @@ class Versioner:
 
             new_header = make_header(dev_version, self.path_to_changelog)
             start_new = f"{start_current}\n\n{new_header}"
-            replace_in_file(self.path_to_changelog, start_current, start_new)
+            _edit(
+                self.path_to_changelog,
+                lambda content: content.replace(start_current, start_new, 1),
+                patches,
+            )
         else:
             print("No CHANGELOG.{rst,md} found, skipping changelog editing...")
@@ -0,0 +1,244 @@
+"""
+Monorepo support for pkgmt version --all/--changed: finds the packages in a
+workspace, the ones that changed since their last release and the order to
+release them in
+
+Packages are the directories listed in the workspace configuration:
+
+[tool.pkgmt.workspace]
+members = ["packages/*"]
+
+Or, if there isn't one, every directory (below the root) with a
+pyproject.toml tracked by git
+"""
+
+import re
+import subprocess
+import concurrent.futures
+from glob import glob
+from pathlib import Path
+from graphlib import TopologicalSorter, CycleError
+
+import click
+
+from pkgmt import config, project
+from pkgmt.changelog import CHANGELOG
+from pkgmt.deprecation import Deprecations
+from pkgmt.versioner.versioner import Versioner
+
+_REQUIREMENT_NAME = re.compile(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+class Package:
+    """A package in the workspace
+
+    Parameters
+    ----------
+    name : str
+        Distribution name (normalized, e.g., "my-package")
+
+    path : pathlib.Path
+        Directory with the package's pyproject.toml
+
+    requires : iterable, default=()
+        Names of the (normalized) distributions it depends on
+
+    Attributes
+    ----------
+    dependencies : set
+        Names of the packages in the workspace it depends on (set by
+        ``discover``)
+    """
+
+    def __init__(self, name, path, requires=()) -> None:
+        self.name = name
+        self.path = Path(path)
+        self.requires = set(requires)
+        self.dependencies = set()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name!r}, {str(self.path)!r})"
+
+
+def normalize_name(name):
+    """Normalize a distribution name (PEP 503)"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def discover(root="."):
+    """Returns the packages in the workspace, sorted by path"""
+    root = Path(root)
+    cfg = config.Config.from_file("pyproject.toml", directory=root)
+    members = cfg.get("workspace", {}).get("members")
+
+    if members is None:
+        directories = _tracked_projects(root)
+    else:
+        directories = sorted(
+            {
+                Path(path)
+                for pattern in members
+                for path in glob(str(root / pattern))
+                if Path(path, "pyproject.toml").is_file()
+            }
+        )
+
+    packages = [_load_package(directory) for directory in directories]
+
+    by_name = {}
+
+    for package in packages:
+        if package.name in by_name:
+            raise click.ClickException(
+                f"Found two packages named {package.name!r} in the workspace: "
+                f"{by_name[package.name].path} and {package.path}"
+            )
+
+        by_name[package.name] = package
+
+    for package in packages:
+        package.dependencies = (package.requires & set(by_name)) - {package.name}
+
+    return packages
+
+
+def _tracked_projects(root):
+    out = subprocess.check_output(
+        ["git", "ls-files", "-z", "--", ":(glob)**/pyproject.toml"], cwd=root
+    )
+    return sorted(
+        root / Path(path).parent
+        for path in out.decode().split("\0")
+        if path and Path(path).parent != Path(".")
+    )
+
+
+def _load_package(directory):
+    data = project.context().load(directory / "pyproject.toml", config._load_toml)
+    metadata = data.get("project", {})
+    requires = [
+        normalize_name(match.group(1))
+        for match in (
+            _REQUIREMENT_NAME.match(requirement)
+            for requirement in metadata.get("dependencies", [])
+        )
+        if match
+    ]
+    return Package(
+        normalize_name(metadata.get("name", directory.name)), directory, requires
+    )
+
+
+def changed(packages, root="."):
+    """
+    Returns the packages with commits since their last release (or that
+    haven't been released). The history is read newest to oldest, in a single
+    ``git log`` call, until every package is settled
+    """
+    # a package is released when its dev commit (or, with --target stable,
+    # its release commit) is made
+    markers = {}
+
+    for package in packages:
+        name = Versioner.load(package.path).package_name
+        markers[package.name] = (f"Bumps up {name} to version ", f"{name} release ")
+
+    pending = {package.name: package for package in packages}
+    prefixes = {
+        package.name: Path(package.path).relative_to(root).as_posix() + "/"
+        for package in packages
+    }
+    found = set()
+
+    with subprocess.Popen(
+        ["git", "log", "--relative", "--name-only", "--format=%x00%s"],
+        cwd=root,
+        stdout=subprocess.PIPE,
+        text=True,
+    ) as proc:
+        for line in proc.stdout:
+            line = line.rstrip("\n")
+
+            if line.startswith("\0"):
+                subject = line[1:]
+
+                for name in list(pending):
+                    if subject.startswith(markers[name]):
+                        del pending[name]
+            elif line:
+                for name in list(pending):
+                    if line.startswith(prefixes[name]):
+                        found.add(name)
+                        del pending[name]
+
+            if not pending:
+                proc.kill()
+                break
+
+    if pending and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+    # never released
+    found.update(pending)
+
+    return [package for package in packages if package.name in found]
+
+
+def release_order(packages):
+    """Sorts packages so every package comes after its dependencies"""
+    by_name = {package.name: package for package in packages}
+    sorter = TopologicalSorter()
+
+    for package in sorted(packages, key=lambda p: p.name):
+        sorter.add(package.name, *sorted(package.dependencies & set(by_name)))
+
+    try:
+        return [by_name[name] for name in sorter.static_order()]
+    except CycleError as e:
+        raise click.ClickException(
+            f"Found a dependency cycle in the workspace: {' -> '.join(e.args[1])}"
+        ) from e
+
+
+def _check(package):
+    versioner = Versioner.load(package.path)
+
+    if versioner.path_to_changelog and versioner.path_to_changelog.suffix == ".md":
+        CHANGELOG.from_path(
+            versioner.path_to_changelog, project_root=package.path, lazy=True
+        ).check()
+        Deprecations(root_dir=package.path).check()
+
+
+def check(packages, max_workers=None):
+    """
+    Runs the CHANGELOG and deprecation checks of every package concurrently,
+    raises a single error listing all packages that failed
+    """
+    errors = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_package = {
+            executor.submit(_check, package): package for package in packages
+        }
+
+        for future in concurrent.futures.as_completed(future_to_package):
+            package = future_to_package[future]
+
+            # any error (e.g., a missing version file) is reported along with
+            # the rest of the packages
+            try:
+                future.result()
+            except click.ClickException as e:
+                errors[package.name] = (package, e.format_message())
+            except Exception as e:
+                errors[package.name] = (package, f"{type(e).__name__}: {e}")
+
+    if errors:
+        errors_ = "\n\n".join(
+            f"- {package.path}: {error}"
+            for package, error in (errors[name] for name in sorted(errors))
+        )
+        raise click.ClickException(
+            f"Found errors in {len(errors)} package(s):\n\n{errors_}"
+        )
@@ -0,0 +1,415 @@
+"""
+Benchmarks for pkgmt check-links. Not collected by pytest, run it with:
+
+    python tests/benchmark_links.py extract --size-mb 50
+    python tests/benchmark_links.py check --files 100 --links 20 --workers 10 50
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import multiprocessing
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from pkgmt import links
+from pkgmt.links_ratelimit import HostRateLimiter, RetryPolicy
+
+_WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "(see", "below)", "`code`"]
+
+
+def _paragraph(rng, n_links):
+    words = [rng.choice(_WORDS) for _ in range(60)]
+
+    for _ in range(n_links):
+        idx = rng.randrange(len(words))
+        url = f"https://example-{rng.randrange(100)}.com/docs/{rng.randrange(10**6)}"
+        words[idx] = rng.choice([url, f"[link]({url})", f"<{url}>.", f"{url}#intro,"])
+
+    return " ".join(words)
+
+
+def make_corpus(root, size_mb, links_per_paragraph=3, seed=0):
+    """Write markdown files and notebooks (half of the bytes each) to root"""
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024 // 2
+    root = Path(root)
+
+    written, idx = 0, 0
+
+    while written < target:
+        text = "\n\n".join(
+            f"## Section {i}\n\n{_paragraph(rng, links_per_paragraph)}"
+            for i in range(200)
+        )
+        path = root / f"doc-{idx}.md"
+        path.write_text(text)
+        written += len(text)
+        idx += 1
+
+    written, idx = 0, 0
+
+    while written < target:
+        cells = [
+            {
+                "cell_type": "markdown",
+                "metadata": {},
+                "source": _paragraph(rng, links_per_paragraph).splitlines(True),
+            }
+            for _ in range(200)
+        ]
+        content = json.dumps({"cells": cells, "metadata": {}, "nbformat": 4})
+        path = root / f"notebook-{idx}.ipynb"
+        path.write_text(content)
+        written += len(content)
+        idx += 1
+
+
+def benchmark_extract(size_mb, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        old = os.getcwd()
+        os.chdir(tmp)
+
+        try:
+            make_corpus(tmp, size_mb)
+
+            for extension in ("md", "ipynb"):
+                files = sorted(Path().glob(f"*.{extension}"))
+                size = sum(f.stat().st_size for f in files) / 1024 / 1024
+                timings = []
+
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    n_links = sum(len(links._find_in_file(f).valid) for f in files)
+                    timings.append(time.perf_counter() - start)
+
+                best = min(timings)
+                print(
+                    f"{extension:>6}: {size:.1f} MB, {n_links} links, "
+                    f"{best:.3f}s ({size / best:.1f} MB/s, {n_links / best:.0f} "
+                    "links/s)"
+                )
+        finally:
+            os.chdir(old)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Replies after ``latency`` seconds (plus ``slow_latency`` if the server is
+    slow). Paths decide the response so every run gets the same results:
+    /error/* returns 500, /missing/* returns 404 and /throttled/* returns 429
+    (with Retry-After: 0) the first time it's requested. DELETE resets it
+    """
+
+    # HTTP/1.1 so keep-alive connections can be reused
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    slow = False
+    slow_latency = 0.0
+    seen = set()
+    lock = threading.Lock()
+
+    def do_HEAD(self):
+        self.respond()
+
+    def do_GET(self):
+        self.respond()
+
+    def do_DELETE(self):
+        with self.lock:
+            self.seen.clear()
+
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def respond(self):
+        time.sleep(self.latency + (self.slow_latency if self.slow else 0))
+
+        if self.path.startswith("/error/"):
+            code = 500
+        elif self.path.startswith("/missing/"):
+            code = 404
+        elif self.path.startswith("/throttled/"):
+            with self.lock:
+                code = 200 if self.path in self.seen else 429
+                self.seen.add(self.path)
+        else:
+            code = 200
+
+        self.send_response(code)
+
+        if code == 429:
+            self.send_header("Retry-After", "0")
+
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(ports, n_hosts, n_slow, latency, slow_latency, ready, stop):
+    servers = []
+
+    for idx in range(n_hosts):
+        handler = type(
+            "Handler",
+            (MockHandler,),
+            {
+                "latency": latency,
+                "slow": idx < n_slow,
+                "slow_latency": slow_latency,
+                "seen": set(),
+            },
+        )
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        ports.append(server.server_port)
+
+    ready.set()
+    stop.wait()
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class MockServers:
+    """Run ``n_hosts`` HTTP servers (each one is a different host for the rate
+    limiter) in a separate process, so they don't add to the measured time and
+    memory
+    """
+
+    def __init__(self, n_hosts, n_slow=0, latency=0.0, slow_latency=0.0):
+        self._manager = multiprocessing.Manager()
+        self._ports = self._manager.list()
+        self._ready = multiprocessing.Event()
+        self._stop = multiprocessing.Event()
+        self._process = multiprocessing.Process(
+            target=_serve,
+            args=(
+                self._ports,
+                n_hosts,
+                n_slow,
+                latency,
+                slow_latency,
+                self._ready,
+                self._stop,
+            ),
+            daemon=True,
+        )
+
+    def __enter__(self):
+        self._process.start()
+        self._ready.wait()
+        return [f"http://127.0.0.1:{port}" for port in self._ports]
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._process.join()
+        self._manager.shutdown()
+
+
+def make_link_tree(root, hosts, n_files, n_links, error_rate, throttle_rate, seed=0):
+    """Write ``n_files`` markdown files with ``n_links`` links each, spread
+    across hosts. A fraction of the links is broken (half 404, half 500) or
+    throttled the first time they're requested
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+
+    for idx in range(n_files):
+        lines = []
+
+        for _ in range(n_links):
+            value = rng.random()
+
+            if value < error_rate:
+                kind = rng.choice(["missing", "error"])
+            elif value < error_rate + throttle_rate:
+                kind = "throttled"
+            else:
+                kind = "page"
+
+            # some links repeat across files, like in real docs
+            page = rng.randrange(n_files * n_links)
+            lines.append(f"See [page]({rng.choice(hosts)}/{kind}/{page}).")
+
+        (root / f"doc-{idx}.md").write_text("\n\n".join(lines))
+
+
+def _percentile(values, q):
+    if not values:
+        return float("nan")
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def run_check(mapping, engine, workers, rate):
+    """Check the links in mapping, returns a dict with the measurements"""
+    latencies = []
+
+    def on_result(response):
+        if response.latency is not None:
+            latencies.append(response.latency)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    broken = links._find_broken_links(
+        mapping,
+        broken_http_codes=None,
+        engine=engine,
+        max_workers=workers,
+        rate_limiter=HostRateLimiter(rate=rate, burst=rate),
+        retry_policy=RetryPolicy(retries=2, backoff=0.01),
+        on_result=on_result,
+    )
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "engine": engine,
+        "workers": workers,
+        "urls": len(latencies),
+        "broken": len(broken),
+        "seconds": elapsed,
+        "urls_per_second": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def benchmark_check(args):
+    engines = [engine for engine in args.engines if engine in links.ENGINES]
+
+    if "async" in engines and links.httpx is None:
+        print("httpx is not installed, skipping the async engine")
+        engines.remove("async")
+
+    results = []
+
+    with MockServers(
+        args.hosts,
+        n_slow=args.slow_hosts,
+        latency=args.latency,
+        slow_latency=args.slow_latency,
+    ) as hosts, tempfile.TemporaryDirectory() as tmp:
+        old = os.getcwd()
+        os.chdir(tmp)
+
+        try:
+            make_link_tree(
+                tmp,
+                hosts,
+                args.files,
+                args.links,
+                error_rate=args.error_rate,
+                throttle_rate=args.throttle_rate,
+            )
+            mapping = links._find_links_in_files(["md"])
+            total = sum(len(found.valid) for found in mapping.values())
+            print(
+                f"{len(mapping)} files, {total} links, {args.hosts} hosts "
+                f"({args.slow_hosts} slow)\n"
+            )
+            print(
+                f"{'engine':>7} {'workers':>7} {'urls':>6} {'broken':>6} "
+                f"{'seconds':>8} {'urls/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+                f"{'peak MB':>8}"
+            )
+
+            for engine in engines:
+                for workers in args.workers:
+                    # every run gets the same 429s
+                    for host in hosts:
+                        requests.delete(host)
+
+                    result = run_check(mapping, engine, workers, args.rate)
+                    results.append(result)
+                    print(
+                        f"{engine:>7} {workers:>7} {result['urls']:>6} "
+                        f"{result['broken']:>6} {result['seconds']:>8.2f} "
+                        f"{result['urls_per_second']:>8.1f} "
+                        f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                        f"{result['peak_mb']:>8.2f}"
+                    )
+        finally:
+            os.chdir(old)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=4))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    extract = subparsers.add_parser("extract", help="Link extraction from files")
+    extract.add_argument("--size-mb", type=int, default=10)
+    extract.add_argument("--repeat", type=int, default=3)
+
+    check = subparsers.add_parser(
+        "check", help="Link checking against local mock servers"
+    )
+    check.add_argument("--files", type=int, default=50, help="Number of files")
+    check.add_argument("--links", type=int, default=20, help="Links per file")
+    check.add_argument("--hosts", type=int, default=5, help="Number of servers")
+    check.add_argument(
+        "--slow-hosts", type=int, default=1, help="How many servers are slow"
+    )
+    check.add_argument(
+        "--latency", type=float, default=0.01, help="Seconds per response"
+    )
+    check.add_argument(
+        "--slow-latency",
+        type=float,
+        default=0.2,
+        help="Extra seconds per response in slow servers",
+    )
+    check.add_argument(
+        "--error-rate", type=float, default=0.05, help="Fraction of 404/500 links"
+    )
+    check.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.05,
+        help="Fraction of links that get a 429 the first time",
+    )
+    check.add_argument(
+        "--rate",
+        type=float,
+        default=1000,
+        help="Requests per second per host allowed by the rate limiter",
+    )
+    check.add_argument(
+        "--engines", nargs="+", default=list(links.ENGINES), choices=links.ENGINES
+    )
+    check.add_argument("--workers", nargs="+", type=int, default=[10, 50])
+    check.add_argument("--output", help="Store the results in a JSON file")
+
+    args = parser.parse_args()
+
+    if args.benchmark == "extract":
+        benchmark_extract(args.size_mb, args.repeat)
+    elif args.benchmark == "check":
+        benchmark_check(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
+import os
+import io
+import json
+import sqlite3
+import time
+import threading
 from pathlib import Path
+
+import click
 import pytest
+import requests
 
-from pkgmt import changelog
+from pkgmt import changelog, changelog_enrich, config
 from pkgmt.exceptions import ProjectValidationError
 
 
@@ -19,10 +28,10 @@ from pkgmt.exceptions import ProjectValidationError
         ),
     ],
 )
-def test_replace_issue_numbers_with_links(input, output):
+def test_expand_github_references(input, output):
     assert (
-        changelog._replace_issue_number_with_links(
-            "https://github.com/edublancas/pkgmt/issues/", input
+        changelog._expand_github_references(
+            input, "https://github.com/edublancas/pkgmt/issues/"
         )
         == output
     )
@@ -56,6 +65,11 @@ def test_replace_issue_numbers_with_links(input, output):
             "by [@edublancas](https://github.com/edublancas)",
             "by [@edublancas](https://github.com/edublancas)",
         ),
+        (
+            "Pins `pkg#1` and ``@decorator`` (#2)",
+            "Pins `pkg#1` and ``@decorator`` "
+            "([#2](https://github.com/edublancas/pkgmt/issues/2))",
+        ),
     ],
 )
 def test_expand_github_from_text(tmp_empty, input, output):
@@ -73,6 +87,38 @@ github = "edublancas/pkgmt"
     assert output == Path("CHANGELOG.md").read_text()
 
 
+@pytest.mark.parametrize(
+    "all_sections, expected",
+    [
+        [
+            False,
+            "# CHANGELOG\n\n## 0.2dev\n\n"
+            "* [Fix] [#2](https://github.com/edublancas/pkgmt/issues/2)\n\n"
+            "## 0.1\n\n* [Fix] #1\n",
+        ],
+        [
+            True,
+            "# CHANGELOG\n\n## 0.2dev\n\n"
+            "* [Fix] [#2](https://github.com/edublancas/pkgmt/issues/2)\n\n"
+            "## 0.1\n\n* [Fix] [#1](https://github.com/edublancas/pkgmt/issues/1)\n",
+        ],
+    ],
+)
+def test_expand_github_from_changelog_sections(tmp_empty, all_sections, expected):
+    Path("pyproject.toml").write_text('[tool.pkgmt]\ngithub = "edublancas/pkgmt"\n')
+    Path("CHANGELOG.md").write_text(
+        "# CHANGELOG\n\n## 0.2dev\n\n* [Fix] #2\n\n## 0.1\n\n* [Fix] #1\n"
+    )
+
+    assert changelog.expand_github_from_changelog(all_sections=all_sections)
+    assert Path("CHANGELOG.md").read_text() == expected
+
+    # links are not expanded twice and the file isn't written again
+    mtime = Path("CHANGELOG.md").stat().st_mtime_ns
+    assert not changelog.expand_github_from_changelog(all_sections=all_sections)
+    assert Path("CHANGELOG.md").stat().st_mtime_ns == mtime
+
+
 @pytest.mark.parametrize(
     "text, items",
     [
@@ -420,3 +466,339 @@ def test_sort_last_section(text, expected):
     text_sorted = changelog.CHANGELOG(text).sort_last_section()
 
     assert text_sorted == expected
+
+
+def test_release_edits_are_written_once(tmp_package_name):
+    Path("CHANGELOG.md").write_text(
+        """\
+# CHANGELOG
+
+## 0.1dev
+
+* [Fix] Fixes #1 (`#2` is not an issue)
+* [Feature] Thanks @edublancas
+
+## 0.0.1
+
+* [Fix] Fixes #3
+"""
+    )
+
+    log = changelog.CHANGELOG.from_path("CHANGELOG.md")
+    log.set_release("0.1.0", date="2024-01-01")
+    log.expand_github(url="https://github.com/edublancas/pkgmt/issues/")
+    log.sort_latest_entries()
+
+    # edits only change the tree
+    assert Path("CHANGELOG.md").read_text().startswith("# CHANGELOG\n\n## 0.1dev")
+    assert log.get_first_subheading() == (2, "0.1.0 (2024-01-01)")
+
+    log.add_dev_section("0.1.1dev")
+    log.write()
+
+    assert log.get_first_subheading() == (2, "0.1.1dev")
+    assert log.get_latest_changelog_section() == []
+    assert (
+        Path("CHANGELOG.md").read_text()
+        == """\
+# CHANGELOG
+
+## 0.1.1dev
+
+## 0.1.0 (2024-01-01)
+
+* [Feature] Thanks [@edublancas](https://github.com/edublancas)
+* [Fix] Fixes [#1](https://github.com/edublancas/pkgmt/issues/1) (`#2` is not an issue)
+
+## 0.0.1
+
+* [Fix] Fixes #3
+"""
+    )
+
+
+def test_render_keeps_released_sections_as_written(tmp_package_name):
+    released = """\
+## 0.0.1
+
+* [Fix] Fixes a __bold__ bug
+    * Indented  entry
+
+Older release
+-------------
+
+* [Fix] Fixes #3
+"""
+    Path("CHANGELOG.md").write_text(
+        f"# CHANGELOG\n\n## 0.1dev\n\n* [Fix] Fixes #1\n\n{released}"
+    )
+
+    log = changelog.CHANGELOG.from_path("CHANGELOG.md")
+    log.set_release("0.1.0", date="2024-01-01")
+    log.expand_github(url="https://github.com/edublancas/pkgmt/issues/")
+
+    assert log.render() == (
+        "# CHANGELOG\n\n## 0.1.0 (2024-01-01)\n\n"
+        "* [Fix] Fixes [#1](https://github.com/edublancas/pkgmt/issues/1)\n\n"
+        f"{released}"
+    )
+
+    log.add_dev_section("0.1.1dev")
+
+    assert log.render().endswith(
+        "## 0.1.1dev\n\n## 0.1.0 (2024-01-01)\n\n"
+        "* [Fix] Fixes [#1](https://github.com/edublancas/pkgmt/issues/1)\n\n"
+        f"{released}"
+    )
+
+
+@pytest.mark.parametrize(
+    "text, head, truncated",
+    [
+        [
+            "# CHANGELOG\n\n## 0.2dev\n\n* [Fix] fix\n\n## 0.1\n\n* [Doc] doc\n",
+            "# CHANGELOG\n\n## 0.2dev\n\n* [Fix] fix\n\n## 0.1\n",
+            True,
+        ],
+        [
+            "# CHANGELOG\n\n## 0.2dev\n\n```\n## not a heading\n```\n\n## 0.1\n",
+            "# CHANGELOG\n\n## 0.2dev\n\n```\n## not a heading\n```\n\n## 0.1\n",
+            True,
+        ],
+        [
+            "## 0.2dev\n\n````\n```\n## nope\n````\n### 0.1\n\n##0.1\n",
+            "## 0.2dev\n\n````\n```\n## nope\n````\n### 0.1\n\n##0.1\n",
+            False,
+        ],
+    ],
+    ids=["simple", "fenced", "no-second-h2"],
+)
+def test_read_head(text, head, truncated):
+    assert changelog._read_head(io.StringIO(text)) == (head, truncated)
+
+
+@pytest.mark.parametrize("edit", ["check", "render"])
+def test_lazy_parses_the_rest_when_needed(tmp_package_name, edit):
+    Path("CHANGELOG.md").write_text(
+        """\
+# CHANGELOG
+
+## 0.1dev
+
+* [Fix] Fixes #1
+
+## 0.0.1
+
+* [Fix] Fixes #2
+"""
+    )
+
+    lazy = changelog.CHANGELOG.from_path("CHANGELOG.md", lazy=True)
+    full = changelog.CHANGELOG.from_path("CHANGELOG.md")
+
+    # only the first section (and the next heading) are parsed
+    assert len(lazy.tree) == len(full.tree) - 2
+    assert lazy.get_first_subheading() == full.get_first_subheading()
+    assert lazy.get_latest_changelog_section() == full.get_latest_changelog_section()
+
+    if edit == "check":
+        lazy.check()
+        assert len(lazy.tree) < len(full.tree)
+    else:
+        for log in (lazy, full):
+            log.set_release("0.1.0", date="2024-01-01")
+            log.expand_github(url="https://github.com/edublancas/pkgmt/issues/")
+
+        assert lazy.tree == full.tree
+        assert lazy.render() == full.render()
+
+
+@pytest.mark.parametrize(
+    "lines, expected",
+    [
+        [
+            ["## 0.2dev", "* [Fix] Fixes `x`", "- [Doc] [#1](url)", "some text"],
+            [None, "[Fix] Fixes x", "[Doc] #1", None],
+        ],
+        [
+            ["* [Fix] one", "```", "* [Fix] two"],
+            ["[Fix] one", None, "[Fix] two"],
+        ],
+        [[], []],
+    ],
+    ids=["batch", "code-fence", "empty"],
+)
+def test_extract_text_from_lines(lines, expected):
+    assert changelog.extract_text_from_lines(lines) == expected
+
+
+def test_expand_github_finds_config_in_parent_directory(tmp_empty):
+    Path("pyproject.toml").write_text('[tool.pkgmt]\ngithub = "edublancas/pkgmt"\n')
+    Path("doc").mkdir()
+    Path("doc", "CHANGELOG.md").write_text("* [Fix] #1")
+    os.chdir("doc")
+
+    changelog.expand_github_from_changelog()
+
+    assert Path("CHANGELOG.md").read_text() == (
+        "* [Fix] [#1](https://github.com/edublancas/pkgmt/issues/1)"
+    )
+
+
+def test_changelog_expand_github_finds_config_in_parent_directory(tmp_empty):
+    Path("pyproject.toml").write_text('[tool.pkgmt]\ngithub = "edublancas/pkgmt"\n')
+    Path("package", "src", "package_name").mkdir(parents=True)
+    Path("package", "src", "package_name", "__init__.py").write_text(
+        '__version__ = "0.1dev"\n'
+    )
+    Path("package", "CHANGELOG.md").write_text(
+        "# CHANGELOG\n\n## 0.1dev\n\n* [Fix] #1\n"
+    )
+    os.chdir("package")
+
+    md = changelog.CHANGELOG.from_path("CHANGELOG.md", project_root=".")
+    md.expand_github()
+
+    assert "[#1](https://github.com/edublancas/pkgmt/issues/1)" in md.render()
+
+
+class CountingBackend:
+    repository = "edublancas/pkgmt"
+
+    def __init__(self) -> None:
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def _call(self, key):
+        with self.lock:
+            self.calls.append(key)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+        time.sleep(0.01)
+
+        with self.lock:
+            self.running -= 1
+
+    def issue(self, number):
+        self._call(number)
+
+        if number == "500":
+            raise requests.exceptions.ConnectionError("API is down")
+
+        return {"kind": "pull", "title": f"PR {number}", "url": f"pull/{number}"}
+
+    def user(self, handle):
+        self._call(handle)
+        return {"name": None, "url": f"https://github.com/{handle}"}
+
+
+def test_enricher_caches_and_bounds_concurrency(tmp_empty):
+    backend = CountingBackend()
+    enricher = changelog_enrich.Enricher(
+        backend, cache=changelog_enrich.MetadataCache(), max_workers=2
+    )
+
+    resolved = enricher.resolve([str(n) for n in range(10)] + ["500"], ["ed"])
+
+    assert resolved[("issue", "3")] == {
+        "kind": "pull",
+        "title": "PR 3",
+        "url": "pull/3",
+    }
+    assert ("issue", "500") not in resolved
+    assert len(backend.calls) == 12
+    assert backend.max_running <= 2
+
+    # a new run (with a new connection to the cache) only fetches what failed
+    backend.calls.clear()
+    enricher = changelog_enrich.Enricher(
+        backend, cache=changelog_enrich.MetadataCache(), max_workers=2
+    )
+
+    assert enricher.resolve(["1", "500"], ["ed"]).keys() == {
+        ("issue", "1"),
+        ("user", "ed"),
+    }
+    assert backend.calls == ["500"]
+
+
+def test_expand_github_with_fixture_backend(tmp_empty):
+    Path("pyproject.toml").write_text(
+        """\
+[tool.pkgmt]
+github = "edublancas/pkgmt"
+
+[tool.pkgmt.changelog]
+enrich = "fixture"
+fixture = "github.json"
+"""
+    )
+    Path("github.json").write_text(
+        json.dumps(
+            {
+                "issues": {"1": {"kind": "pull", "title": 'Adds "quotes"'}},
+                "users": {"edublancas": {"name": "Eduardo"}},
+            }
+        )
+    )
+    Path("CHANGELOG.md").write_text("* [Fix] #1 and #2 by @edublancas and @someone")
+
+    with changelog_enrich.Enricher.from_config(
+        config.Config.from_file("pyproject.toml")
+    ) as enricher:
+        changelog.expand_github_from_changelog(enricher=enricher)
+
+    assert Path("CHANGELOG.md").read_text() == (
+        "* [Fix] [#1](https://github.com/edublancas/pkgmt/pull/1 "
+        '"Adds \\"quotes\\"") and '
+        "[#2](https://github.com/edublancas/pkgmt/issues/2) by "
+        '[@edublancas](https://github.com/edublancas "Eduardo") and '
+        "[@someone](https://github.com/someone)"
+    )
+
+
+def test_enricher_from_config_invalid_backend(tmp_empty):
+    Path("pyproject.toml").write_text(
+        '[tool.pkgmt]\ngithub = "edublancas/pkgmt"\n\n'
+        '[tool.pkgmt.changelog]\nenrich = "gitlab"\n'
+    )
+
+    with pytest.raises(click.ClickException) as excinfo:
+        changelog_enrich.Enricher.from_config(config.Config.from_file("pyproject.toml"))
+
+    assert "Invalid value for changelog.enrich: 'gitlab'" in str(excinfo.value)
+
+
+def test_enricher_from_config_cache_path(tmp_empty):
+    Path("package").mkdir()
+    Path("pyproject.toml").write_text(
+        '[tool.pkgmt]\ngithub = "edublancas/pkgmt"\n\n'
+        '[tool.pkgmt.changelog]\nenrich = "github"\n'
+    )
+    cfg = config.Config.from_file("pyproject.toml")
+
+    with changelog_enrich.Enricher.from_config(cfg, project_root="package") as enricher:
+        assert enricher.cache.path == Path("package", ".pkgmt", "cache", "github.db")
+        assert enricher.cache.path.exists()
+
+    # the connection to the cache is closed
+    with pytest.raises(sqlite3.ProgrammingError):
+        enricher.cache.get("key")
+
+
+def test_enricher_from_config_fixture_path(tmp_empty):
+    Path("package").mkdir()
+    Path("package", "github.json").write_text(
+        json.dumps({"issues": {"1": {"kind": "pull", "title": "Title"}}})
+    )
+    Path("pyproject.toml").write_text(
+        '[tool.pkgmt]\ngithub = "edublancas/pkgmt"\n\n'
+        '[tool.pkgmt.changelog]\nenrich = "fixture"\nfixture = "github.json"\n'
+    )
+    cfg = config.Config.from_file("pyproject.toml")
+
+    with changelog_enrich.Enricher.from_config(cfg, project_root="package") as enricher:
+        assert enricher.resolve(["1"], [])[("issue", "1")]["title"] == "Title"
@@ -85,7 +85,7 @@ def test_tag_push_config(
     result = runner.invoke(cli.cli, args)
 
     mock.assert_called_once_with(
-        project_root=".", tag=tag, yes=False, push=push, target=None
+        project_root=".", tag=tag, yes=False, push=push, target=None, plan=False
     )
     assert result.exit_code == 0
     assert message in result.output
@@ -104,23 +104,27 @@ extensions = ["md"]
     runner = CliRunner()
     result = runner.invoke(cli.cli, ["check-links"])
     assert result.exit_code == 1
-    assert "*** file.md ***\n(404) https://ploomber.io/broken\n" in result.output
+    assert (
+        "*** file.md ***\nfile.md:1:1 (404) https://ploomber.io/broken\n"
+        in result.output
+    )
 
 
 @pytest.mark.parametrize(
-    "args, yes, push, tag, target",
+    "args, yes, push, tag, target, plan",
     [
-        [["version"], False, True, True, None],
-        [["version", "--yes"], True, True, True, None],
-        [["version", "--yes", "--push"], True, True, True, None],
-        [["version", "--push"], False, True, True, None],
-        [["version", "--no-push"], False, False, True, None],
-        [["version", "--no-push", "--tag"], False, False, True, None],
-        [["version", "--push", "--no-tag"], False, True, False, None],
-        [["version", "--target", "stable"], False, True, True, "stable"],
+        [["version"], False, True, True, None, False],
+        [["version", "--yes"], True, True, True, None, False],
+        [["version", "--yes", "--push"], True, True, True, None, False],
+        [["version", "--push"], False, True, True, None, False],
+        [["version", "--no-push"], False, False, True, None, False],
+        [["version", "--no-push", "--tag"], False, False, True, None, False],
+        [["version", "--push", "--no-tag"], False, True, False, None, False],
+        [["version", "--target", "stable"], False, True, True, "stable", False],
+        [["version", "--plan"], False, True, True, None, True],
     ],
 )
-def test_version(tmp_package_name, monkeypatch, args, yes, push, tag, target):
+def test_version(tmp_package_name, monkeypatch, args, yes, push, tag, target, plan):
     mock = Mock()
 
     monkeypatch.setattr(cli.versioneer, "version", mock)
@@ -129,10 +133,45 @@ def test_version(tmp_package_name, monkeypatch, args, yes, push, tag, target):
     runner.invoke(cli.cli, args)
 
     mock.assert_called_once_with(
-        project_root=".", tag=tag, yes=yes, push=push, target=target
+        project_root=".", tag=tag, yes=yes, push=push, target=target, plan=plan
+    )
+
+
+@pytest.mark.parametrize(
+    "args, changed",
+    [
+        [["version", "--all"], False],
+        [["version", "--changed"], True],
+    ],
+)
+def test_version_workspace(tmp_package_name, monkeypatch, args, changed):
+    mock = Mock()
+
+    monkeypatch.setattr(cli.versioneer, "version_all", mock)
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, args)
+
+    assert result.exit_code == 0
+    mock.assert_called_once_with(
+        project_root=".",
+        changed=changed,
+        tag=True,
+        yes=False,
+        push=True,
+        target=None,
+        plan=False,
+        max_workers=None,
     )
 
 
+def test_version_all_and_changed(tmp_package_name):
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ["version", "--all", "--changed"])
+
+    assert result.exit_code == 1
+    assert "--all and --changed are mutually exclusive" in result.output
+
+
 def test_pyproj(tmp_empty):
     Path("file.py").write_text(
         """
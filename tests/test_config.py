@@ -1,7 +1,9 @@
+from pathlib import Path
+
 import toml
 import pytest
 
-from pkgmt import config
+from pkgmt import config, project
 from pkgmt.exceptions import InvalidConfiguration
 
 
@@ -84,3 +86,57 @@ def test_pkgmt_key_missing(tmp_empty, cfg, error):
     with pytest.raises(InvalidConfiguration) as excinfo:
         config.Config.from_file("pyproject.toml")
     assert error in str(excinfo.value)
+
+
+def test_config_is_parsed_once_until_it_changes(toml_cfg, monkeypatch):
+    calls = []
+    load = toml.load
+
+    def counting_load(f):
+        calls.append(f.name)
+        return load(f)
+
+    monkeypatch.setattr(config.toml, "load", counting_load)
+    project.reset()
+
+    first = config.Config.from_file("pyproject.toml")
+    second = config.Config.from_file("pyproject.toml", cli_args={"tag": False})
+
+    # resolving CLI arguments doesn't modify the cached configuration
+    assert first["version"]["tag"] is True
+    assert second["version"]["tag"] is False
+    assert len(calls) == 1
+
+    Path("pyproject.toml").write_text('[tool.pkgmt]\ngithub = "ploomber/pkgmt"\n')
+
+    assert config.Config.from_file("pyproject.toml")["github"] == "ploomber/pkgmt"
+    assert len(calls) == 2
+
+
+def test_config_found_in_parent_directory(toml_cfg):
+    Path("sub", "dir").mkdir(parents=True)
+    project.reset()
+
+    path = config.Config.find_file("pyproject.toml", directory=Path("sub", "dir"))
+
+    assert path == Path("pyproject.toml").resolve()
+    assert config.Config.find_file("pyproject.toml", directory=Path("sub", "dir")) is (
+        path
+    )
+
+
+def test_found_config_is_not_reused_after_changing_directory(toml_cfg, monkeypatch):
+    Path("sub", "pyproject.toml").parent.mkdir()
+    Path("sub", "pyproject.toml").write_text('[tool.pkgmt]\ngithub = "ploomber/sub"\n')
+    project.reset()
+
+    assert config.Config.find_file("pyproject.toml", directory=".") == (
+        Path("pyproject.toml").resolve()
+    )
+
+    monkeypatch.chdir("sub")
+
+    assert config.Config.find_file("pyproject.toml", directory=".") == (
+        Path("pyproject.toml").resolve()
+    )
+    assert config.Config.from_file("pyproject.toml")["github"] == "ploomber/sub"
@@ -206,3 +206,29 @@ def more_stuff():
     assert "Found the following pending deprecations" in str(excinfo.value)
     assert "Removed in 0.9.0" in str(excinfo.value)
     assert "Also removed in 0.9" in str(excinfo.value)
+
+
+def test_check_skips_unknown_versions(tmp_package_name, capsys):
+    Path("src", "package_name", "__init__.py").write_text(
+        """
+__version__ = "0.9dev"
+"""
+    )
+
+    Path("src/package_name/functions.py").write_text(
+        '''
+
+def stuff():
+    """
+    Notes
+    -----
+    .. deprecated:: 0.8
+        Use bar... removed in 0.9
+    """
+    pass
+'''
+    )
+
+    deprecation.Deprecations().check()
+
+    assert "Skipping deprecation with an unknown version" in capsys.readouterr().out
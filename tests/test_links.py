@@ -1,11 +1,32 @@
+import io
+import os
+import json
+import time
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
 import subprocess
+import threading
 from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from xml.etree import ElementTree
 from unittest.mock import Mock
 
+import httpx
 import requests
 import pytest
+from click import ClickException
 
-from pkgmt import links
+from pkgmt import links, links_anchors, links_ratelimit
+from pkgmt.links_cache import LinkCache, CacheEntry
+from pkgmt.links_ratelimit import HostRateLimiter, HostQueue, RetryPolicy
+from pkgmt.links_report import (
+    JSONLinesReporter,
+    SARIFReporter,
+    JUnitReporter,
+    format_location,
+)
+from pkgmt.links_anchors import slugify_markdown, slugify_rst, parse_file
 
 md = """
 # Some header
@@ -68,6 +89,33 @@ def test_find(text, expected):
     assert links._find(text) == expected
 
 
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ["see https://ploomber.io.", ["https://ploomber.io"]],
+        ["(https://ploomber.io/docs)", ["https://ploomber.io/docs"]],
+        ["[docs](https://ploomber.io/docs)", ["https://ploomber.io/docs"]],
+        [
+            "https://en.wikipedia.org/wiki/A_(b)",
+            ["https://en.wikipedia.org/wiki/A_(b)"],
+        ],
+        ["`https://ploomber.io`!", ["https://ploomber.io"]],
+        ["https://ploomber.io/#intro, more", ["https://ploomber.io/#intro"]],
+        ["HTTPS://ploomber.io xhttps://ploomber.io https://a", []],
+        ["ploomber.io/?next=https://github.com", ["https://github.com"]],
+    ],
+)
+def test_find_edge_cases(text, expected):
+    assert links._find(text) == expected
+
+
+def test_find_is_linear_on_pathological_input():
+    # the previous regex took exponential time on this input
+    start = time.monotonic()
+    assert links._find("https://" + "!" * 100_000 + " ") == []
+    assert time.monotonic() - start < 5
+
+
 @pytest.mark.parametrize("text", [md, rst])
 def test_find_ignore(text):
     assert links._find(text, ignore_substrings=["gcr.io", "docs.ploomber.io"]) == [
@@ -161,6 +209,18 @@ def test_find_links_in_files(sample_files):
     }
 
 
+def test_find_links_in_files_with_multiple_jobs(sample_files):
+    for idx in range(20):
+        Path(f"file-{idx}.py").write_text(f"https://ploomber.io/{idx}")
+
+    sequential = links._find_links_in_files(["py"])
+    parallel = links._find_links_in_files(["py"], jobs=3)
+
+    assert parallel == sequential
+    assert list(parallel) == list(sequential)
+    assert len(parallel) == 22
+
+
 def test_find_links_in_files_ignores_nontracked_files(sample_files):
     subprocess.check_call(["git", "init"])
     subprocess.check_call(["git", "config", "commit.gpgsign", "false"])
@@ -174,6 +234,34 @@ def test_find_links_in_files_ignores_nontracked_files(sample_files):
     }
 
 
+def test_find_links_in_files_index(sample_files):
+    _git_init()
+    subprocess.check_call(["git", "add", "script.py"])
+    subprocess.check_call(["git", "commit", "-m", "first-commit"])
+    subprocess.check_call(["git", "add", "some/nested/dir/another.py"])
+    Path("untracked.py").write_text("https://ploomber.io/untracked")
+
+    assert links._find_links_in_files(["py"]) == {
+        "script.py": ["https://ploomber.io/first"],
+    }
+    assert links._find_links_in_files(["py"], index=True) == {
+        "script.py": ["https://ploomber.io/first"],
+        "some/nested/dir/another.py": ["https://ploomber.io/second"],
+    }
+
+
+def test_find_links_in_files_skips_deleted_files(sample_files):
+    _git_init()
+    subprocess.check_call(["git", "add", "--all"])
+    subprocess.check_call(["git", "commit", "-m", "first-commit"])
+    Path("script.py").unlink()
+
+    assert links._find_links_in_files(["py", "md"]) == {
+        "some/nested/dir/another.py": ["https://ploomber.io/second"],
+        "doc.md": ["https://ploomber.io/should-not-appear"],
+    }
+
+
 def test_find_links_in_files_on_ipynb(tmp_empty, root):
     text = Path(root / "tests" / "assets" / "notebook.ipynb").read_text()
     Path("notebook.ipynb").write_text(text)
@@ -208,7 +296,8 @@ https://ploomber.io
 
     links.find_broken_in_files(extensions=["md"])
 
-    mock.assert_called_once_with("https://ploomber.io")
+    assert mock.call_count == 1
+    assert mock.call_args.args == ("https://ploomber.io",)
 
 
 def test_only_consider_404_as_broken(tmp_empty):
@@ -224,11 +313,99 @@ https://api.ploomber.io
     assert not broken
 
 
-def test_throttles_requests_to_the_same_domain():
-    checker = links.LinkChecker()
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_limiter_token_bucket():
+    clock = FakeClock()
+    limiter = HostRateLimiter(rate=2, burst=2, clock=clock)
+
+    assert limiter.try_acquire("ploomber.io") == 0
+    assert limiter.try_acquire("ploomber.io") == 0
+    assert limiter.try_acquire("ploomber.io") == pytest.approx(0.5)
+    # other hosts have their own budget
+    assert limiter.try_acquire("github.com") == 0
+
+    clock.now = 0.25
+    assert limiter.try_acquire("ploomber.io") == pytest.approx(0.25)
+
+    clock.now = 0.5
+    assert limiter.try_acquire("ploomber.io") == 0
 
-    checker.check_if_broken("https://ploomber.io/something")
-    checker.check_if_broken("https://ploomber.io/another")
+
+def test_rate_limiter_from_config():
+    limiter = HostRateLimiter.from_config(
+        {
+            "rate_limits": {
+                "default": {"rate": 2},
+                "github.com": {"rate": 5, "burst": 10},
+            }
+        }
+    )
+
+    assert limiter.limits_for("ploomber.io") == (2, 1)
+    assert limiter.limits_for("github.com") == (5, 10)
+    assert limiter.limits_for("docs.GitHub.com:443") == (5, 10)
+    assert limiter.limits_for("notgithub.com") == (2, 1)
+
+
+def test_host_queue_gives_slots_to_hosts_with_budget():
+    clock = FakeClock()
+    queue = HostQueue(
+        [
+            "https://a.com/1",
+            "https://a.com/2",
+            "https://a.com/3",
+            "https://b.com/1",
+        ],
+        HostRateLimiter(clock=clock),
+    )
+
+    first, _ = queue.pop_ready()
+    second, _ = queue.pop_ready()
+
+    assert {first, second} == {"https://a.com/1", "https://b.com/1"}
+    assert queue.pop_ready() == (None, pytest.approx(1))
+    assert len(queue) == 2
+
+    clock.now = 1
+    assert queue.pop_ready() == ("https://a.com/2", 0)
+    assert queue.pop_ready() == (None, pytest.approx(1))
+
+
+def test_host_queue_max_per_host():
+    clock = FakeClock()
+    queue = HostQueue(
+        ["https://a.com/1", "https://a.com/2"],
+        HostRateLimiter(rate=100, burst=100, clock=clock),
+        max_per_host=1,
+    )
+
+    assert queue.pop_ready() == ("https://a.com/1", 0)
+    assert queue.pop_ready() == (None, None)
+
+    queue.done("https://a.com/1")
+
+    assert queue.pop_ready() == ("https://a.com/2", 0)
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_throttles_requests_to_the_same_domain(tmp_empty, server, engine):
+    Path("doc.md").write_text(f"{server}/1\n\n{server}/2\n\n{server}/3")
+
+    start = time.monotonic()
+    links.find_broken_in_files(
+        extensions=["md"],
+        engine=engine,
+        rate_limiter=HostRateLimiter(rate=10, burst=1),
+    )
+
+    assert time.monotonic() - start >= 0.2
 
 
 def test_verbose_shows_invalid_links(tmp_empty, capsys):
@@ -244,3 +421,1045 @@ https://ploomber.io/something
 
     captured = capsys.readouterr()
     assert "*** Found invalid links in doc.md ***" in captured.out
+
+
+@pytest.fixture
+def mock_head(monkeypatch):
+    def head(url, **kwargs):
+        return Mock(status_code=404 if "broken" in url else 200, headers={})
+
+    mock = Mock(wraps=head)
+    monkeypatch.setattr(requests, "head", mock)
+    return mock
+
+
+def test_cache_skips_urls_with_fresh_results(tmp_empty, mock_head):
+    Path("doc.md").write_text("https://ploomber.io\n\nhttps://ploomber.io/broken")
+
+    with LinkCache() as cache:
+        links.find_broken_in_files(extensions=["md"], cache=cache)
+
+    with LinkCache() as cache:
+        broken = links.find_broken_in_files(extensions=["md"], cache=cache)
+
+    assert set(broken) == {"https://ploomber.io/broken"}
+    # broken links have a TTL of zero by default, so they're checked again
+    assert [c.args[0] for c in mock_head.call_args_list].count(
+        "https://ploomber.io"
+    ) == 1
+    assert [c.args[0] for c in mock_head.call_args_list].count(
+        "https://ploomber.io/broken"
+    ) == 2
+    assert Path(".pkgmt", "cache", "links.db").is_file()
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"refresh": True},
+        {"max_age": 0},
+        {"ttl": {"ok": 0}},
+        {"ttl": {"200": 0}},
+    ],
+    ids=["refresh", "max-age", "ttl-ok", "ttl-code"],
+)
+def test_cache_stale_entries_are_checked_again(tmp_empty, mock_head, kwargs):
+    Path("doc.md").write_text("https://ploomber.io")
+
+    with LinkCache() as cache:
+        links.find_broken_in_files(extensions=["md"], cache=cache)
+
+    with LinkCache(**kwargs) as cache:
+        links.find_broken_in_files(extensions=["md"], cache=cache)
+
+    assert mock_head.call_count == 2
+
+
+def test_cache_applies_broken_http_codes_to_cached_results(tmp_empty, monkeypatch):
+    monkeypatch.setattr(
+        requests, "head", Mock(return_value=Mock(status_code=500, headers={}))
+    )
+    Path("doc.md").write_text("https://ploomber.io")
+
+    with LinkCache(ttl={"broken": 60}) as cache:
+        assert links.find_broken_in_files(extensions=["md"], cache=cache)
+
+    with LinkCache(ttl={"broken": 60}) as cache:
+        broken = links.find_broken_in_files(
+            extensions=["md"], cache=cache, broken_http_codes=[404]
+        )
+
+    assert not broken
+    assert requests.head.call_count == 1
+
+
+def test_cache_from_config(tmp_empty):
+    assert LinkCache.from_config({"cache": False}) is None
+
+    cache = LinkCache.from_config(
+        {"cache_path": "cache.db", "cache_ttl": {404: 10}}, max_age=5
+    )
+
+    assert cache.ttl_for(404, broken=True) == 10
+    assert cache.ttl_for(500, broken=True) == 0
+    assert cache.ttl_for(200, broken=False) == 7 * 24 * 60 * 60
+    assert cache.max_age == 5
+    assert Path("cache.db").is_file()
+    cache.close()
+
+
+class Handler(BaseHTTPRequestHandler):
+    codes = {"/broken": 404, "/method": 405, "/error": 500}
+    redirects = {
+        "/redirect": "/ok",
+        "/to-ok": "/ok",
+        "/redirect-broken": "/broken",
+        "/loop": "/loop",
+    }
+    requests = []
+
+    def do_HEAD(self):
+        self.respond("HEAD")
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def respond(self, method):
+        self.requests.append((method, self.path, dict(self.headers)))
+
+        if self.path in self.redirects:
+            self.send_response(301)
+            self.send_header("Location", self.redirects[self.path])
+        elif self.path == "/etag":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+            else:
+                self.send_response(200)
+            self.send_header("ETag", '"v1"')
+        elif self.path == "/method" and method == "GET":
+            self.send_response(206 if self.headers.get("Range") else 200)
+        elif self.path in {"/flaky", "/retry-after"} and self.count(self.path) < 3:
+            self.send_response(503 if self.path == "/flaky" else 429)
+            self.send_header("Retry-After", "0")
+        elif self.path == "/slow":
+            time.sleep(1)
+            self.send_response(200)
+        elif self.path == "/slow-page" and method == "GET":
+            time.sleep(1)
+            self.send_response(200)
+        elif self.path == "/page":
+            body = b'<h2 id="intro">Intro</h2><a name="legacy"></a>'
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+
+            if method == "GET":
+                self.wfile.write(body)
+
+            return
+        else:
+            self.send_response(self.codes.get(self.path, 200))
+
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def count(self, path):
+        return len([r for r in self.requests if r[1] == path])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.requests.clear()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_find_broken_in_files_engines(tmp_empty, server, engine):
+    Path("doc.md").write_text(
+        f"""
+{server}/ok
+
+{server}/broken
+
+{server}/method
+
+{server}/error
+"""
+    )
+
+    broken = links.find_broken_in_files(extensions=["md"], engine=engine)
+
+    assert {(r.url, r.code) for r in broken.values()} == {
+        (f"{server}/broken", 404),
+        (f"{server}/error", 500),
+    }
+
+
+def test_async_engine_connection_error(tmp_empty):
+    Path("doc.md").write_text("https://127.0.0.1:2746")
+
+    broken = links.find_broken_in_files(extensions=["md"], engine="async")
+
+    assert broken["https://127.0.0.1:2746"].code is None
+
+
+def test_find_broken_in_files_invalid_engine(tmp_empty):
+    with pytest.raises(ValueError, match="Invalid engine: 'another'"):
+        links.find_broken_in_files(extensions=["md"], engine="another")
+
+
+def test_async_engine_requires_httpx(monkeypatch):
+    monkeypatch.setattr(links, "httpx", None)
+
+    with pytest.raises(ModuleNotFoundError, match="pip install 'pkgmt\\[async\\]'"):
+        links.AsyncLinkChecker()
+
+
+def _git_init():
+    subprocess.check_call(["git", "init", "--initial-branch", "main"])
+    subprocess.check_call(["git", "config", "commit.gpgsign", "false"])
+    subprocess.check_call(["git", "config", "user.email", "ci@ploomberio"])
+    subprocess.check_call(["git", "config", "user.name", "Ploomber"])
+
+
+def test_find_links_added_since(tmp_empty, root):
+    _git_init()
+    Path("doc.md").write_text("https://ploomber.io/existing")
+    Path("untouched.md").write_text("https://ploomber.io/untouched")
+    Path("notebook.ipynb").write_text(
+        Path(root / "tests" / "assets" / "notebook.ipynb").read_text()
+    )
+    subprocess.check_call(["git", "add", "--all"])
+    subprocess.check_call(["git", "commit", "-m", "first-commit"])
+
+    subprocess.check_call(["git", "checkout", "-b", "feature"])
+    Path("doc.md").write_text(
+        "https://ploomber.io/existing\n\nhttps://ploomber.io/added"
+    )
+    Path("nested").mkdir()
+    Path("nested", "new.md").write_text("https://ploomber.io/new-file")
+    subprocess.check_call(["git", "add", "--all"])
+    subprocess.check_call(["git", "commit", "-m", "second-commit"])
+    # uncommitted changes are also considered
+    Path("untouched.md").write_text(
+        "https://ploomber.io/untouched\n\nhttps://ploomber.io/uncommitted"
+    )
+
+    assert links._find_links_added_since("main", ["md", "ipynb"]) == {
+        "doc.md": ["https://ploomber.io/added"],
+        "nested/new.md": ["https://ploomber.io/new-file"],
+        "untouched.md": ["https://ploomber.io/uncommitted"],
+    }
+
+
+def test_find_links_added_since_from_subdirectory(tmp_empty):
+    _git_init()
+    Path("docs").mkdir()
+    Path("docs", "doc.md").write_text("https://ploomber.io/existing")
+    subprocess.check_call(["git", "add", "--all"])
+    subprocess.check_call(["git", "commit", "-m", "first-commit"])
+    Path("docs", "doc.md").write_text(
+        "https://ploomber.io/existing\n\nhttps://ploomber.io/added"
+    )
+    Path("outside.md").write_text("https://ploomber.io/outside")
+    subprocess.check_call(["git", "add", "--all"])
+    os.chdir("docs")
+
+    assert links._find_links_added_since("main", ["md"]) == {
+        "doc.md": ["https://ploomber.io/added"],
+    }
+
+
+def test_find_broken_in_files_since_invalid_ref(tmp_empty):
+    _git_init()
+    Path("doc.md").write_text("https://ploomber.io")
+    subprocess.check_call(["git", "add", "--all"])
+    subprocess.check_call(["git", "commit", "-m", "first-commit"])
+
+    with pytest.raises(ClickException, match="Could not find changes since 'nope'"):
+        links.find_broken_in_files(extensions=["md"], since="nope")
+
+
+@pytest.fixture(params=["thread", "async"])
+def check(request):
+    if request.param == "thread":
+        return links.LinkChecker(max_redirects=3).check_if_broken
+
+    async def check_async(url, **kwargs):
+        async with httpx.AsyncClient() as client:
+            checker = links.AsyncLinkChecker(max_redirects=3)
+            return await checker.check_if_broken(client, url, **kwargs)
+
+    return lambda url, **kwargs: asyncio.run(check_async(url, **kwargs))
+
+
+def test_falls_back_to_ranged_get_if_head_is_rejected(server, check):
+    response = check(f"{server}/method")
+
+    assert response.code == 206
+    assert not response.broken
+    assert [(method, path) for method, path, _ in Handler.requests] == [
+        ("HEAD", "/method"),
+        ("GET", "/method"),
+    ]
+    assert Handler.requests[1][2]["Range"] == "bytes=0-0"
+
+
+@pytest.mark.parametrize(
+    "path, code, broken, final",
+    [
+        ["/redirect", 200, False, "/ok"],
+        ["/redirect-broken", 404, True, "/broken"],
+    ],
+)
+def test_follows_and_records_redirects(server, check, path, code, broken, final):
+    response = check(f"{server}{path}")
+
+    assert response.code == code
+    assert response.broken is broken
+    assert response.final_url == f"{server}{final}"
+    assert response.redirects == [f"{server}{path}"]
+
+
+def test_caps_redirects(server, check):
+    response = check(f"{server}/loop")
+
+    assert response.code is None
+    assert response.broken
+    assert len(response.redirects) == 4
+
+
+def test_conditional_request_with_previous_etag(server, check):
+    first = check(f"{server}/etag")
+    previous = CacheEntry(
+        url=first.url,
+        code=first.code,
+        broken=first.broken,
+        checked_at=0,
+        etag=first.etag,
+        last_modified=None,
+        final_url=first.final_url,
+    )
+    second = check(f"{server}/etag", previous=previous)
+
+    assert first.etag == '"v1"'
+    assert not first.not_modified
+    assert second.not_modified
+    assert second.code == 200
+    assert second.etag == '"v1"'
+    assert Handler.requests[1][2]["If-None-Match"] == '"v1"'
+
+
+def test_cache_stores_validators(tmp_empty, server):
+    Path("doc.md").write_text(f"{server}/etag")
+
+    with LinkCache(ttl={"ok": 0}) as cache:
+        links.find_broken_in_files(extensions=["md"], cache=cache)
+
+    with LinkCache(ttl={"ok": 0}) as cache:
+        links.find_broken_in_files(extensions=["md"], cache=cache)
+        entry = cache.get(f"{server}/etag")
+
+    assert [path for _, path, _ in Handler.requests] == ["/etag", "/etag"]
+    assert Handler.requests[1][2]["If-None-Match"] == '"v1"'
+    assert entry.code == 200
+    assert entry.etag == '"v1"'
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+@pytest.mark.parametrize("path", ["/flaky", "/retry-after"])
+def test_retries_transient_errors(tmp_empty, server, engine, path):
+    Path("doc.md").write_text(f"{server}{path}")
+
+    broken = links.find_broken_in_files(
+        extensions=["md"],
+        engine=engine,
+        rate_limiter=HostRateLimiter(rate=100, burst=100),
+        retry_policy=RetryPolicy(retries=2, backoff=0.01),
+    )
+
+    assert not broken
+    assert [p for _, p, _ in Handler.requests] == [path] * 3
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_gives_up_after_max_retries(tmp_empty, server, engine):
+    Path("doc.md").write_text(f"{server}/flaky")
+
+    broken = links.find_broken_in_files(
+        extensions=["md"],
+        engine=engine,
+        rate_limiter=HostRateLimiter(rate=100, burst=100),
+        retry_policy=RetryPolicy(retries=1, backoff=0.01),
+    )
+
+    assert broken[f"{server}/flaky"].code == 503
+    assert len(Handler.requests) == 2
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_timeout(tmp_empty, server, engine):
+    Path("doc.md").write_text(f"{server}/slow")
+
+    broken = links.find_broken_in_files(
+        extensions=["md"],
+        engine=engine,
+        timeout=(1, 0.1),
+        retry_policy=RetryPolicy(retries=0),
+    )
+
+    assert broken[f"{server}/slow"].code is None
+    assert broken[f"{server}/slow"].timed_out
+
+
+def test_host_queue_retry_delays_host():
+    clock = FakeClock()
+    queue = HostQueue(
+        ["https://a.com/1", "https://a.com/2", "https://b.com/1"],
+        HostRateLimiter(rate=100, burst=100, clock=clock),
+    )
+
+    assert queue.pop_ready() == ("https://a.com/1", 0)
+    queue.done("https://a.com/1")
+    queue.retry("https://a.com/1", delay=5)
+
+    assert queue.attempts("https://a.com/1") == 1
+    assert len(queue) == 3
+    # only b.com is available
+    assert queue.pop_ready() == ("https://b.com/1", 0)
+    assert queue.pop_ready() == (None, 5)
+
+    clock.now = 5
+    assert queue.pop_ready() == ("https://a.com/1", 0)
+    assert queue.pop_ready() == ("https://a.com/2", 0)
+
+
+def test_retry_policy():
+    policy = RetryPolicy(retries=2, backoff=1, max_delay=10)
+
+    def response(code=None, timed_out=False, retry_after=None):
+        return links.Response(
+            "https://ploomber.io",
+            code,
+            True,
+            timed_out=timed_out,
+            retry_after=retry_after,
+        )
+
+    assert policy.should_retry(response(timed_out=True), attempt=0)
+    assert policy.should_retry(response(code=429), attempt=1)
+    assert not policy.should_retry(response(code=429), attempt=2)
+    assert not policy.should_retry(response(code=404), attempt=0)
+    assert not policy.should_retry(response(code=None), attempt=0)
+    assert not policy.should_retry(response(code=429, retry_after=11), attempt=0)
+
+    assert policy.delay(response(code=429, retry_after=3), attempt=0) == 3
+    assert 2 <= policy.delay(response(code=503), attempt=2) <= 6
+    assert policy.delay(response(code=503), attempt=10) == 10
+
+
+def test_parse_retry_after():
+    in_a_minute = datetime.now(timezone.utc) + timedelta(seconds=60)
+
+    assert links._parse_retry_after(None) is None
+    assert links._parse_retry_after("120") == 120
+    assert links._parse_retry_after("not a date") is None
+    assert links._parse_retry_after(format_datetime(in_a_minute, usegmt=True)) == (
+        pytest.approx(60, abs=2)
+    )
+
+
+def test_find_records_line_numbers():
+    links_in_file = links._find(
+        "https://a.com\n\nsee https://b.com and https://a.com\nhttps://{x}.com"
+    )
+
+    assert links_in_file.valid == ["https://a.com", "https://b.com", "https://a.com"]
+    assert list(links_in_file.lines) == [1, 3, 3]
+    assert list(links_in_file.columns) == [1, 5, 23]
+    assert links_in_file.invalid == ["https://{x}.com"]
+
+
+def _write_docs(server):
+    Path("doc.md").write_text(f"# Title\n\n{server}/ok\n\n{server}/broken\n")
+    Path("another.md").write_text(f"{server}/broken\n")
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_jsonl_reporter(tmp_empty, server, engine):
+    _write_docs(server)
+    stream = io.StringIO()
+
+    links.find_broken_in_files(
+        extensions=["md"],
+        engine=engine,
+        rate_limiter=HostRateLimiter(rate=100, burst=100),
+        reporter=JSONLinesReporter(stream),
+    )
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    records = sorted(records, key=lambda r: (r["file"], r["line"]))
+
+    assert [
+        (r["file"], r["line"], r["url"], r["code"], r["broken"]) for r in records
+    ] == [
+        ("another.md", 1, f"{server}/broken", 404, True),
+        ("doc.md", 3, f"{server}/ok", 200, False),
+        ("doc.md", 5, f"{server}/broken", 404, True),
+    ]
+    assert all(r["latency"] > 0 for r in records)
+
+
+def test_jsonl_reporter_includes_cached_results(tmp_empty, server):
+    _write_docs(server)
+
+    with LinkCache(ttl={"broken": 3600}) as cache:
+        links.find_broken_in_files(extensions=["md"], cache=cache)
+
+        stream = io.StringIO()
+        links.find_broken_in_files(
+            extensions=["md"], cache=cache, reporter=JSONLinesReporter(stream)
+        )
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    assert len(records) == 3
+    assert all(r["cached"] and r["latency"] is None for r in records)
+
+
+def test_sarif_reporter(tmp_empty, server):
+    _write_docs(server)
+    stream = io.StringIO()
+
+    links.find_broken_in_files(
+        extensions=["md"],
+        rate_limiter=HostRateLimiter(rate=100, burst=100),
+        reporter=SARIFReporter(stream),
+    )
+
+    log = json.loads(stream.getvalue())
+    results = log["runs"][0]["results"]
+    locations = sorted(
+        (
+            r["locations"][0]["physicalLocation"]["artifactLocation"]["uri"],
+            r["locations"][0]["physicalLocation"]["region"]["startLine"],
+        )
+        for r in results
+    )
+
+    assert log["version"] == "2.1.0"
+    assert locations == [("another.md", 1), ("doc.md", 5)]
+    assert results[0]["message"]["text"] == f"Broken link (HTTP 404): {server}/broken"
+
+
+def test_sarif_reporter_without_results(tmp_empty):
+    stream = io.StringIO()
+
+    links.find_broken_in_files(extensions=["md"], reporter=SARIFReporter(stream))
+
+    assert json.loads(stream.getvalue())["runs"][0]["results"] == []
+
+
+def test_junit_reporter(tmp_empty, server):
+    _write_docs(server)
+    stream = io.StringIO()
+
+    links.find_broken_in_files(
+        extensions=["md"],
+        rate_limiter=HostRateLimiter(rate=100, burst=100),
+        reporter=JUnitReporter(stream),
+    )
+
+    suite = ElementTree.fromstring(stream.getvalue()).find("testsuite")
+    cases = sorted(
+        (case.get("file"), case.get("line"), case.find("failure") is not None)
+        for case in suite.iter("testcase")
+    )
+
+    assert cases == [
+        ("another.md", "1", True),
+        ("doc.md", "3", False),
+        ("doc.md", "5", True),
+    ]
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ["HTTPS://Ploomber.IO/Docs/", "https://ploomber.io/Docs"],
+        ["https://ploomber.io:443/docs", "https://ploomber.io/docs"],
+        ["http://ploomber.io:8000/docs", "http://ploomber.io:8000/docs"],
+        ["https://ploomber.io/docs#section", "https://ploomber.io/docs"],
+        ["https://ploomber.io/", "https://ploomber.io"],
+        [
+            "https://ploomber.io/docs?utm_source=x&page=2&utm_medium=y",
+            "https://ploomber.io/docs?page=2",
+        ],
+        ["https://user@Ploomber.io/docs", "https://user@ploomber.io/docs"],
+        ["https://[::1]:443/docs", "https://[::1]/docs"],
+        ["https://ploomber.io:bad/docs", "https://ploomber.io:bad/docs"],
+    ],
+)
+def test_canonicalize_url(url, expected):
+    assert links.canonicalize_url(url) == expected
+
+
+def test_canonicalize_url_custom_tracking_params():
+    url = "https://ploomber.io/docs?ref=home&fbclid=abc&page=2"
+    assert (
+        links.canonicalize_url(url, tracking_params=("ref", "fb*"))
+        == "https://ploomber.io/docs?page=2"
+    )
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_checks_canonical_urls_once(tmp_empty, server, engine):
+    spellings = [
+        f"{server}/ok",
+        f"{server}/ok/",
+        f"{server}/ok#intro",
+        f"{server}/ok?utm_source=docs",
+        f"{server}/ok/#intro",
+    ]
+    Path("doc.md").write_text(
+        "\n".join(spellings + [f"{server}/broken", f"{server}/broken?ref=home"])
+    )
+    stream = io.StringIO()
+
+    broken = links.find_broken_in_files(
+        extensions=["md"],
+        engine=engine,
+        rate_limiter=HostRateLimiter(rate=100, burst=100),
+        reporter=JSONLinesReporter(stream),
+        tracking_params=["ref"],
+    )
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    assert sorted(path for _, path, _ in Handler.requests) == ["/broken", "/ok"]
+    assert set(broken) == {f"{server}/broken", f"{server}/broken?ref=home"}
+    assert sorted(r["url"] for r in records if not r["broken"]) == sorted(spellings)
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_requests_urls_as_written(tmp_empty, server, engine, monkeypatch):
+    # the canonical URL has no trailing slash, but this server only serves /docs/
+    monkeypatch.setitem(Handler.codes, "/docs", 404)
+    Path("doc.md").write_text(f"{server}/docs/\n{server}/docs/#intro\n")
+
+    with LinkCache() as cache:
+        broken = links.find_broken_in_files(
+            extensions=["md"],
+            engine=engine,
+            rate_limiter=HostRateLimiter(rate=100, burst=100),
+            cache=cache,
+        )
+
+        assert cache.get(f"{server}/docs").code == 200
+
+    assert not broken
+    assert [path for _, path, _ in Handler.requests] == ["/docs/"]
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_reuses_result_of_redirect_target(tmp_empty, server, engine):
+    Path("doc.md").write_text(f"{server}/ok\n{server}/redirect\n{server}/to-ok\n")
+
+    broken = links.find_broken_in_files(
+        extensions=["md"],
+        engine=engine,
+        max_workers=1,
+        rate_limiter=HostRateLimiter(rate=100, burst=100),
+    )
+
+    assert not broken
+    # the redirects aren't followed since /ok was already checked
+    assert [path for _, path, _ in Handler.requests] == ["/ok", "/redirect", "/to-ok"]
+
+
+@pytest.mark.parametrize(
+    "heading, expected",
+    [
+        ["Install", "install"],
+        ["Getting started!", "getting-started"],
+        ["`pkgmt check-links` options", "pkgmt-check-links-options"],
+        ["A [link](https://ploomber.io) here", "a-link-here"],
+        ["Español y más", "español-y-más"],
+        ["C++ & Python", "c--python"],
+    ],
+)
+def test_slugify_markdown(heading, expected):
+    assert slugify_markdown(heading) == expected
+
+
+def test_slugify_rst():
+    assert slugify_rst("Getting Started: the basics") == "getting-started-the-basics"
+
+
+def test_parse_markdown_file(tmp_empty):
+    Path("doc.md").write_text(
+        """# Title
+
+## Install
+
+## Install
+
+Setext heading
+--------------
+
+## Custom {#my-id}
+
+<a id="html-anchor"></a>
+
+(myst-target)=
+
+```
+## not a heading
+[not a link](nope.md)
+```
+
+See [install](#install), ![image](img/logo.png) and [spaces](<my file.md>).
+
+[ref]: other.md#section
+"""
+    )
+
+    anchors, found = parse_file("doc.md")
+
+    assert anchors == {
+        "title",
+        "install",
+        "install-1",
+        "setext-heading",
+        "custom",
+        "my-id",
+        "html-anchor",
+        "myst-target",
+    }
+    assert found == [
+        ("#install", 21, 15, None),
+        ("img/logo.png", 21, 35, None),
+        ("my file.md", 21, 63, None),
+        ("other.md#section", 23, 8, None),
+    ]
+
+
+def test_parse_markdown_skips_code_spans_and_footnotes(tmp_empty):
+    Path("doc.md").write_text(
+        """Example: `[a](missing.md)` and ``<a href="x.md">`` but [b](b.md)
+
+A footnote[^1].
+
+[^1]: Source is a book.
+"""
+    )
+
+    _, found = parse_file("doc.md")
+
+    assert found == [("b.md", 1, 60, None)]
+
+
+def test_parse_rst_file(tmp_empty):
+    Path("doc.rst").write_text(
+        """=====
+Title
+=====
+
+.. _my-target:
+
+Getting Started
+---------------
+
+See `install <install.rst#setup>`_.
+"""
+    )
+
+    anchors, found = parse_file("doc.rst")
+
+    assert anchors == {"title", "my-target", "getting-started"}
+    assert found == [("install.rst#setup", 10, 15, None)]
+
+
+def test_parse_notebook(tmp_empty):
+    cells = [
+        {"cell_type": "markdown", "metadata": {}, "source": ["# My Title"]},
+        {"cell_type": "code", "metadata": {}, "source": ["# comment", "x = 1"]},
+        {"cell_type": "markdown", "metadata": {}, "source": ["[link](#My-Title)"]},
+    ]
+    Path("nb.ipynb").write_text(json.dumps({"cells": cells, "metadata": {}}))
+
+    anchors, found = parse_file("nb.ipynb")
+
+    assert anchors == {"my-title", "My-Title"}
+    assert found == [("#My-Title", 1, 8, 2)]
+
+
+def test_offline_checks_relative_links(tmp_empty):
+    Path("doc").mkdir()
+    Path("doc", "b.md").write_text("# B\n\n## Install\n")
+    Path("doc", "a.md").write_text(
+        """# A
+
+[ok](b.md#install)
+[bad anchor](b.md#nope)
+[missing](c.md)
+[self](#a)
+[bad self](#b)
+[up](../README.md)
+[http](https://ploomber.io/#whatever)
+[ignored](ignored.md)
+"""
+    )
+    Path("README.md").write_text("[docs](doc/a.md#a)")
+
+    broken = links.find_broken_in_files(
+        extensions=["md"], offline=True, ignore_substrings=["ignored"]
+    )
+
+    assert {url: r.reason for url, r in broken.items()} == {
+        "doc/b.md#nope": "missing anchor",
+        "doc/c.md": "missing file",
+        "doc/a.md#b": "missing anchor",
+    }
+    assert all(r.local for r in broken.values())
+
+
+def test_offline_text_report(tmp_empty, capsys):
+    Path("a.md").write_text("line\n[bad](b.md)\n")
+
+    links.find_broken_in_files(extensions=["md"], offline=True, verbose=True)
+
+    assert "*** a.md ***\na.md:2:7 (missing file) b.md\n" in capsys.readouterr().out
+
+
+def test_offline_jsonl_report(tmp_empty):
+    Path("a.md").write_text("line\n[bad](b.md#x)\n")
+    stream = io.StringIO()
+
+    links.find_broken_in_files(
+        extensions=["md"], offline=True, reporter=JSONLinesReporter(stream)
+    )
+
+    record = json.loads(stream.getvalue())
+    assert (
+        record["file"],
+        record["line"],
+        record["column"],
+        record["url"],
+        record["reason"],
+    ) == ("a.md", 2, 7, "b.md#x", "missing file")
+
+
+def test_external_anchors(tmp_empty, server):
+    Path("doc.md").write_text(
+        f"{server}/page#intro\n{server}/page#legacy\n{server}/page#missing\n"
+    )
+
+    with LinkCache() as cache:
+        broken = links.find_broken_in_files(
+            extensions=["md"],
+            cache=cache,
+            rate_limiter=HostRateLimiter(rate=100, burst=100),
+            external_anchors=True,
+        )
+
+        assert list(broken) == [f"{server}/page#missing"]
+        assert broken[f"{server}/page#missing"].reason == "missing anchor"
+        assert [(m, p) for m, p, _ in Handler.requests] == [
+            ("HEAD", "/page"),
+            ("GET", "/page"),
+        ]
+
+        Handler.requests.clear()
+        cache.set(f"{server}/page", 200, False, checked_at=0)
+
+        # the page is checked again but anchors come from the cache
+        broken = links.find_broken_in_files(
+            extensions=["md"], cache=cache, external_anchors=True
+        )
+
+    assert list(broken) == [f"{server}/page#missing"]
+    assert [(m, p) for m, p, _ in Handler.requests] == [("HEAD", "/page")]
+
+
+def test_fetch_many_waits_for_rate_limits_outside_workers(server, monkeypatch):
+    sleeping = []
+    sleep = time.sleep
+
+    def record_sleep(seconds):
+        sleeping.append(threading.current_thread() is threading.main_thread())
+        sleep(seconds)
+
+    monkeypatch.setattr(links_ratelimit.time, "sleep", record_sleep)
+    urls = [f"{server}/page", f"{server}/broken", f"{server}/error"]
+
+    result = links_anchors.fetch_many(
+        urls, max_workers=3, rate_limiter=HostRateLimiter(rate=50, burst=1)
+    )
+
+    assert result.keys() == set(urls)
+    assert "intro" in result[f"{server}/page"]
+    # the host ran out of tokens, only the main thread waited for them
+    assert sleeping and all(sleeping)
+
+
+def test_find_in_notebook_records_cells(tmp_empty):
+    cells = [
+        {"cell_type": "markdown", "metadata": {}, "source": ["# Title\n", "intro"]},
+        {
+            "cell_type": "code",
+            "metadata": {},
+            "source": ["# see https://a.com\n", "x = 'https://b.com'"],
+        },
+    ]
+    Path("nb.ipynb").write_text(json.dumps({"cells": cells, "metadata": {}}))
+
+    found = links._find_in_file("nb.ipynb")
+
+    assert list(found.locations("nb.ipynb")) == [
+        ("https://a.com", links.Location("nb.ipynb", 1, 7, 1)),
+        ("https://b.com", links.Location("nb.ipynb", 2, 6, 1)),
+    ]
+
+
+def test_links_in_file_without():
+    found = links._find("https://a.com https://b.com\nhttps://a.com https://{x}/y")
+
+    remaining = found.without({"https://a.com"})
+
+    assert remaining.valid == ["https://b.com"]
+    assert remaining.invalid == ["https://{x}/y"]
+    assert list(remaining.lines) == [1]
+    assert list(remaining.columns) == [15]
+    assert list(remaining.cells) == [-1]
+
+
+@pytest.mark.parametrize(
+    "location, expected",
+    [
+        [links.Location("doc.md", 3, 10, None), "doc.md:3:10"],
+        [links.Location("nb.ipynb", 1, 5, 2), "nb.ipynb[cell 2]:1:5"],
+        [links.Location("doc.md", None, None, None), "doc.md"],
+    ],
+)
+def test_format_location(location, expected):
+    assert format_location(location) == expected
+
+
+def test_text_report_shows_every_occurrence(tmp_empty, server, capsys):
+    Path("doc.md").write_text(
+        f"{server}/broken\n\nsee {server}/ok and {server}/broken\n"
+    )
+
+    links.find_broken_in_files(
+        extensions=["md"],
+        verbose=True,
+        rate_limiter=HostRateLimiter(rate=100, burst=100),
+    )
+
+    assert (
+        "*** doc.md ***\n"
+        f"doc.md:1:1 (404) {server}/broken\n"
+        f"doc.md:3:{len(server) + 13} (404) {server}/broken\n"
+    ) in capsys.readouterr().out
+
+
+def _records(stream):
+    return {r["url"]: r for r in map(json.loads, stream.getvalue().splitlines())}
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_fail_fast(tmp_empty, server, engine):
+    urls = [f"{server}/broken"] + [f"{server}/ok-{idx}" for idx in range(5)]
+    Path("doc.md").write_text("\n".join(urls))
+    stream = io.StringIO()
+
+    broken = links.find_broken_in_files(
+        extensions=["md"],
+        engine=engine,
+        max_workers=1,
+        rate_limiter=HostRateLimiter(rate=100, burst=100),
+        reporter=JSONLinesReporter(stream),
+        fail_fast=True,
+    )
+
+    records = _records(stream)
+
+    assert list(broken) == [f"{server}/broken"]
+    assert [path for _, path, _ in Handler.requests] == ["/broken"]
+    assert [records[url]["reason"] for url in urls[1:]] == ["unknown"] * 5
+    assert not any(records[url]["broken"] for url in urls[1:])
+
+
+def test_fail_fast_with_cached_broken_link(tmp_empty, server):
+    Path("doc.md").write_text(f"{server}/broken\n{server}/ok")
+
+    with LinkCache(ttl={"broken": 3600}) as cache:
+        cache.set(f"{server}/broken", 404, True)
+
+        broken = links.find_broken_in_files(
+            extensions=["md"], cache=cache, fail_fast=True
+        )
+
+    assert list(broken) == [f"{server}/broken"]
+    assert not Handler.requests
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_deadline(tmp_empty, server, engine, capsys):
+    Path("doc.md").write_text(f"{server}/slow\n")
+    start = time.monotonic()
+
+    broken = links.find_broken_in_files(
+        extensions=["md"],
+        engine=engine,
+        verbose=True,
+        retry_policy=RetryPolicy(retries=0),
+        deadline=0.3,
+    )
+
+    assert time.monotonic() - start < 0.9
+    assert not broken
+    assert f"doc.md:1:1 (unknown) {server}/slow" in capsys.readouterr().out
+
+
+def test_deadline_with_external_anchors(tmp_empty, server, capsys):
+    Path("doc.md").write_text(f"{server}/slow-page#intro\n")
+    start = time.monotonic()
+
+    broken = links.find_broken_in_files(
+        extensions=["md"],
+        verbose=True,
+        external_anchors=True,
+        rate_limiter=HostRateLimiter(rate=100, burst=100),
+        deadline=0.3,
+    )
+
+    assert time.monotonic() - start < 0.9
+    assert not broken
+    assert f"doc.md:1:1 (unknown) {server}/slow-page#intro" in (capsys.readouterr().out)
+
+
+def test_host_queue_drain():
+    queue = HostQueue(
+        ["https://a.com/1", "https://a.com/2", "https://b.com/1"],
+        HostRateLimiter(rate=100, burst=100),
+    )
+    url, _ = queue.pop_ready()
+
+    assert sorted(queue.drain() + [url]) == [
+        "https://a.com/1",
+        "https://a.com/2",
+        "https://b.com/1",
+    ]
+    assert not queue
+    assert queue.pop_ready() == (None, None)
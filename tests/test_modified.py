@@ -110,6 +110,23 @@ def test_check_modified_changelog(tmp_package_changelog):
     assert fail_if_invalid_changelog.check_modified("main", debug=True) == 0
 
 
+def test_check_modified_changelog_many_entries(tmp_package_changelog):
+    entries = "".join(f"* [Feature] Added feature {i}\n" for i in range(50))
+    Path("CHANGELOG.md").write_text(
+        f"""
+# CHANGELOG
+
+## 0.1dev
+
+* [Fix] Fixes #1
+{entries}
+"""
+    )
+    subprocess.run(["git", "add", "CHANGELOG.md"])
+    subprocess.run(["git", "commit", "-m", "changelog_modified"])
+    assert fail_if_invalid_changelog.check_modified("main", debug=True) == 0
+
+
 @pytest.mark.parametrize(
     "contents, message",
     [
@@ -15,6 +15,7 @@ and get rid of this.
 
 import subprocess
 import os
+import json
 from pathlib import Path
 from unittest.mock import Mock, _Call
 from datetime import datetime
@@ -32,10 +33,18 @@ from pkgmt.versioner.util import (
     find_package_and_version_file,
     validate_version_file,
 )
-from pkgmt.versioner import versioner
+from pkgmt.versioner import versioner, patch
+from pkgmt.versioner.patch import PatchSet
 from pkgmt.exceptions import ProjectValidationError, InvalidConfiguration
 
 
+# files committed when releasing
+PACKAGE_NAME_VERSION_FILE = "src/package_name/__init__.py"
+PACKAGE_NAME_FILES = [PACKAGE_NAME_VERSION_FILE, "CHANGELOG.md"]
+ANOTHER_VERSION_FILE = "app/_version.py"
+ANOTHER_PACKAGE_FILES = [ANOTHER_VERSION_FILE, "CHANGELOG.md"]
+
+
 # FIXME: use unittest.mock.call instead of unittest.mock._Call
 def _call(arg):
     """Shortcut for comparing call objects"""
@@ -90,11 +99,11 @@ def test_commit_version_no_tag_from_config(
         "0.2", msg_template="{package_name} release {new_version}", tag=False
     )
 
+    files = [str(v.path_to_package / version_file), "CHANGELOG.md"]
+
     assert mock.call_args_list == [
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"{package_name} release 0.2"]),
-        _call(["git", "push", "--no-verify"]),
+        _call(["git", "commit", "-m", f"{package_name} release 0.2", "--", *files]),
+        _call(["git", "push", "--atomic", "--no-verify", "origin", "HEAD"]),
     ]
 
     assert '__version__ = "0.2"' in (v.path_to_package / version_file).read_text()
@@ -185,6 +194,8 @@ def test_ignore_special_folders(folder_name, tmp_package_name):
         ["0.10a1", "0.10dev"],
         ["0.10b1", "0.10dev"],
         ["0.10rc1", "0.10dev"],
+        ["1.2.5.post1", "1.2.6dev"],
+        ["1.2.3.4", "1.2.3.5dev"],
     ],
 )
 @pytest.mark.parametrize(
@@ -219,10 +230,17 @@ def test_commit_version_no_tag(tmp_package_name, monkeypatch):
     )
 
     assert mock.call_args_list == [
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", "package_name release 0.2"]),
-        _call(["git", "push", "--no-verify"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                "package_name release 0.2",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
+        _call(["git", "push", "--atomic", "--no-verify", "origin", "HEAD"]),
     ]
 
     assert '__version__ = "0.2"' in (v.path_to_package / "__init__.py").read_text()
@@ -240,10 +258,8 @@ def test_commit_version_no_tag_toml(tmp_another_package, monkeypatch):
     )
 
     assert mock.call_args_list == [
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", "app release 0.2"]),
-        _call(["git", "push", "--no-verify"]),
+        _call(["git", "commit", "-m", "app release 0.2", "--", *ANOTHER_PACKAGE_FILES]),
+        _call(["git", "push", "--atomic", "--no-verify", "origin", "HEAD"]),
     ]
 
     assert '__version__ = "0.2"' in (v.path_to_package / "_version.py").read_text()
@@ -261,11 +277,28 @@ def test_commit_version_tag(tmp_package_name, monkeypatch):
     )
 
     assert mock.call_args_list == [
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", "package_name release 0.2"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                "package_name release 0.2",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
         _call(["git", "tag", "-a", "0.2", "-m", "package_name release 0.2"]),
-        _call(["git", "push", "origin", "0.2", "--no-verify"]),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                "refs/tags/0.2",
+            ]
+        ),
     ]
 
     assert '__version__ = "0.2"' in (v.path_to_package / "__init__.py").read_text()
@@ -283,11 +316,19 @@ def test_commit_version_tag_toml(tmp_another_package, monkeypatch):
     )
 
     assert mock.call_args_list == [
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", "app release 0.2"]),
+        _call(["git", "commit", "-m", "app release 0.2", "--", *ANOTHER_PACKAGE_FILES]),
         _call(["git", "tag", "-a", "0.2", "-m", "app release 0.2"]),
-        _call(["git", "push", "origin", "0.2", "--no-verify"]),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                "refs/tags/0.2",
+            ]
+        ),
     ]
 
     assert '__version__ = "0.2"' in (v.path_to_package / "_version.py").read_text()
@@ -381,6 +422,33 @@ def test_add_changelog_new_dev_section_rst_toml(tmp_another_package):
     )
 
 
+def test_set_version_only_replaces_assignment(tmp_package_name):
+    Path("src", "package_name", "__init__.py").write_text(
+        '# 0.1dev is the first version\n__version__ = "0.1dev"\nPREVIOUS = "0.1dev"\n'
+    )
+
+    Versioner.load().set_version("0.1.0")
+
+    assert Path("src", "package_name", "__init__.py").read_text() == (
+        '# 0.1dev is the first version\n__version__ = "0.1.0"\nPREVIOUS = "0.1dev"\n'
+    )
+
+
+def test_update_changelog_release_rst_only_replaces_header(tmp_package_name):
+    Path("CHANGELOG.md").unlink()
+    Path("CHANGELOG.rst").write_text(
+        "CHANGELOG\n=========\n\n0.1dev\n------\n\n" "Fixes a bug\n\n0.1dev\n------\n"
+    )
+
+    v = Versioner.load()
+    v.update_changelog_release("0.1")
+    today = datetime.now().strftime("%Y-%m-%d")
+    assert v.path_to_changelog.read_text() == (
+        f"CHANGELOG\n=========\n\n0.1 ({today})\n----------------\n\n"
+        "Fixes a bug\n\n0.1dev\n------\n"
+    )
+
+
 @pytest.mark.parametrize(
     "submitted, stored, dev",
     [
@@ -402,15 +470,38 @@ def test_version(tmp_package_name, monkeypatch, submitted, stored, dev):
     assert mock.call_args_list == [
         _call(["git", "checkout", "main"]),
         _call(["git", "pull"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"package_name release {stored}"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"package_name release {stored}",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
         _call(["git", "tag", "-a", stored, "-m", f"package_name release {stored}"]),
-        _call(["git", "push", "origin", stored, "--no-verify"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"Bumps up package_name to version {dev}"]),
-        _call(["git", "push", "--no-verify"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"Bumps up package_name to version {dev}",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                f"refs/tags/{stored}",
+            ]
+        ),
     ]
 
     today = datetime.now().strftime("%Y-%m-%d")
@@ -435,13 +526,27 @@ def test_version_no_push(tmp_package_name, monkeypatch):
     assert mock.call_args_list == [
         _call(["git", "checkout", "main"]),
         _call(["git", "pull"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"package_name release {stored}"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"package_name release {stored}",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
         _call(["git", "tag", "-a", stored, "-m", f"package_name release {stored}"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"Bumps up package_name to version {dev}"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"Bumps up package_name to version {dev}",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
     ]
 
     today = datetime.now().strftime("%Y-%m-%d")
@@ -464,15 +569,38 @@ def test_version_yes(tmp_package_name, monkeypatch):
     assert mock.call_args_list == [
         _call(["git", "checkout", "main"]),
         _call(["git", "pull"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"package_name release {stored}"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"package_name release {stored}",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
         _call(["git", "tag", "-a", stored, "-m", f"package_name release {stored}"]),
-        _call(["git", "push", "origin", stored, "--no-verify"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"Bumps up package_name to version {dev}"]),
-        _call(["git", "push", "--no-verify"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"Bumps up package_name to version {dev}",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                f"refs/tags/{stored}",
+            ]
+        ),
     ]
 
     today = datetime.now().strftime("%Y-%m-%d")
@@ -482,6 +610,106 @@ def test_version_yes(tmp_package_name, monkeypatch):
     )
 
 
+def test_version_plan(tmp_package_name, monkeypatch, capsys):
+    mock = Mock()
+    monkeypatch.setattr(versioneer, "call", mock)
+    monkeypatch.setattr(versioner, "call", mock)
+    monkeypatch.setattr(versioneer, "_input", Mock(side_effect=AssertionError))
+    changelog = Path("CHANGELOG.md").read_text()
+
+    versioneer.version(plan=True)
+
+    captured = capsys.readouterr()
+    out = captured.out
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    assert mock.call_args_list == []
+    assert out.startswith("--- a/")
+    assert "Releasing version: 0.1.0" in captured.err
+    assert Path("CHANGELOG.md").read_text() == changelog
+    assert '__version__ = "0.1dev"' in Path("src/package_name/__init__.py").read_text()
+    assert "--- a/CHANGELOG.md\n+++ b/CHANGELOG.md\n" in out
+    assert f"+## 0.1.0 ({today})\n" in out
+    assert '+__version__ = "0.1.0"\n' in out
+    assert '-__version__ = "0.1.0"\n+__version__ = "0.1.1dev"\n' in out
+
+    plan = json.loads(out[out.index("\n{") :])
+    assert plan == {
+        "current": "0.1dev",
+        "release": "0.1.0",
+        "dev": "0.1.1dev",
+        "commits": [
+            {
+                "message": "package_name release 0.1.0",
+                "tag": "0.1.0",
+                "files": ["CHANGELOG.md", "src/package_name/__init__.py"],
+            },
+            {
+                "message": "Bumps up package_name to version 0.1.1dev",
+                "tag": None,
+                "files": ["CHANGELOG.md", "src/package_name/__init__.py"],
+            },
+        ],
+    }
+
+
+def test_version_aborted_does_not_edit_files(tmp_package_name, monkeypatch):
+    mock = Mock()
+    monkeypatch.setattr(versioneer, "call", mock)
+    monkeypatch.setattr(versioner, "call", mock)
+    monkeypatch.setattr(versioneer, "_input", Mock(side_effect=["", "n"]))
+    changelog = Path("CHANGELOG.md").read_text()
+
+    with pytest.raises(SystemExit):
+        versioneer.version()
+
+    assert Path("CHANGELOG.md").read_text() == changelog
+    assert '__version__ = "0.1dev"' in Path("src/package_name/__init__.py").read_text()
+
+
+def test_patch_set_apply_is_atomic(tmp_empty, monkeypatch):
+    Path("a.txt").write_text("a")
+    Path("b.txt").write_text("b")
+
+    patches = PatchSet()
+    patches.write("a.txt", "new a")
+    patches.write("b.txt", "new b")
+
+    written = []
+    fdopen = os.fdopen
+
+    def fail_on_second(fd, mode):
+        if written:
+            raise OSError("disk full")
+
+        written.append(fd)
+        return fdopen(fd, mode)
+
+    monkeypatch.setattr(patch.os, "fdopen", fail_on_second)
+
+    with pytest.raises(OSError, match="disk full"):
+        patches.apply()
+
+    assert Path("a.txt").read_text() == "a"
+    assert Path("b.txt").read_text() == "b"
+    assert sorted(os.listdir()) == ["a.txt", "b.txt"]
+
+
+def test_patch_set_chained(tmp_empty):
+    Path("a.txt").write_text("one\n")
+
+    first = PatchSet()
+    first.write("a.txt", "two\n")
+    second = first.then()
+    second.write("a.txt", second.read("a.txt") + "three\n")
+
+    assert second.diff() == ("--- a/a.txt\n+++ b/a.txt\n@@ -1 +1,2 @@\n two\n+three\n")
+    assert first.apply() == ["a.txt"]
+    assert Path("a.txt").read_text() == "two\n"
+    assert second.apply() == ["a.txt"]
+    assert Path("a.txt").read_text() == "two\nthree\n"
+
+
 def test_version_target_stable(tmp_package_name, monkeypatch):
     mock = Mock()
     monkeypatch.setattr(versioneer, "call", mock)
@@ -494,11 +722,28 @@ def test_version_target_stable(tmp_package_name, monkeypatch):
     assert mock.call_args_list == [
         _call(["git", "checkout", "main"]),
         _call(["git", "pull"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"package_name release {stored}"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"package_name release {stored}",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
         _call(["git", "tag", "-a", stored, "-m", f"package_name release {stored}"]),
-        _call(["git", "push", "origin", stored, "--no-verify"]),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                f"refs/tags/{stored}",
+            ]
+        ),
     ]
 
     today = datetime.now().strftime("%Y-%m-%d")
@@ -529,15 +774,38 @@ def test_version_toml(tmp_another_package, monkeypatch, submitted, stored, dev):
     assert mock.call_args_list == [
         _call(["git", "checkout", "main"]),
         _call(["git", "pull"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"app release {stored}"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"app release {stored}",
+                "--",
+                *ANOTHER_PACKAGE_FILES,
+            ]
+        ),
         _call(["git", "tag", "-a", stored, "-m", f"app release {stored}"]),
-        _call(["git", "push", "origin", stored, "--no-verify"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"Bumps up app to version {dev}"]),
-        _call(["git", "push", "--no-verify"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"Bumps up app to version {dev}",
+                "--",
+                *ANOTHER_PACKAGE_FILES,
+            ]
+        ),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                f"refs/tags/{stored}",
+            ]
+        ),
     ]
 
     today = datetime.now().strftime("%Y-%m-%d")
@@ -570,15 +838,38 @@ def test_version_pre_release(tmp_package_name, monkeypatch, submitted, stored, d
     assert mock.call_args_list == [
         _call(["git", "checkout", "main"]),
         _call(["git", "pull"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"package_name release {stored}"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"package_name release {stored}",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
         _call(["git", "tag", "-a", stored, "-m", f"package_name release {stored}"]),
-        _call(["git", "push", "origin", stored, "--no-verify"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"Bumps up package_name to version {dev}"]),
-        _call(["git", "push", "--no-verify"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"Bumps up package_name to version {dev}",
+                "--",
+                *PACKAGE_NAME_FILES,
+            ]
+        ),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                f"refs/tags/{stored}",
+            ]
+        ),
     ]
 
     # changelog must not change
@@ -631,15 +922,38 @@ def test_version_pre_release_toml(
     assert mock.call_args_list == [
         _call(["git", "checkout", "main"]),
         _call(["git", "pull"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"app release {stored}"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"app release {stored}",
+                "--",
+                *ANOTHER_PACKAGE_FILES,
+            ]
+        ),
         _call(["git", "tag", "-a", stored, "-m", f"app release {stored}"]),
-        _call(["git", "push", "origin", stored, "--no-verify"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", f"Bumps up app to version {dev}"]),
-        _call(["git", "push", "--no-verify"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                f"Bumps up app to version {dev}",
+                "--",
+                *ANOTHER_PACKAGE_FILES,
+            ]
+        ),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                f"refs/tags/{stored}",
+            ]
+        ),
     ]
 
     # changelog must not change
@@ -670,15 +984,38 @@ def test_version_with_no_changelog(tmp_package_name, monkeypatch, capsys):
     assert mock.call_args_list == [
         _call(["git", "checkout", "main"]),
         _call(["git", "pull"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", "package_name release 0.1.0"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                "package_name release 0.1.0",
+                "--",
+                PACKAGE_NAME_VERSION_FILE,
+            ]
+        ),
         _call(["git", "tag", "-a", "0.1.0", "-m", "package_name release 0.1.0"]),
-        _call(["git", "push", "origin", "0.1.0", "--no-verify"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", "Bumps up package_name to version 0.1.1dev"]),
-        _call(["git", "push", "--no-verify"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                "Bumps up package_name to version 0.1.1dev",
+                "--",
+                PACKAGE_NAME_VERSION_FILE,
+            ]
+        ),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                "refs/tags/0.1.0",
+            ]
+        ),
     ]
 
 
@@ -703,15 +1040,29 @@ def test_version_with_no_changelog_toml(tmp_another_package, monkeypatch, capsys
     assert mock.call_args_list == [
         _call(["git", "checkout", "main"]),
         _call(["git", "pull"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", "app release 0.1.0"]),
+        _call(["git", "commit", "-m", "app release 0.1.0", "--", ANOTHER_VERSION_FILE]),
         _call(["git", "tag", "-a", "0.1.0", "-m", "app release 0.1.0"]),
-        _call(["git", "push", "origin", "0.1.0", "--no-verify"]),
-        _call(["git", "add", "--all"]),
-        _call(["git", "status"]),
-        _call(["git", "commit", "-m", "Bumps up app to version 0.1.1dev"]),
-        _call(["git", "push", "--no-verify"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                "Bumps up app to version 0.1.1dev",
+                "--",
+                ANOTHER_VERSION_FILE,
+            ]
+        ),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                "refs/tags/0.1.0",
+            ]
+        ),
     ]
 
 
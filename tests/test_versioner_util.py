@@ -1,9 +1,11 @@
 import pytest
 
 from pkgmt.versioner.util import (
+    Version,
     _split_prerelease_part,
     complete_version_string,
     is_major_version,
+    is_pre_release,
 )
 
 
@@ -31,6 +33,7 @@ def test_split_prerelease_part(version, version_part, prerelease_part):
         ["1a1", "1.0.0a1"],
         ["1.0b10", "1.0.0b10"],
         ["2.5.4rc2", "2.5.4rc2"],
+        ["0.1dev", "0.1.0dev"],
     ],
 )
 def test_complete_version_string(version, expected):
@@ -54,3 +57,110 @@ def test_complete_version_string(version, expected):
 )
 def test_is_major_version(version, expected):
     assert is_major_version(version) is expected
+
+
+@pytest.mark.parametrize(
+    "version, expected",
+    [
+        ["1.0a1", True],
+        ["1.0b2", True],
+        ["1.0rc1", True],
+        ["1.0", False],
+        ["1.0dev", False],
+        ["1.0.post1", False],
+    ],
+)
+def test_is_pre_release(version, expected):
+    assert is_pre_release(version) is expected
+
+
+@pytest.mark.parametrize(
+    "version, release, pre, post, dev",
+    [
+        ["0.1dev", (0, 1), None, None, 0],
+        ["1.2.3", (1, 2, 3), None, None, None],
+        ["1.0b1", (1, 0), ("b", 1), None, None],
+        ["1.0-beta.2", (1, 0), ("b", 2), None, None],
+        ["1.0c1", (1, 0), ("rc", 1), None, None],
+        ["1.0.post2", (1, 0), None, 2, None],
+        ["1.0-1", (1, 0), None, 1, None],
+        ["1.0rc1.dev3", (1, 0), ("rc", 1), None, 3],
+    ],
+)
+def test_version_parse(version, release, pre, post, dev):
+    parsed = Version.parse(version)
+
+    assert (parsed.release, parsed.pre, parsed.post, parsed.dev) == (
+        release,
+        pre,
+        post,
+        dev,
+    )
+    assert str(parsed) == version
+
+
+def test_version_parse_is_cached():
+    assert Version.parse("1.2.3") is Version.parse("1.2.3")
+
+
+@pytest.mark.parametrize("version", ["", "hello", "1.0-", "v"])
+def test_version_parse_invalid(version):
+    with pytest.raises(ValueError, match="Invalid version"):
+        Version.parse(version)
+
+
+def test_version_ordering():
+    versions = [
+        "1.0.post1",
+        "1.0",
+        "1.0rc1",
+        "1.0b2",
+        "1.0b1",
+        "1.0a1",
+        "1.0dev",
+        "0.9.1",
+    ]
+
+    assert [str(v) for v in sorted(Version.parse(v) for v in versions)] == list(
+        reversed(versions)
+    )
+    assert Version.parse("1.0") == Version.parse("1.0.0")
+    assert len({Version.parse("1.0"), Version.parse("1.0.0")}) == 1
+
+
+def test_version_is_not_equal_to_strings():
+    assert Version.parse("1.0") != "1.0"
+    assert Version.parse("1.0") != "latest"
+    assert "1.0" not in {Version.parse("1.0")}
+
+    with pytest.raises(TypeError):
+        Version.parse("0.10") > "0.9"
+
+
+@pytest.mark.parametrize(
+    "version, part, expected",
+    [
+        ["1.2.3", "major", "2.0.0"],
+        ["1.2.3", "minor", "1.3.0"],
+        ["1.2.3", "patch", "1.2.4"],
+        ["0.8", "patch", "0.8.1"],
+        ["1.2.3.4", "patch", "1.2.4.0"],
+        ["1.2.3.4", "minor", "1.3.0.0"],
+        ["1.2.3b1", "patch", "1.2.4"],
+        ["1.0b1", "pre", "1.0b2"],
+        ["1.0", "post", "1.0.post1"],
+        ["1.0.post1", "post", "1.0.post2"],
+        ["0.1.1", "dev", "0.1.1dev"],
+        ["0.1.1dev", "dev", "0.1.1dev1"],
+    ],
+)
+def test_version_bump(version, part, expected):
+    assert str(Version.parse(version).bump(part)) == expected
+
+
+def test_version_bump_invalid():
+    with pytest.raises(ValueError, match="is not a pre-release"):
+        Version.parse("1.0").bump("pre")
+
+    with pytest.raises(ValueError, match="Invalid part"):
+        Version.parse("1.0").bump("something")
@@ -0,0 +1,226 @@
+import shutil
+import subprocess
+from pathlib import Path
+from unittest.mock import Mock, _Call
+
+import click
+import pytest
+
+from pkgmt import workspace, versioneer
+from pkgmt.versioner import versioner
+
+
+def _call(arg):
+    return _Call(((arg,), {}))
+
+
+def _git(*args):
+    subprocess.run(["git", *args], check=True, capture_output=True)
+
+
+def _make_package(
+    path, name, dependencies=(), changelog="* [Fix] Fixes #1", pkgmt=True
+):
+    module = name.replace("-", "_")
+    Path(path, "src", module).mkdir(parents=True)
+    Path(path, "src", module, "__init__.py").write_text('__version__ = "0.1dev"\n')
+    Path(path, "CHANGELOG.md").write_text(f"# CHANGELOG\n\n## 0.1dev\n\n{changelog}\n")
+    deps = ", ".join(f'"{dep}"' for dep in dependencies)
+    Path(path, "pyproject.toml").write_text(
+        f'[project]\nname = "{name}"\ndependencies = [{deps}]\n'
+        + ('\n[tool.pkgmt]\ngithub = "ploomber/monorepo"\n' if pkgmt else "")
+    )
+
+
+@pytest.fixture
+def tmp_monorepo(tmp_empty):
+    Path("pyproject.toml").write_text(
+        '[tool.pkgmt]\ngithub = "ploomber/monorepo"\n\n'
+        '[tool.pkgmt.workspace]\nmembers = ["packages/*"]\n'
+    )
+    _make_package("packages/app", "pkg-app", dependencies=["pkg-core>=0.1", "click"])
+    _make_package("packages/core", "pkg_core")
+
+    _git("init")
+    _git("config", "commit.gpgsign", "false")
+    _git("config", "user.email", "ci@ploomberio")
+    _git("config", "user.name", "Ploomber")
+    _git("add", "--all")
+    _git("commit", "-m", "first commit")
+
+    yield
+
+
+def test_discover(tmp_monorepo):
+    packages = workspace.discover()
+
+    assert [(p.name, p.path) for p in packages] == [
+        ("pkg-app", Path("packages/app")),
+        ("pkg-core", Path("packages/core")),
+    ]
+    assert [p.dependencies for p in packages] == [{"pkg-core"}, set()]
+
+
+def test_discover_without_members_uses_tracked_projects(tmp_monorepo):
+    Path("pyproject.toml").write_text('[tool.pkgmt]\ngithub = "ploomber/monorepo"\n')
+    # not tracked by git
+    _make_package("packages/other", "pkg-other")
+
+    assert [p.name for p in workspace.discover()] == ["pkg-app", "pkg-core"]
+
+
+def test_discover_duplicated_names(tmp_monorepo):
+    _make_package("packages/another", "pkg-core")
+
+    with pytest.raises(click.ClickException, match="two packages named 'pkg-core'"):
+        workspace.discover()
+
+
+def test_release_order(tmp_monorepo):
+    packages = workspace.release_order(workspace.discover())
+    assert [p.name for p in packages] == ["pkg-core", "pkg-app"]
+
+
+def test_release_order_cycle():
+    first = workspace.Package("first", "first", requires=["second"])
+    second = workspace.Package("second", "second", requires=["first"])
+    first.dependencies, second.dependencies = {"second"}, {"first"}
+
+    with pytest.raises(click.ClickException, match="dependency cycle"):
+        workspace.release_order([first, second])
+
+
+def test_changed(tmp_monorepo):
+    packages = workspace.discover()
+
+    # never released
+    assert [p.name for p in workspace.changed(packages)] == ["pkg-app", "pkg-core"]
+
+    Path("packages/core/src/pkg_core/__init__.py").write_text(
+        '__version__ = "0.1.1dev"\n'
+    )
+    _git("commit", "-am", "Bumps up pkg_core to version 0.1.1dev")
+
+    assert [p.name for p in workspace.changed(packages)] == ["pkg-app"]
+
+    Path("packages/core/src/pkg_core/module.py").write_text("")
+    _git("add", "--all")
+    _git("commit", "-m", "adds module")
+
+    assert [p.name for p in workspace.changed(packages)] == ["pkg-app", "pkg-core"]
+
+
+def test_check_reports_every_package(tmp_monorepo):
+    _make_package("packages/broken", "pkg-broken", changelog="* Missing prefix")
+    _make_package("packages/another", "pkg-another", changelog="* Missing prefix")
+
+    with pytest.raises(click.ClickException) as excinfo:
+        workspace.check(workspace.discover(), max_workers=2)
+
+    message = excinfo.value.message
+    assert message.startswith("Found errors in 2 package(s)")
+    assert "- packages/another: " in message
+    assert "- packages/broken: " in message
+
+
+def test_check_reports_unexpected_errors(tmp_monorepo):
+    _make_package("packages/broken", "pkg-broken", changelog="* Missing prefix")
+    _make_package("packages/another", "pkg-another")
+    shutil.rmtree("packages/another/src")
+
+    with pytest.raises(click.ClickException) as excinfo:
+        workspace.check(workspace.discover(), max_workers=2)
+
+    message = excinfo.value.message
+    assert message.startswith("Found errors in 2 package(s)")
+    assert "- packages/another: NotADirectoryError: " in message
+    assert "- packages/broken: " in message
+
+
+def test_version_all(tmp_monorepo, monkeypatch):
+    mock = Mock()
+    monkeypatch.setattr(versioneer, "call", mock)
+    monkeypatch.setattr(versioner, "call", mock)
+
+    versioneer.version_all(yes=True)
+
+    core = ["packages/core/src/pkg_core/__init__.py", "packages/core/CHANGELOG.md"]
+    app = ["packages/app/src/pkg_app/__init__.py", "packages/app/CHANGELOG.md"]
+
+    assert mock.call_args_list == [
+        _call(["git", "checkout", "main"]),
+        _call(["git", "pull"]),
+        _call(["git", "commit", "-m", "pkg_core release 0.1.0", "--", *core]),
+        _call(["git", "tag", "-a", "pkg_core-0.1.0", "-m", "pkg_core release 0.1.0"]),
+        _call(
+            [
+                "git",
+                "commit",
+                "-m",
+                "Bumps up pkg_core to version 0.1.1dev",
+                "--",
+                *core,
+            ]
+        ),
+        _call(["git", "commit", "-m", "pkg_app release 0.1.0", "--", *app]),
+        _call(["git", "tag", "-a", "pkg_app-0.1.0", "-m", "pkg_app release 0.1.0"]),
+        _call(
+            ["git", "commit", "-m", "Bumps up pkg_app to version 0.1.1dev", "--", *app]
+        ),
+        _call(
+            [
+                "git",
+                "push",
+                "--atomic",
+                "--no-verify",
+                "origin",
+                "HEAD",
+                "refs/tags/pkg_core-0.1.0",
+                "refs/tags/pkg_app-0.1.0",
+            ]
+        ),
+    ]
+
+    assert Path("packages/app/src/pkg_app/__init__.py").read_text() == (
+        '__version__ = "0.1.1dev"\n'
+    )
+    assert "[#1](https://github.com/ploomber/monorepo/issues/1)" in (
+        Path("packages/core/CHANGELOG.md").read_text()
+    )
+
+
+def test_version_all_uses_workspace_config(tmp_monorepo, monkeypatch):
+    Path("pyproject.toml").write_text(
+        '[tool.pkgmt]\ngithub = "ploomber/root"\n\n'
+        '[tool.pkgmt.workspace]\nmembers = ["packages/*"]\n'
+    )
+    # no [tool.pkgmt] section
+    _make_package("packages/other", "pkg-other", pkgmt=False)
+    _git("add", "--all")
+    _git("commit", "-m", "adds pkg-other")
+    monkeypatch.setattr(versioneer, "call", Mock())
+    monkeypatch.setattr(versioner, "call", Mock())
+
+    versioneer.version_all(yes=True)
+
+    assert "[#1](https://github.com/ploomber/root/issues/1)" in (
+        Path("packages/other/CHANGELOG.md").read_text()
+    )
+    # packages with their own value keep it
+    assert "[#1](https://github.com/ploomber/monorepo/issues/1)" in (
+        Path("packages/core/CHANGELOG.md").read_text()
+    )
+
+
+def test_version_all_without_github(tmp_monorepo, monkeypatch):
+    Path("pyproject.toml").write_text(
+        '[tool.pkgmt.workspace]\nmembers = ["packages/other"]\n'
+    )
+    _make_package("packages/other", "pkg-other", pkgmt=False)
+    _git("add", "--all")
+    _git("commit", "-m", "adds pkg-other")
+    monkeypatch.setattr(versioneer, "call", Mock())
+    monkeypatch.setattr(versioner, "call", Mock())
+
+    with pytest.raises(click.ClickException, match="Missing key : 'github'"):
+        versioneer.version_all(yes=True)